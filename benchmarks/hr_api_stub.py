@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+HR API stand-in for benchmarking the sync tools
+Serves the endpoints python_sync_tool.py and replit_sync_tool.py call, backed by
+terminals from zk_simulator.py instead of PostgreSQL:
+
+    GET  /api/database/status
+    GET  /api/biometric-devices
+    GET  /api/employees                              (employeeId 1..--employees, like the simulator's users)
+    POST /api/auto-sync/device/{deviceId}            (pulls the device, honours since/count)
+    POST /api/auto-sync/device/{deviceId}/punches
+    POST /api/auto-sync/punches/bulk                 (gzip columnar-v1)
+    POST /api/auto-sync/daily-records/bulk           (gzip daily-v1, from the 'reprocess' command)
+    GET  /api/stub/stats                             (counters for sync_benchmark.py)
+
+Usage:
+    python3 hr_api_stub.py --devices 50 --device-port 4370 --port 3000
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+try:
+    from zk import ZK
+    from zk import const as zk_const
+except ImportError:  # only needed for POST /api/auto-sync/device/{deviceId}
+    ZK = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ATTLOG_RECORD = struct.Struct('<H24sB4sB8s')  # the 40-byte records zk_simulator.py serves
+
+
+def decode_time(value: int) -> datetime:
+    """Device timestamp decoding (zkemsdk.c DecodeTime)"""
+    second = value % 60
+    value //= 60
+    minute = value % 60
+    value //= 60
+    hour = value % 24
+    value //= 24
+    day = value % 31 + 1
+    value //= 31
+    month = value % 12 + 1
+    value //= 12
+    return datetime(value + 2000, month, day, hour, minute, second)
+
+
+def to_iso_utc(value: datetime) -> str:
+    """Naive local time -> the toISOString() form the real server returns"""
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.') + f"{value.microsecond // 1000:03d}Z"
+
+
+def attendance_rows(punches) -> int:
+    """Attendance rows a batch would produce: one per employee per day"""
+    return len({(uid, str(timestamp)[:10]) for uid, timestamp in punches})
+
+
+class DeviceBackend:
+    """Device registry plus one cached pyzk connection per device, like zkDeviceManager"""
+
+    def __init__(self, devices: int, device_host: str, device_port: int, timeout: int = 10, employees: int = 200):
+        self.devices = [
+            {
+                'id': i + 1,
+                'deviceId': f"SIM-{i + 1:03d}",
+                'deviceName': f"Simulated Gate {i + 1}",
+                'location': f"Gate {i + 1}",
+                'ip': device_host,
+                'port': device_port + i,
+                'isActive': True,
+            }
+            for i in range(devices)
+        ]
+        self.by_id = {device['deviceId']: device for device in self.devices}
+        self.employees = [
+            {'id': f"EMP-{i + 1:05d}", 'employeeId': str(i + 1), 'fullName': f"Employee {i + 1}", 'biometricDeviceId': None}
+            for i in range(employees)
+        ]
+        self.timeout = timeout
+        self._connections = {}
+        self._locks = {device_id: threading.Lock() for device_id in self.by_id}
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'device_pulls': 0, 'skipped_pulls': 0, 'raw_records': 0,
+                      'uploaded_punches': 0, 'bulk_requests': 0, 'bulk_bytes': 0, 'daily_records': 0}
+
+    def count(self, **increments):
+        with self.stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def _connection(self, device: Dict):
+        conn = self._connections.get(device['deviceId'])
+        if conn is None:
+            conn = ZK(device['ip'], port=device['port'], timeout=self.timeout, ommit_ping=True).connect()
+            self._connections[device['deviceId']] = conn
+        return conn
+
+    def _read_attendance(self, conn) -> List[tuple]:
+        """Download and decode the log; a linear parse so the stub is never the bottleneck"""
+        data, size = conn.read_with_buffer(zk_const.CMD_ATTLOG_RRQ)
+        if size < 4:
+            return []
+        records = []
+        body = data[4:]
+        for uid, user_id, _, timestamp, _, _ in ATTLOG_RECORD.iter_unpack(body[:len(body) - len(body) % ATTLOG_RECORD.size]):
+            records.append((user_id.split(b'\x00')[0].decode(errors='ignore') or str(uid),
+                            decode_time(struct.unpack('<I', timestamp)[0])))
+        return records
+
+    def pull(self, device_id: str, since: Optional[datetime], known_count: Optional[int]) -> Dict:
+        """Mirror of POST /api/auto-sync/device/:deviceId in server/routes.ts"""
+        device = self.by_id[device_id]
+        with self._locks[device_id]:
+            try:
+                conn = self._connection(device)
+                conn.read_sizes()
+                total = conn.records
+                if since and total == known_count:
+                    self.count(skipped_pulls=1)
+                    return {'success': True, 'message': f"Device {device_id} has no new punches", 'rawRecords': 0,
+                            'processedRecords': 0, 'deviceId': device_id, 'totalRecords': total,
+                            'lastTimestamp': to_iso_utc(since)}
+                records = self._read_attendance(conn)
+            except Exception:
+                self._connections.pop(device_id, None)
+                raise
+
+        if since:
+            records = [record for record in records if record[1] > since]
+        last = max((timestamp for _, timestamp in records), default=since)
+        self.count(device_pulls=1, raw_records=len(records))
+        return {'success': True, 'message': f"Device {device_id} sync completed", 'rawRecords': len(records),
+                'processedRecords': attendance_rows(records), 'deviceId': device_id, 'totalRecords': total,
+                'lastTimestamp': to_iso_utc(last) if last else None}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like Express
+    backend: DeviceBackend = None
+    delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, body, status: int = 200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        self.backend.count(bulk_bytes=len(raw) if self.path.startswith('/api/auto-sync/punches/bulk') else 0)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            raw = gzip.decompress(raw)
+        return json.loads(raw or b'{}')
+
+    def do_GET(self):
+        self.backend.count(requests=1)
+        path = urlparse(self.path).path
+        if path == '/api/database/status':
+            return self._json({'status': 'connected'})
+        if path == '/api/biometric-devices':
+            return self._json(self.backend.devices)
+        if path == '/api/employees':
+            return self._json(self.backend.employees)
+        if path == '/api/stub/stats':
+            with self.backend.stats_lock:
+                return self._json(dict(self.backend.stats))
+        self._json({'message': 'Not found'}, 404)
+
+    def do_POST(self):
+        self.backend.count(requests=1)
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if self.delay:
+            time.sleep(self.delay)
+
+        try:
+            if url.path == '/api/auto-sync/punches/bulk':
+                return self._bulk(self._body())
+            if url.path == '/api/auto-sync/daily-records/bulk':
+                return self._daily_records(self._body())
+            if parts[:3] == ['api', 'auto-sync', 'device'] and len(parts) >= 4:
+                device_id = parts[3]
+                if device_id not in self.backend.by_id:
+                    return self._json({'success': False, 'message': f"Device {device_id} not found"}, 404)
+                if len(parts) == 5 and parts[4] == 'punches':
+                    punches = self._body().get('punches', [])
+                    self.backend.count(uploaded_punches=len(punches))
+                    return self._json({'success': True, 'message': f"Device {device_id} punches saved",
+                                       'rawRecords': len(punches), 'deviceId': device_id,
+                                       'processedRecords': attendance_rows((p['uid'], p['timestamp']) for p in punches)})
+                if len(parts) == 4:
+                    return self._pull(device_id, parse_qs(url.query))
+        except Exception as e:
+            logger.error(f"{self.command} {url.path} failed: {e}")
+            return self._json({'success': False, 'message': f"Manual sync failed: {e}"}, 500)
+        self._json({'message': 'Not found'}, 404)
+
+    def _pull(self, device_id: str, query: Dict):
+        if ZK is None:
+            return self._json({'success': False, 'message': 'pyzk is not installed on the stub host'}, 500)
+        since = None
+        if query.get('since'):
+            since = datetime.fromisoformat(query['since'][0].replace('Z', '+00:00')).astimezone().replace(tzinfo=None)
+        known_count = int(query['count'][0]) if query.get('count') else None
+        self._json(self.backend.pull(device_id, since, known_count))
+
+    def _bulk(self, body: Dict):
+        punches = []
+        device_results = {}
+        unknown = []
+        for device in body.get('devices', []):
+            if device['deviceId'] not in self.backend.by_id:
+                unknown.append(device['deviceId'])
+                continue
+            punches.extend(zip(device['uid'], device['timestamp']))
+            device_results[device['deviceId']] = device_results.get(device['deviceId'], 0) + len(device['uid'])
+        self.backend.count(bulk_requests=1, uploaded_punches=len(punches))
+        self._json({'success': True, 'message': f"Bulk upload saved {len(punches)} punches",
+                    'rawRecords': len(punches), 'processedRecords': attendance_rows(punches),
+                    'deviceResults': device_results, 'unknownDevices': unknown})
+
+    def _daily_records(self, body: Dict):
+        known = {employee['employeeId'] for employee in self.backend.employees}
+        mapped = sum(1 for uid in body.get('uid', []) if str(uid) in known)
+        unmapped = sorted({str(uid) for uid in body.get('uid', []) if str(uid) not in known})
+        self.backend.count(daily_records=mapped)
+        self._json({'success': True, 'message': f"Saved {mapped} daily records",
+                    'processedRecords': mapped, 'unmappedUids': unmapped})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HR API stand-in backed by zk_simulator.py terminals")
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--devices', type=int, default=1, help="number of simulated terminals to list")
+    parser.add_argument('--device-host', default='127.0.0.1')
+    parser.add_argument('--device-port', type=int, default=4370, help="port of the first simulated terminal")
+    parser.add_argument('--employees', type=int, default=200, help="employees to list (match zk_simulator.py --users)")
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds added to every POST (database time)")
+    args = parser.parse_args()
+
+    StubHandler.backend = DeviceBackend(args.devices, args.device_host, args.device_port, employees=args.employees)
+    StubHandler.delay = args.delay
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    logger.info(f"HR API stub on http://{args.host}:{args.port} with {args.devices} devices "
+                f"at {args.device_host}:{args.device_port}+")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("HR API stub stopped")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
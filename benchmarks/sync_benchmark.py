@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+End-to-end sync throughput benchmark
+Starts zk_simulator.py and hr_api_stub.py, runs AttendanceSyncTool cycles
+against them and reports, per scenario:
+
+    cold s        duration of the first (full download) cycle
+    punches/s     raw punches moved by the first cycle per second
+    cycles/min    steady-state cycles once every watermark is current
+    peak RSS      of the sync tool, and of the API stub (where the api-mode work happens)
+
+Usage:
+    python3 sync_benchmark.py                                   # full preset
+    python3 sync_benchmark.py --preset ci --json results.json
+    python3 sync_benchmark.py --devices 1,50 --records 10000 --mode direct
+    python3 sync_benchmark.py --preset ci --baseline results.json --max-regression 0.25
+"""
+
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+# (devices, records per device)
+PRESETS = {
+    'ci': [(1, 10000), (50, 10000), (1, 100000)],
+    'full': [(1, 10000), (50, 10000), (500, 10000), (1, 100000), (1, 1000000)],
+}
+
+
+def wait_for_port(host: str, port: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def peak_rss_mb(pid: int) -> float:
+    """High-water RSS of a child process (Linux /proc)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def run_worker(config: Dict) -> Dict:
+    """Runs inside a fresh process so peak RSS belongs to one scenario only"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = config['devices'] * 2 + 256
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed if hard == resource.RLIM_INFINITY else min(needed, hard), hard))
+
+    os.chdir(config['workdir'])  # the tool writes its log, state and spool to the cwd
+    sys.path.insert(0, REPO_ROOT)
+    import logging
+    import python_sync_tool
+
+    logging.getLogger().setLevel(logging.WARNING)
+    tool = python_sync_tool.AttendanceSyncTool(
+        base_url=config['api_url'], sync_interval=0, max_workers=config['concurrency'],
+        sync_mode=config['mode'], zk_timeout=config['zk_timeout'],
+        state_file=os.path.join(config['workdir'], 'sync_state.json'),
+        spool_file=os.path.join(config['workdir'], 'punch_spool.db')
+    )
+
+    cycles = []
+    try:
+        for _ in range(config['cycles']):
+            tool.cycle_count += 1
+            started = time.monotonic()
+            results = tool.sync_all_devices()
+            cycles.append({
+                'seconds': time.monotonic() - started,
+                'raw_records': results.get('total_raw_records', 0),
+                'processed_records': results.get('total_processed_records', 0),
+                'successful': results.get('successful_syncs', 0),
+                'failed': results.get('failed_syncs', 0),
+            })
+    finally:
+        if tool.zk_pool:
+            tool.zk_pool.close_all()
+        if tool.spool:
+            tool.spool.close()
+
+    return {'cycles': cycles, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def run_scenario(mode: str, devices: int, records: int, args) -> Dict:
+    name = f"{mode}/{devices}x{records}"
+    print(f"▶ {name}", flush=True)
+    simulator = stub = None
+    with tempfile.TemporaryDirectory(prefix='sync-bench-') as workdir:
+        try:
+            simulator = subprocess.Popen(
+                [sys.executable, os.path.join(BENCH_DIR, 'zk_simulator.py'), '--devices', str(devices),
+                 '--base-port', str(args.device_port), '--records', str(records), '--users', str(args.users),
+                 '--latency', str(args.device_latency), '--bandwidth', str(args.bandwidth)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            stub = subprocess.Popen(
+                [sys.executable, os.path.join(BENCH_DIR, 'hr_api_stub.py'), '--port', str(args.api_port),
+                 '--devices', str(devices), '--device-port', str(args.device_port), '--delay', str(args.api_delay)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            if not wait_for_port('127.0.0.1', args.device_port + devices - 1, args.startup_timeout):
+                raise RuntimeError("simulator did not start")
+            if not wait_for_port('127.0.0.1', args.api_port, args.startup_timeout):
+                raise RuntimeError("API stub did not start")
+
+            config = {
+                'mode': mode, 'devices': devices, 'cycles': args.cycles, 'concurrency': args.concurrency,
+                'zk_timeout': args.zk_timeout, 'workdir': workdir, 'api_url': f"http://127.0.0.1:{args.api_port}",
+            }
+            worker = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', json.dumps(config)],
+                                    capture_output=True, text=True)
+            if worker.returncode != 0:
+                raise RuntimeError(worker.stderr.strip().splitlines()[-1] if worker.stderr.strip() else "worker failed")
+            measured = json.loads(worker.stdout.strip().splitlines()[-1])
+            stub_stats = requests.get(f"http://127.0.0.1:{args.api_port}/api/stub/stats", timeout=10).json()
+            stub_rss = peak_rss_mb(stub.pid)
+        finally:
+            for process in (stub, simulator):
+                if process:
+                    process.terminate()
+                    process.wait()
+
+    cycles = measured['cycles']
+    cold = cycles[0]
+    steady = cycles[1:]
+    steady_seconds = sum(c['seconds'] for c in steady) / len(steady) if steady else 0
+    return {
+        'scenario': name,
+        'mode': mode,
+        'devices': devices,
+        'records': records,
+        'cold_seconds': round(cold['seconds'], 3),
+        'punches_per_second': round(cold['raw_records'] / cold['seconds'], 1) if cold['seconds'] else 0,
+        'steady_seconds': round(steady_seconds, 3),
+        'cycles_per_minute': round(60 / steady_seconds, 1) if steady_seconds else 0,
+        'raw_records': cold['raw_records'],
+        'failed_syncs': sum(c['failed'] for c in cycles),
+        'tool_peak_rss_mb': round(measured['peak_rss_mb'], 1),
+        'stub_peak_rss_mb': round(stub_rss, 1),
+        'bulk_bytes': stub_stats.get('bulk_bytes', 0),
+    }
+
+
+def print_table(results: List[Dict]):
+    header = f"{'scenario':<22} {'cold s':>8} {'punches/s':>11} {'steady s':>9} {'cycles/min':>11} {'tool MB':>8} {'stub MB':>8} {'failed':>7}"
+    print()
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        if 'error' in r:
+            print(f"{r['scenario']:<22} error: {r['error']}")
+            continue
+        print(f"{r['scenario']:<22} {r['cold_seconds']:>8.2f} {r['punches_per_second']:>11.0f} {r['steady_seconds']:>9.3f} "
+              f"{r['cycles_per_minute']:>11.1f} {r['tool_peak_rss_mb']:>8.1f} {r['stub_peak_rss_mb']:>8.1f} {r['failed_syncs']:>7}")
+
+
+def find_regressions(results: List[Dict], baseline_path: str, max_regression: float) -> List[str]:
+    with open(baseline_path) as f:
+        baseline = {r['scenario']: r for r in json.load(f)['results'] if 'error' not in r}
+    regressions = []
+    for r in results:
+        base = baseline.get(r['scenario'])
+        if not base or 'error' in r:
+            continue
+        for metric in ('punches_per_second', 'cycles_per_minute'):
+            if base[metric] and r[metric] < base[metric] * (1 - max_regression):
+                regressions.append(f"{r['scenario']} {metric}: {r[metric]} vs baseline {base[metric]}")
+        if base['tool_peak_rss_mb'] and r['tool_peak_rss_mb'] > base['tool_peak_rss_mb'] * (1 + max_regression):
+            regressions.append(f"{r['scenario']} tool_peak_rss_mb: {r['tool_peak_rss_mb']} vs baseline {base['tool_peak_rss_mb']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AttendanceSyncTool against simulated terminals")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='full')
+    parser.add_argument('--devices', help="comma-separated device counts (overrides the preset)")
+    parser.add_argument('--records', help="comma-separated records per device (overrides the preset)")
+    parser.add_argument('--mode', default='api,direct', help="comma-separated sync modes: api, direct")
+    parser.add_argument('--cycles', type=int, default=3, help="cycles per scenario; the first is the cold sync")
+    parser.add_argument('--concurrency', type=int, default=16, help="SYNC_CONCURRENCY for the tool")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--device-port', type=int, default=14370)
+    parser.add_argument('--api-port', type=int, default=18370)
+    parser.add_argument('--device-latency', type=float, default=0.0, help="seconds added to every device reply")
+    parser.add_argument('--bandwidth', type=int, default=0, help="device download speed in bytes/s (0 = unlimited)")
+    parser.add_argument('--api-delay', type=float, default=0.0, help="seconds added to every API POST")
+    parser.add_argument('--zk-timeout', type=int, default=30)
+    parser.add_argument('--startup-timeout', type=float, default=180)
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="compare against a previous --json file")
+    parser.add_argument('--max-regression', type=float, default=0.2, help="allowed relative slowdown vs baseline")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return 0
+
+    if args.devices or args.records:
+        scenarios = [(int(d), int(r)) for d in (args.devices or '1').split(',') for r in (args.records or '10000').split(',')]
+    else:
+        scenarios = PRESETS[args.preset]
+    modes = [mode.strip() for mode in args.mode.split(',') if mode.strip()]
+
+    results = []
+    for mode in modes:
+        for devices, records in scenarios:
+            try:
+                results.append(run_scenario(mode, devices, records, args))
+            except Exception as e:
+                results.append({'scenario': f"{mode}/{devices}x{records}", 'error': str(e)})
+
+    print_table(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'generated': time.strftime('%Y-%m-%dT%H:%M:%S'), 'concurrency': args.concurrency,
+                       'cycles': args.cycles, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    failed = any('error' in r for r in results)
+    if args.baseline:
+        regressions = find_regressions(results, args.baseline, args.max_regression)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
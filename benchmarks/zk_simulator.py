@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+ZK Attendance Terminal Simulator
+Speaks enough of the ZKTeco TCP/UDP protocol for pyzk to connect, read the
+record counters, download users and attendance logs, clear the log and receive
+live punch events. Used with hr_api_stub.py and sync_benchmark.py to measure
+the sync tools without physical terminals.
+
+Usage:
+    python3 zk_simulator.py --devices 50 --records 10000
+    python3 zk_simulator.py --devices 1 --records 1000000 --base-port 4370 --udp
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import resource
+import struct
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Protocol constants (same values as zk/const.py)
+CMD_CONNECT = 1000
+CMD_EXIT = 1001
+CMD_ENABLEDEVICE = 1002
+CMD_DISABLEDEVICE = 1003
+CMD_REFRESHDATA = 1013
+CMD_GET_VERSION = 1100
+CMD_AUTH = 1102
+CMD_PREPARE_DATA = 1500
+CMD_DATA = 1501
+CMD_FREE_DATA = 1502
+CMD_PREPARE_BUFFER = 1503
+CMD_READ_BUFFER = 1504
+CMD_ACK_OK = 2000
+CMD_ACK_ERROR = 2001
+CMD_ACK_UNKNOWN = 0xffff
+CMD_USERTEMP_RRQ = 9
+CMD_OPTIONS_RRQ = 11
+CMD_OPTIONS_WRQ = 12
+CMD_ATTLOG_RRQ = 13
+CMD_CLEAR_ATTLOG = 15
+CMD_GET_FREE_SIZES = 50
+CMD_ENABLE_CLOCK = 57
+CMD_STARTVERIFY = 60
+CMD_CANCELCAPTURE = 62
+CMD_GET_PINWIDTH = 69
+CMD_GET_TIME = 201
+CMD_REG_EVENT = 500
+EF_ATTLOG = 1
+FCT_USER = 5
+USHRT_MAX = 65535
+MACHINE_PREPARE_DATA_1 = 20560
+MACHINE_PREPARE_DATA_2 = 32130
+
+# Commands that only need an acknowledgement
+ACK_ONLY = {
+    CMD_ENABLEDEVICE, CMD_DISABLEDEVICE, CMD_REFRESHDATA, CMD_OPTIONS_WRQ, CMD_ENABLE_CLOCK,
+    CMD_STARTVERIFY, CMD_CANCELCAPTURE, CMD_ACK_ERROR, CMD_ACK_UNKNOWN,
+}
+
+TCP_TOP = struct.Struct('<HHI')
+HEADER = struct.Struct('<4H')
+USER_RECORD = struct.Struct('<HB8s24sIx7sx24s')  # 72-byte ZK8 user
+ATTLOG_RECORD = struct.Struct('<H24sB4sB8s')  # 40-byte ZK8 attendance record
+LIVE_EVENT = struct.Struct('<24sBB6s20s')  # 52-byte realtime attendance event
+UDP_CHUNK = 1024
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def encode_time(t: datetime) -> int:
+    """Device timestamp encoding (zkemsdk.c EncodeTime)"""
+    return (
+        ((t.year % 100) * 12 * 31 + ((t.month - 1) * 31) + t.day - 1) * (24 * 60 * 60)
+        + (t.hour * 60 + t.minute) * 60 + t.second
+    )
+
+
+def checksum(packet: bytes) -> int:
+    """Packet checksum as computed by the terminal firmware"""
+    if len(packet) % 2:
+        packet += b'\x00'
+    total = sum(struct.unpack(f'<{len(packet) // 2}H', packet))
+    while total > USHRT_MAX:
+        total = (total & USHRT_MAX) + (total >> 16)
+    return ~total & USHRT_MAX
+
+
+def build_users(count: int) -> bytes:
+    """User table with uid 1..count and matching numeric user IDs"""
+    blob = bytearray(USER_RECORD.size * count)
+    for i in range(count):
+        user_id = str(i + 1).encode()
+        USER_RECORD.pack_into(blob, i * USER_RECORD.size, i + 1, 0, b'', f'Employee {i + 1}'.encode(), 0, b'1', user_id)
+    return bytes(blob)
+
+
+def build_attendance(count: int, users: int, seed: int, end: Optional[datetime] = None) -> bytes:
+    """
+    Synthetic attendance log: every user checks in around 08:00 and out around
+    17:00 on weekdays, going back as many days as needed to reach count records.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now()
+    per_day = max(1, users * 2)
+    weekdays_needed = -(-count // per_day)
+
+    days = []
+    day = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    while len(days) < weekdays_needed:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    days.reverse()
+
+    blob = bytearray(ATTLOG_RECORD.size * count)
+    offset = 0
+    written = 0
+    for day in days:
+        punches = []
+        for uid in range(1, users + 1):
+            punches.append((day + timedelta(minutes=480 + rng.randint(-45, 45), seconds=rng.randint(0, 59)), uid, 0))
+            punches.append((day + timedelta(minutes=1020 + rng.randint(-30, 90), seconds=rng.randint(0, 59)), uid, 1))
+        punches.sort()
+        for when, uid, status in punches:
+            if written == count:
+                break
+            ATTLOG_RECORD.pack_into(blob, offset, uid, str(uid).encode(), 1,
+                                    struct.pack('<I', encode_time(when)), status, b'')
+            offset += ATTLOG_RECORD.size
+            written += 1
+    return bytes(blob)
+
+
+class SimulatedDevice:
+    """One terminal: its user table, attendance log and live event subscribers"""
+
+    def __init__(self, index: int, port: int, users_blob: bytes, user_count: int, attlog_blob: bytes,
+                 latency: float = 0.0, bandwidth: int = 0, drop_rate: float = 0.0):
+        self.index = index
+        self.port = port
+        self.serial = f"SIM{index:05d}"
+        self.users_blob = users_blob
+        self.user_count = user_count
+        self.attlog_blob = attlog_blob  # shared between devices, never mutated
+        self.live_records = bytearray()  # punches generated while running
+        self.cleared = False
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.drop_rate = drop_rate
+        self.subscribers = set()  # sessions that registered for EF_ATTLOG events
+
+    @property
+    def record_count(self) -> int:
+        base = 0 if self.cleared else len(self.attlog_blob)
+        return (base + len(self.live_records)) // ATTLOG_RECORD.size
+
+    def read_buffer(self, command: int, fct: int) -> bytes:
+        """Payload of a buffered read: 4-byte total size followed by the records"""
+        if command == CMD_USERTEMP_RRQ and fct == FCT_USER:
+            body = self.users_blob
+        elif command == CMD_ATTLOG_RRQ:
+            body = (b'' if self.cleared else self.attlog_blob) + bytes(self.live_records)
+        else:
+            body = b''
+        return struct.pack('<I', len(body)) + body
+
+    def sizes(self) -> bytes:
+        fields = [0] * 20
+        fields[4] = self.user_count
+        fields[8] = self.record_count
+        fields[14] = 3000  # fingerprint capacity
+        fields[15] = 10000  # user capacity
+        fields[16] = 1000000  # record capacity
+        fields[17] = fields[14]
+        fields[18] = fields[15] - self.user_count
+        fields[19] = fields[16] - self.record_count
+        return struct.pack('<20i', *fields) + struct.pack('<3i', 0, 0, 0)
+
+    def option(self, key: bytes) -> bytes:
+        options = {
+            b'~SerialNumber': self.serial.encode(),
+            b'~Platform': b'ZLM60_TFT',
+            b'MAC': f'00:17:61:00:{self.index >> 8 & 0xff:02x}:{self.index & 0xff:02x}'.encode(),
+            b'~DeviceName': b'SIM-K40',
+            b'~ZKFPVersion': b'10',
+            b'ZKFaceVersion': b'0',
+            b'~ExtendFmt': b'0',
+            b'~UserExtFmt': b'0',
+            b'FaceFunOn': b'0',
+            b'CompatOldFirmware': b'0',
+            b'IPAddress': b'127.0.0.1',
+            b'NetMask': b'255.255.255.0',
+            b'GATEIPAddress': b'0.0.0.0',
+        }
+        return key + b'=' + options.get(key, b'') + b'\x00'
+
+    def clear_attendance(self):
+        self.cleared = True
+        self.live_records = bytearray()
+
+    def punch(self, rng: random.Random):
+        """Record a live punch and push it to every subscribed session"""
+        uid = rng.randint(1, max(1, self.user_count))
+        now = datetime.now().replace(microsecond=0)
+        status = 0 if now.hour < 12 else 1
+        self.live_records += ATTLOG_RECORD.pack(uid, str(uid).encode(), 1, struct.pack('<I', encode_time(now)),
+                                                status, b'')
+        timehex = bytes([now.year - 2000, now.month, now.day, now.hour, now.minute, now.second])
+        event = LIVE_EVENT.pack(str(uid).encode(), status, 1, timehex, b'')
+        for session in list(self.subscribers):
+            session.push_event(event)
+
+
+class Session:
+    """Protocol state for one client: a TCP connection or a UDP peer"""
+
+    def __init__(self, device: SimulatedDevice, send, tcp: bool):
+        self.device = device
+        self.send = send
+        self.tcp = tcp
+        self.session_id = random.randint(1, USHRT_MAX - 1)
+        self.buffer = b''
+        self.closed = False
+
+    def packet(self, command: int, reply_id: int, data: bytes = b'') -> bytes:
+        body = HEADER.pack(command, 0, self.session_id, reply_id) + data
+        body = HEADER.pack(command, checksum(body), self.session_id, reply_id) + data
+        if self.tcp:
+            return TCP_TOP.pack(MACHINE_PREPARE_DATA_1, MACHINE_PREPARE_DATA_2, len(body)) + body
+        return body
+
+    def push_event(self, event: bytes):
+        if not self.closed:
+            self.send(self.packet(CMD_REG_EVENT, 0, event))
+
+    def close(self):
+        self.closed = True
+        self.device.subscribers.discard(self)
+
+    async def handle(self, packet: bytes) -> bool:
+        """Answer one command; returns False when the client disconnected"""
+        command, _, _, reply_id = HEADER.unpack(packet[:8])
+        payload = packet[8:]
+        device = self.device
+
+        if command == CMD_ACK_OK:
+            return True  # client acknowledging a live event
+        if device.drop_rate and random.random() < device.drop_rate:
+            return False  # flaky link: drop the connection without answering
+        if device.latency:
+            await asyncio.sleep(device.latency)
+
+        if command == CMD_CONNECT or command == CMD_AUTH:
+            self.send(self.packet(CMD_ACK_OK, reply_id))
+        elif command == CMD_EXIT:
+            self.send(self.packet(CMD_ACK_OK, reply_id))
+            return False
+        elif command in ACK_ONLY:
+            self.send(self.packet(CMD_ACK_OK, reply_id))
+        elif command == CMD_REG_EVENT:
+            flags = struct.unpack('<I', payload[:4].ljust(4, b'\x00'))[0]
+            if flags & EF_ATTLOG:
+                device.subscribers.add(self)
+            else:
+                device.subscribers.discard(self)
+            self.send(self.packet(CMD_ACK_OK, reply_id))
+        elif command == CMD_GET_FREE_SIZES:
+            self.send(self.packet(CMD_ACK_OK, reply_id, device.sizes()))
+        elif command == CMD_GET_TIME:
+            self.send(self.packet(CMD_ACK_OK, reply_id, struct.pack('<I', encode_time(datetime.now()))))
+        elif command == CMD_GET_VERSION:
+            self.send(self.packet(CMD_ACK_OK, reply_id, b'Ver 6.60 Sim\x00'))
+        elif command == CMD_OPTIONS_RRQ:
+            self.send(self.packet(CMD_ACK_OK, reply_id, device.option(payload.split(b'\x00')[0])))
+        elif command == CMD_GET_PINWIDTH:
+            self.send(self.packet(CMD_ACK_OK, reply_id, b'\x09\x00'))
+        elif command == CMD_PREPARE_BUFFER:
+            _, buffered_command, fct, _ = struct.unpack('<bhii', payload[:11])
+            self.buffer = device.read_buffer(buffered_command, fct)
+            self.send(self.packet(CMD_ACK_OK, reply_id, struct.pack('<BII', 0, len(self.buffer), 0)))
+        elif command == CMD_READ_BUFFER:
+            start, size = struct.unpack('<ii', payload[:8])
+            await self._send_chunk(self.buffer[start:start + size], reply_id)
+        elif command == CMD_FREE_DATA:
+            self.buffer = b''
+            self.send(self.packet(CMD_ACK_OK, reply_id))
+        elif command == CMD_CLEAR_ATTLOG:
+            device.clear_attendance()
+            self.send(self.packet(CMD_ACK_OK, reply_id))
+        else:
+            self.send(self.packet(CMD_ACK_UNKNOWN, reply_id))
+        return True
+
+    async def _send_chunk(self, chunk: bytes, reply_id: int):
+        """Answer a buffer read: PREPARE_DATA, the data itself, then ACK_OK"""
+        if self.device.bandwidth:
+            await asyncio.sleep(len(chunk) / self.device.bandwidth)
+        if self.tcp:
+            self.send(self.packet(CMD_PREPARE_DATA, reply_id, struct.pack('<II', len(chunk), 0))
+                      + self.packet(CMD_DATA, reply_id, chunk)
+                      + self.packet(CMD_ACK_OK, reply_id))
+            return
+        self.send(self.packet(CMD_PREPARE_DATA, reply_id, struct.pack('<I', len(chunk))))
+        for offset in range(0, len(chunk), UDP_CHUNK):
+            self.send(self.packet(CMD_DATA, reply_id, chunk[offset:offset + UDP_CHUNK]))
+        self.send(self.packet(CMD_ACK_OK, reply_id))
+
+
+class UDPDeviceProtocol(asyncio.DatagramProtocol):
+    """UDP endpoint for one device; one Session per client address"""
+
+    def __init__(self, device: SimulatedDevice):
+        self.device = device
+        self.sessions: Dict[tuple, Session] = {}
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < 8:
+            return
+        session = self.sessions.get(addr)
+        if session is None:
+            session = Session(self.device, lambda packet: self.transport.sendto(packet, addr), tcp=False)
+            self.sessions[addr] = session
+        asyncio.ensure_future(self._handle(session, data, addr))
+
+    async def _handle(self, session: Session, data: bytes, addr):
+        if not await session.handle(data):
+            session.close()
+            self.sessions.pop(addr, None)
+
+
+class ZKSimulator:
+    """A fleet of simulated terminals on consecutive ports"""
+
+    def __init__(self, devices: int, base_port: int, records: int, users: int, host: str = '127.0.0.1',
+                 udp: bool = False, offline: int = 0, latency: float = 0.0, bandwidth: int = 0,
+                 drop_rate: float = 0.0, live_rate: float = 0.0, seed: int = 1):
+        self.host = host
+        self.udp = udp
+        self.live_rate = live_rate
+        self.seed = seed
+
+        # Every device serves the same synthetic history; live punches are per device
+        started = time.monotonic()
+        users_blob = build_users(users)
+        attlog_blob = build_attendance(records, users, seed)
+        logger.info(f"Generated {users} users and {records} attendance records in {time.monotonic() - started:.1f}s")
+
+        self.devices: List[SimulatedDevice] = [
+            SimulatedDevice(i, base_port + i, users_blob, users, attlog_blob, latency, bandwidth, drop_rate)
+            for i in range(devices)
+        ]
+        self.online = self.devices[:max(0, devices - offline)]
+
+    async def _serve_tcp(self, device: SimulatedDevice, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = Session(device, writer.write, tcp=True)
+        try:
+            while True:
+                top = await reader.readexactly(TCP_TOP.size)
+                magic_1, magic_2, length = TCP_TOP.unpack(top)
+                if magic_1 != MACHINE_PREPARE_DATA_1 or magic_2 != MACHINE_PREPARE_DATA_2:
+                    break
+                if not await session.handle(await reader.readexactly(length)):
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Device {device.serial}: {e}")
+        finally:
+            session.close()
+            writer.close()
+
+    async def _generate_punches(self, device: SimulatedDevice):
+        rng = random.Random(self.seed + device.index)
+        while True:
+            await asyncio.sleep(rng.expovariate(self.live_rate / 60.0))
+            device.punch(rng)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for device in self.online:
+            await asyncio.start_server(
+                lambda reader, writer, device=device: self._serve_tcp(device, reader, writer),
+                self.host, device.port
+            )
+            if self.udp:
+                await loop.create_datagram_endpoint(lambda device=device: UDPDeviceProtocol(device),
+                                                    local_addr=(self.host, device.port))
+            if self.live_rate > 0:
+                asyncio.ensure_future(self._generate_punches(device))
+
+        if self.devices:
+            offline = len(self.devices) - len(self.online)
+            logger.info(f"Simulating {len(self.online)} devices on {self.host}:{self.devices[0].port}-{self.online[-1].port if self.online else '-'}"
+                        f" ({'TCP+UDP' if self.udp else 'TCP'}, {offline} offline)")
+        await asyncio.Event().wait()
+
+
+def raise_fd_limit(needed: int):
+    """Many devices need more sockets than the usual 1024 soft limit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate ZKTeco attendance terminals")
+    parser.add_argument('--devices', type=int, default=1, help="number of simulated terminals")
+    parser.add_argument('--base-port', type=int, default=4370, help="port of the first terminal, the rest follow")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--records', type=int, default=10000, help="attendance records per terminal")
+    parser.add_argument('--users', type=int, default=200, help="enrolled users per terminal")
+    parser.add_argument('--udp', action='store_true', help="also answer on UDP")
+    parser.add_argument('--offline', type=int, default=0, help="leave the last N terminals unreachable")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every reply")
+    parser.add_argument('--bandwidth', type=int, default=0, help="log download speed in bytes/s (0 = unlimited)")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="probability of dropping the connection per command")
+    parser.add_argument('--live-rate', type=float, default=0.0, help="new punches per minute per terminal")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    raise_fd_limit(args.devices * (2 if args.udp else 1) * 4 + 64)
+    simulator = ZKSimulator(args.devices, args.base_port, args.records, args.users, host=args.host, udp=args.udp,
+                            offline=args.offline, latency=args.latency, bandwidth=args.bandwidth,
+                            drop_rate=args.drop_rate, live_rate=args.live_rate, seed=args.seed)
+    try:
+        asyncio.run(simulator.run())
+    except KeyboardInterrupt:
+        logger.info("Simulator stopped")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,54 +7,1525 @@ This tool continuously syncs attendance data from ZK biometric devices to the da
 Run this script manually or as a background service.
 """
 
+import atexit
 import time
+import random
+import gzip
+import calendar
+import cProfile
+import hashlib
+import re
+import socket
 import requests
 import json
 import logging
-from datetime import datetime
+import logging.handlers
+import pstats
+import queue
+import shutil
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from typing import Dict, List, Optional
 import sys
 import os
+import sqlite3
+import threading
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import HTTPAdapter
+
+try:
+    from zk import ZK  # pyzk - only needed for direct device mode
+except ImportError:
+    ZK = None
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class DeviceLogContext(threading.local):
+    """Device the current thread is syncing; log records made meanwhile are tagged with it"""
+    device = None
+
+
+log_context = DeviceLogContext()
+
+
+class DeviceRepeatFilter(logging.Filter):
+    """
+    Per-device rate limit for repetitive log lines.
+    
+    Lines that differ only in their numbers count as the same message, and a
+    device may log the same message `limit` times per `window` seconds. The
+    next line that gets through says how many were suppressed, so the log size
+    no longer grows with the number of devices times the number of cycles.
+    Errors and lines not tied to a device always pass.
+    """
+
+    MAX_KEYS = 10000
+
+    def __init__(self, limit: int = 3, window: float = 300):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._seen = {}  # (device, level, message shape) -> [window start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.device = getattr(record, 'device', None) or log_context.device
+        if not self.limit or record.device is None or record.levelno >= logging.ERROR:
+            return True
+        
+        key = (record.device, record.levelno, re.sub(r'\d+', '#', record.getMessage()))
+        now = time.monotonic()
+        suppressed = 0
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if entry is None and len(self._seen) >= self.MAX_KEYS:
+                    self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+                suppressed = entry[2] if entry else 0
+                self._seen[key] = [now, 1, 0]
+            elif entry[1] < self.limit:
+                entry[1] += 1
+            else:
+                entry[2] += 1
+                return False
+        
+        if suppressed:
+            record.msg = f"{record.getMessage()} [{suppressed} similar messages suppressed]"
+            record.args = None
+        return True
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if getattr(record, 'device', None):
+            entry['device'] = record.device
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class CompressingRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    Log file rolled over once it reaches max_bytes or at the next midnight or
+    hour (`when`), whichever comes first. Rolled files get a timestamp suffix
+    and are gzip-compressed, and only the newest backup_count are kept.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 50 * 1024 * 1024, when: str = 'midnight',
+                 backup_count: int = 14, compress: bool = True):
+        super().__init__(filename, 'a', encoding='utf-8', delay=True)
+        self.max_bytes = max_bytes
+        self.when = when
+        self.backup_count = backup_count
+        self.compress = compress
+        self.next_rollover = self._next_rollover()
+
+    def _next_rollover(self) -> float:
+        now = datetime.now()
+        if self.when == 'midnight':
+            return (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+        if self.when == 'hourly':
+            return (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+        return float('inf')
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.next_rollover:
+            return True
+        if not self.max_bytes:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.next_rollover = self._next_rollover()
+        if not os.path.exists(self.baseFilename) or os.path.getsize(self.baseFilename) == 0:
+            return
+        
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        rolled = f"{self.baseFilename}.{stamp}"
+        suffix = 1
+        while os.path.exists(rolled) or os.path.exists(rolled + '.gz'):
+            rolled = f"{self.baseFilename}.{stamp}_{suffix}"
+            suffix += 1
+        os.replace(self.baseFilename, rolled)
+        if self.compress:
+            with open(rolled, 'rb') as src, gzip.open(rolled + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rolled)
+        
+        if self.backup_count:
+            directory, base = os.path.split(self.baseFilename)
+            backups = sorted(name for name in os.listdir(directory or '.')
+                             if name.startswith(base + '.') and name[len(base) + 1:len(base) + 2].isdigit())
+            for name in backups[:-self.backup_count]:
+                os.remove(os.path.join(directory, name))
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread; drops them instead of blocking a sync when it falls behind"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.dropped and not self.queue.full():
+            dropped, self.dropped = self.dropped, 0
+            self.enqueue(logging.makeLogRecord({'name': record.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                                'msg': f"🪵 Log writer fell behind: dropped {dropped} log records"}))
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(log_file: str, max_bytes: int, when: str, backup_count: int, json_format: bool,
+                      repeat_limit: int, repeat_window: float, queue_size: int):
+    """
+    Send log records through a bounded queue to a writer thread, so a slow disk
+    or console never stalls a sync. The file handler rotates and compresses.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return  # configured by the embedding program
+    
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    handlers = [console]
+    if log_file:
+        file_handler = CompressingRotatingFileHandler(log_file, max_bytes=max_bytes, when=when, backup_count=backup_count)
+        file_handler.setFormatter(JsonLogFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+        handlers.append(file_handler)
+    
+    queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(DeviceRepeatFilter(repeat_limit, repeat_window))
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+    
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    
+    def flush_on_exit():
+        # Write out whatever is still queued; the stop marker waits for room if the queue is full
+        while True:
+            try:
+                listener.stop()
+                return
+            except queue.Full:
+                time.sleep(0.05)
+    atexit.register(flush_on_exit)
+
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('attendance_sync.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
+configure_logging(
+    log_file=os.getenv('LOG_FILE', 'attendance_sync.log'),  # '' logs to the console only
+    max_bytes=int(os.getenv('LOG_MAX_BYTES', str(50 * 1024 * 1024))),  # roll over at this size (0 = no limit)
+    when=os.getenv('LOG_ROTATE_WHEN', 'midnight'),  # midnight | hourly | never
+    backup_count=int(os.getenv('LOG_BACKUP_COUNT', '14')),  # compressed old logs kept (0 = all)
+    json_format=os.getenv('LOG_FORMAT', 'text').lower() == 'json',  # file format; the console stays text
+    repeat_limit=int(os.getenv('LOG_REPEAT_LIMIT', '3')),  # same message per device per window (0 = no limit)
+    repeat_window=float(os.getenv('LOG_REPEAT_WINDOW', '300')),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
 )
 logger = logging.getLogger(__name__)
 
+
+class ZKConnectionPool:
+    """Long-lived pyzk connections, one per device, reconnected on failure"""
+
+    def __init__(self, timeout: int = 5, password: int = 0, force_udp: bool = False):
+        self.timeout = timeout
+        self.password = password
+        self.force_udp = force_udp
+        self._connections = {}  # device_id -> (ip, port, connection)
+        self._device_locks = {}
+        self._lock = threading.Lock()
+
+    def _device_lock(self, device_id: str) -> threading.Lock:
+        with self._lock:
+            return self._device_locks.setdefault(device_id, threading.Lock())
+
+    def _get_connection(self, device_id: str, ip: str, port: int):
+        cached = self._connections.get(device_id)
+        if cached and cached[0] == ip and cached[1] == port:
+            return cached[2]
+        
+        # Device is new or its address changed in the web app
+        self._drop(device_id)
+        zk = ZK(ip, port=port, timeout=self.timeout, password=self.password,
+                force_udp=self.force_udp, ommit_ping=True)
+        conn = zk.connect()
+        self._connections[device_id] = (ip, port, conn)
+        logger.info(f"🔌 Connected to device {device_id} at {ip}:{port}")
+        return conn
+
+    def _drop(self, device_id: str):
+        cached = self._connections.pop(device_id, None)
+        if cached:
+            try:
+                cached[2].disconnect()
+            except Exception:
+                pass
+
+    def get_attendance(self, device_id: str, ip: str, port: int, known_count: Optional[int] = None) -> tuple:
+        """
+        Read the attendance buffer, reconnecting once if the connection went stale.
+        
+        Returns (records, record_count). When the device still holds known_count
+        records nothing new was punched, so the buffer download is skipped.
+        """
+        with self._device_lock(device_id):
+            for attempt in range(2):
+                try:
+                    conn = self._get_connection(device_id, ip, port)
+                    conn.read_sizes()
+                    record_count = conn.records
+                    if known_count is not None and record_count == known_count:
+                        return [], record_count
+                    return conn.get_attendance() or [], record_count
+                except Exception as e:
+                    self._drop(device_id)
+                    if attempt == 1:
+                        raise
+                    logger.warning(f"🔁 Connection to device {device_id} failed ({e}), reconnecting...")
+        return [], None
+
+    def rotate_attendance(self, device_id: str, ip: str, port: int, verify) -> bool:
+        """
+        Clear the device's attendance log if verify(records) approves what it holds.
+        
+        The terminal is disabled for the duration, so no punch can land between
+        the verifying read and the clear. Returns True once the log is empty.
+        """
+        with self._device_lock(device_id):
+            try:
+                conn = self._get_connection(device_id, ip, port)
+                conn.disable_device()
+                try:
+                    records = conn.get_attendance() or []
+                    if not verify(records):
+                        return False
+                    conn.clear_attendance()
+                    conn.read_sizes()
+                    if conn.records:
+                        raise RuntimeError(f"device still holds {conn.records} records after clearing")
+                    return True
+                finally:
+                    conn.enable_device()
+            except Exception:
+                self._drop(device_id)
+                raise
+
+    def close(self, device_id: str):
+        with self._device_lock(device_id):
+            self._drop(device_id)
+
+    def close_all(self):
+        for device_id in list(self._connections):
+            self.close(device_id)
+
+
+class SyncStateStore:
+    """Per-device sync watermarks persisted to a JSON file so restarts resume incrementally"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._devices = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('devices', {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Could not read sync state from {self.path}, starting fresh: {e}")
+            return {}
+
+    def get(self, device_id: str) -> Dict:
+        with self._lock:
+            return dict(self._devices.get(device_id, {}))
+
+    def device_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._devices)
+
+    def update(self, device_id: str, **fields):
+        with self._lock:
+            self._devices.setdefault(device_id, {}).update(fields)
+
+    def remove(self, device_id: str):
+        with self._lock:
+            self._devices.pop(device_id, None)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return json.loads(json.dumps(self._devices))
+
+    def save(self, snapshot: Optional[Dict] = None):
+        """Write atomically so a crash never leaves a half-written state file"""
+        with self._lock:
+            data = json.dumps({'devices': self._devices if snapshot is None else snapshot}, indent=2)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"💾 Failed to save sync state to {self.path}: {e}")
+
+
+class PunchSpool:
+    """
+    On-disk spool (SQLite, WAL mode) for punches that could not be uploaded.
+    
+    Punches are keyed on (device, uid, timestamp) so re-spooling the same
+    punch is a no-op, and rows are only deleted once the API has accepted them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS punches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT NOT NULL,
+                uid TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                state INTEGER,
+                type INTEGER,
+                UNIQUE (device_id, uid, timestamp)
+            )
+        """)
+        self._conn.commit()
+
+    def append(self, device_id: str, punches: List[Dict]) -> int:
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO punches (device_id, uid, timestamp, state, type) VALUES (?, ?, ?, ?, ?)",
+                [(device_id, p['uid'], p['timestamp'], p.get('state'), p.get('type')) for p in punches]
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM punches").fetchone()[0]
+
+    def oldest_timestamp(self) -> Optional[str]:
+        """Punch time of the oldest spooled punch, None when the spool is empty"""
+        with self._lock:
+            return self._conn.execute("SELECT MIN(timestamp) FROM punches").fetchone()[0]
+
+    def fetch_pending(self, limit: int) -> tuple:
+        """Return (row_ids, {device_id: punches}) for the oldest spooled punches across all devices"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, device_id, uid, timestamp, state, type FROM punches ORDER BY id LIMIT ?",
+                (limit,)
+            ).fetchall()
+        row_ids = [row[0] for row in rows]
+        device_punches = {}
+        for row in rows:
+            device_punches.setdefault(row[1], []).append(
+                {'uid': row[2], 'timestamp': row[3], 'state': row[4], 'type': row[5]}
+            )
+        return row_ids, device_punches
+
+    def ack(self, row_ids: List[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM punches WHERE id = ?", [(row_id,) for row_id in row_ids])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PunchBatcher:
+    """
+    Coalesces punches from many devices into one bulk upload.
+    
+    A batch is due once it holds max_punches punches or its oldest punch has
+    waited max_latency seconds, whichever comes first.
+    """
+
+    def __init__(self, max_punches: int = 20000, max_latency: float = 2.0):
+        self.max_punches = max_punches
+        self.max_latency = max_latency
+        self._lock = threading.Lock()
+        self._pending = {}  # device_id -> punches
+        self._count = 0
+        self._oldest = None
+
+    def add(self, device_id: str, punches: List[Dict]) -> bool:
+        """Queue punches; returns True when the batch should be flushed"""
+        with self._lock:
+            self._pending.setdefault(device_id, []).extend(punches)
+            self._count += len(punches)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+        return self.due()
+
+    def due(self) -> bool:
+        with self._lock:
+            if not self._count:
+                return False
+            return self._count >= self.max_punches or time.monotonic() - self._oldest >= self.max_latency
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._count
+
+    def take(self) -> Dict[str, List[Dict]]:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._count = 0
+            self._oldest = None
+        return batch
+
+    @staticmethod
+    def encode(device_punches: Dict[str, List[Dict]]) -> bytes:
+        """Gzip'd columnar JSON: one array per field instead of one object per punch"""
+        devices = []
+        for device_id, punches in device_punches.items():
+            devices.append({
+                'deviceId': device_id,
+                'uid': [p['uid'] for p in punches],
+                'timestamp': [p['timestamp'] for p in punches],
+                'state': [p.get('state') or 0 for p in punches],
+                'type': [p.get('type') or 0 for p in punches]
+            })
+        payload = json.dumps({'format': 'columnar-v1', 'devices': devices}, separators=(',', ':'))
+        return gzip.compress(payload.encode('utf-8'), compresslevel=5)
+
+
+class AdaptivePollScheduler:
+    """
+    Per-device polling intervals driven by punch rate.
+    
+    A device that returned many records is polled sooner next time, one that
+    returned nothing backs off. Intervals stay within the bounds of the current
+    profile: office hours (weekdays) allow fast polling, off-hours allow long
+    back-off.
+    """
+
+    def __init__(self, base_interval: float, min_interval: float = 10, max_interval: float = 300,
+                 offhours_min_interval: float = 60, offhours_max_interval: float = 1800,
+                 office_hours: tuple = ("07:00", "18:00"), busy_records: int = 20, backoff: float = 1.5):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.offhours_min_interval = offhours_min_interval
+        self.offhours_max_interval = offhours_max_interval
+        self.office_start, self.office_end = office_hours
+        self.busy_records = busy_records
+        self.backoff = backoff
+        self.intervals = {}  # device_id -> current interval in seconds
+        self.next_due = {}  # device_id -> time.monotonic() deadline
+
+    def in_office_hours(self, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now()
+        return now.weekday() < 5 and self.office_start <= now.strftime('%H:%M') < self.office_end
+
+    def bounds(self) -> tuple:
+        if self.in_office_hours():
+            return self.min_interval, self.max_interval
+        return self.offhours_min_interval, self.offhours_max_interval
+
+    def is_due(self, device_id: str) -> bool:
+        return self.next_due.get(device_id, 0) <= time.monotonic()
+
+    def record(self, device_id: str, raw_records: int, success: bool):
+        """Schedule the next poll of a device from the outcome of its last sync"""
+        low, high = self.bounds()
+        interval = self.intervals.get(device_id, self.base_interval)
+        
+        if success:
+            if raw_records >= self.busy_records:
+                interval /= 2
+            elif raw_records == 0:
+                interval *= self.backoff
+        
+        interval = min(high, max(low, interval))
+        self.intervals[device_id] = interval
+        self.next_due[device_id] = time.monotonic() + interval
+
+    def forget(self, device_id: str):
+        self.intervals.pop(device_id, None)
+        self.next_due.pop(device_id, None)
+
+    def seconds_until_next(self) -> float:
+        if not self.next_due:
+            return self.base_interval
+        return max(0.0, min(self.next_due.values()) - time.monotonic())
+
+
+class DeviceCircuitBreaker:
+    """
+    Per-device circuit breaker with jittered exponential backoff.
+    
+    After `failure_threshold` consecutive failures a device's circuit opens and
+    it is skipped until its backoff expires. It then goes half-open: one probe
+    sync is allowed, which either closes the circuit or re-opens it with a
+    doubled delay.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 3, base_delay: float = 30, max_delay: float = 1800):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.devices = {}  # device_id -> {'state', 'failures', 'open_until'}
+
+    def _entry(self, device_id: str) -> Dict:
+        return self.devices.setdefault(device_id, {'state': self.CLOSED, 'failures': 0, 'open_until': 0.0})
+
+    def allow(self, device_id: str) -> bool:
+        """Whether the device should be synced this cycle"""
+        entry = self._entry(device_id)
+        if entry['state'] == self.OPEN and time.monotonic() >= entry['open_until']:
+            entry['state'] = self.HALF_OPEN
+        return entry['state'] != self.OPEN
+
+    def record_success(self, device_id: str):
+        self.devices[device_id] = {'state': self.CLOSED, 'failures': 0, 'open_until': 0.0}
+
+    def record_failure(self, device_id: str) -> Optional[float]:
+        """Count a failure; returns the backoff delay if the circuit (re)opened"""
+        entry = self._entry(device_id)
+        entry['failures'] += 1
+        if entry['state'] != self.HALF_OPEN and entry['failures'] < self.failure_threshold:
+            return None
+        
+        exponent = entry['failures'] - self.failure_threshold
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, exponent)))
+        delay *= random.uniform(0.8, 1.2)  # jitter so dead devices don't all probe in the same cycle
+        entry['state'] = self.OPEN
+        entry['open_until'] = time.monotonic() + delay
+        return delay
+
+    def forget(self, device_id: str):
+        self.devices.pop(device_id, None)
+
+    def describe(self, device_id: str) -> str:
+        entry = self.devices.get(device_id)
+        if not entry or entry['state'] == self.CLOSED:
+            return 'closed'
+        if entry['state'] == self.HALF_OPEN:
+            return f"half-open after {entry['failures']} failures"
+        remaining = max(0, entry['open_until'] - time.monotonic())
+        return f"open after {entry['failures']} failures, next probe in {remaining:.0f}s"
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on device syncs in flight, steered by how the HR API answers.
+    
+    Every API response is reported through RateLimitedAdapter. A quick success
+    raises the limit by one per full window of requests; a 429, a 5xx or a
+    timeout halves it, and a response slower than the latency target trims it
+    by a tenth. Only requests sent after the last cut can cut again, so one
+    burst of overload costs one halving. A Retry-After header pauses every new
+    request until it has passed.
+    
+    The latency target is per endpoint path (so per device for server-side
+    syncs): `latency_target` seconds, or when 0, three times the fastest of
+    that path's recent responses and at least a second.
+    """
+
+    HISTORY = 50  # recent latencies kept per path for the automatic target
+
+    def __init__(self, initial: int = 1, max_limit: int = 8, min_limit: int = 1,
+                 latency_target: float = 0, max_pause: float = 300):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.latency_target = latency_target
+        self.max_pause = max_pause
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self.last_reason = None  # why the limit was last cut
+        self._last_decrease = 0.0
+        self._latencies = {}  # path -> deque of recent latencies
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a device sync may start"""
+        with self._cond:
+            while True:
+                paused = self.pause_until - time.monotonic()
+                if paused > 0:
+                    self._cond.wait(paused)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    break
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def wait_if_paused(self):
+        """Hold an API request while the server's Retry-After is running"""
+        while True:
+            with self._cond:
+                paused = self.pause_until - time.monotonic()
+            if paused <= 0:
+                return
+            time.sleep(min(paused, 1.0))
+
+    def observe(self, path: str, started: float, latency: Optional[float], status: Optional[int],
+                retry_after: Optional[str] = None):
+        """Feed one API outcome; latency and status are None for a timeout"""
+        with self._cond:
+            now = time.monotonic()
+            if retry_after:
+                delay = self._parse_retry_after(retry_after)
+                if delay and delay > 0:
+                    self.pause_until = max(self.pause_until, now + min(delay, self.max_pause))
+            
+            if status is None:
+                self._decrease(0.5, 'timeout', started)
+            elif status == 429 or status >= 500:
+                self._decrease(0.5, f'HTTP {status}', started)
+            elif status < 400:
+                history = self._latencies.setdefault(path, deque(maxlen=self.HISTORY))
+                target = self.latency_target or max(1.0, 3 * min(history, default=latency))
+                history.append(latency)
+                if latency > target:
+                    self._decrease(0.9, f'{latency:.1f}s response from {path}', started)
+                elif self.limit < self.max_limit:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def _decrease(self, factor: float, reason: str, started: float):
+        if started < self._last_decrease:
+            return  # sent before the last cut, which already accounted for it
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._last_decrease = time.monotonic()
+        self.last_reason = reason
+        if int(self.limit) < previous:
+            logger.warning(f"🐢 API backpressure ({reason}): concurrency limit {previous} → {int(self.limit)}")
+
+    @staticmethod
+    def _parse_retry_after(value: str) -> Optional[float]:
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return (retry_at - datetime.now(timezone.utc)).total_seconds()
+
+    def describe(self) -> str:
+        with self._cond:
+            text = f"limit {int(self.limit)} of {self.max_limit} ({self.in_flight} in flight)"
+            paused = self.pause_until - time.monotonic()
+            if paused > 0:
+                text += f", paused {paused:.0f}s by Retry-After"
+            if self.last_reason:
+                text += f", last cut: {self.last_reason}"
+            return text
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter reporting every HR API response and timeout to the concurrency limiter"""
+
+    def __init__(self, limiter: AdaptiveConcurrencyLimiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.limiter.wait_if_paused()
+        path = requests.utils.urlparse(request.url).path
+        started = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.exceptions.Timeout:
+            self.limiter.observe(path, started, None, None)
+            raise
+        self.limiter.observe(path, started, time.monotonic() - started, response.status_code,
+                             response.headers.get('Retry-After'))
+        return response
+
+
+class SyncMetrics:
+    """In-process sync metrics, served in the Prometheus text format on /metrics"""
+
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    HELP = {
+        'attendance_sync_device_duration_seconds': ('histogram', 'Time to sync one device'),
+        'attendance_sync_api_request_duration_seconds': ('histogram', 'HR API response time by endpoint'),
+        'attendance_sync_cycle_duration_seconds': ('histogram', 'Time to run one sync cycle'),
+        'attendance_sync_raw_records_total': ('counter', 'Raw punches read per device'),
+        'attendance_sync_processed_records_total': ('counter', 'Attendance records saved per device'),
+        'attendance_sync_failures_total': ('counter', 'Failed device syncs by error class'),
+        'attendance_sync_cycles_total': ('counter', 'Completed sync cycles'),
+        'attendance_sync_last_success_age_seconds': ('gauge', 'Seconds since the last successful sync of a device'),
+        'attendance_sync_spool_pending_punches': ('gauge', 'Punches waiting in the local spool'),
+        'attendance_sync_backlog_age_seconds': ('gauge', 'Age of the oldest punch still waiting in the spool'),
+        'attendance_sync_open_circuits': ('gauge', 'Devices currently skipped by the circuit breaker'),
+        'attendance_sync_log_rotations_total': ('counter', 'Device log rotation attempts by result'),
+        'attendance_sync_archived_punches_total': ('counter', 'Punches newly written to the local archive'),
+        'attendance_sync_concurrency_limit': ('gauge', 'Device syncs currently allowed in flight by the API limiter'),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}  # name -> callable returning [(labels dict, value)]
+
+    @staticmethod
+    def _key(name: str, labels: Dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            entry = self._histograms.setdefault(self._key(name, labels), [0] * len(self.LATENCY_BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        with self._lock:
+            key = self._key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name: str, collect):
+        """Register a gauge computed at scrape time"""
+        self._gauges[name] = collect
+
+    @staticmethod
+    def _format_labels(labels, extra: str = '') -> str:
+        parts = []
+        for key, value in labels:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            parts.append(f'{key}="{value}"')
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = {key: list(entry) for key, entry in self._histograms.items()}
+            counters = dict(self._counters)
+        
+        for name, (metric_type, help_text) in self.HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == 'histogram':
+                for (metric, labels), entry in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(self.LATENCY_BUCKETS, entry):
+                        bucket_labels = self._format_labels(labels, 'le="%s"' % bound)
+                        lines.append(f"{name}_bucket{bucket_labels} {count}")
+                    bucket_labels = self._format_labels(labels, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{bucket_labels} {entry[-1]}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {entry[-2]:.6f}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {entry[-1]}")
+            elif metric_type == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._format_labels(labels)} {value:g}")
+            elif name in self._gauges:
+                try:
+                    for labels, value in self._gauges[name]():
+                        lines.append(f"{name}{self._format_labels(sorted(labels.items()))} {value:g}")
+                except Exception as e:
+                    logger.debug(f"Gauge {name} failed: {e}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, host: str, port: int) -> ThreadingHTTPServer:
+        """Start the /metrics endpoint on a daemon thread"""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes would otherwise flood the sync log
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        return server
+
+
+class CycleTracer:
+    """
+    Span timings of one sync cycle, written as a Chrome trace file.
+    
+    Open the files in chrome://tracing or https://ui.perfetto.dev. Every thread
+    gets its own row. Phases the server reports for an API request (connect,
+    pull, resolve, write, ...) are drawn inside that request's span, offset from
+    the moment the request was sent. Spans outside a cycle are not recorded.
+    """
+
+    def __init__(self, directory: str, keep: int = 100):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}  # thread ident -> name
+        self._cycle = None
+        self._origin = time.perf_counter()
+
+    def start_cycle(self, cycle: int):
+        with self._lock:
+            self._events = []
+            self._threads = {}
+            self._cycle = cycle
+            self._origin = time.perf_counter()
+
+    def add(self, name: str, category: str, start: float, duration: float, **args):
+        """Record a finished span; start is a time.perf_counter() value"""
+        thread = threading.current_thread()
+        with self._lock:
+            if self._cycle is None:
+                return
+            self._threads[thread.ident] = thread.name
+            self._events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': thread.ident,
+                                 'ts': round((start - self._origin) * 1e6, 1), 'dur': round(duration * 1e6, 1),
+                                 'args': args})
+
+    @contextmanager
+    def span(self, name: str, category: str = 'sync', **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.perf_counter() - start, **args)
+
+    def add_server_phases(self, request_started: float, timings: Optional[Dict], **args):
+        """Place the `timings` of an API response inside the request that started at request_started"""
+        for phase in (timings or {}).get('phases', []):
+            self.add(f"server:{phase['phase']}", 'server', request_started + phase['startMs'] / 1000,
+                     phase['durationMs'] / 1000, **args)
+
+    def finish_cycle(self) -> Optional[str]:
+        """Write the cycle's trace file and return its path"""
+        with self._lock:
+            events, threads, cycle = self._events, self._threads, self._cycle
+            self._events, self._threads, self._cycle = [], {}, None
+        if not events:
+            return None
+        
+        pid = os.getpid()
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': ident, 'args': {'name': name}}
+                    for ident, name in threads.items()]
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"cycle-{datetime.now():%Y%m%d-%H%M%S}-{cycle:06d}.json")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        os.replace(tmp_path, path)
+        
+        if self.keep:
+            traces = sorted(name for name in os.listdir(self.directory)
+                            if name.startswith('cycle-') and name.endswith('.json'))
+            for name in traces[:-self.keep]:
+                os.remove(os.path.join(self.directory, name))
+        return path
+
+
+class StatusPublisher:
+    """
+    Live state of the running sync daemon, published as a small JSON file.
+    
+    The file is replaced atomically every `interval` seconds and after each
+    cycle, so `python_sync_tool.py status` in another process always reads a
+    complete snapshot without touching the API or the devices.
+    """
+
+    def __init__(self, path: str, collect, interval: float = 5.0):
+        self.path = path
+        self.collect = collect  # returns the snapshot dict
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.publish()
+        self._thread = threading.Thread(target=self._run, name='status-publisher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.publish()
+
+    def publish(self, **fields):
+        try:
+            snapshot = self.collect()
+            snapshot.update(fields, updated_at=datetime.now().isoformat(), publish_interval=self.interval)
+            data = json.dumps(snapshot, indent=2, default=str)
+            with self._lock:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+        except Exception as e:
+            # Status is best effort; it must never stop a sync
+            logger.debug(f"Could not publish status to {self.path}: {e}")
+
+    def stop(self):
+        """Stop publishing and leave a final snapshot marked as stopped"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+        self.publish(state='stopped')
+
+    @staticmethod
+    def read(path: str) -> Optional[Dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+class RosterCache:
+    """Device user lists saved on disk, reused while a device reports the same user count"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, device_id: str) -> str:
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_.-]', '_', device_id) + '.json')
+
+    def load(self, device_id: str, ip: str, port: int, user_count: int) -> Optional[List[Dict]]:
+        try:
+            with open(self._path(device_id), 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (snapshot.get('ip'), snapshot.get('port'), snapshot.get('user_count')) != (ip, port, user_count):
+            return None
+        return snapshot['users']
+
+    def store(self, device_id: str, ip: str, port: int, users: List[Dict]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(device_id)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'device_id': device_id, 'ip': ip, 'port': port, 'user_count': len(users),
+                       'fetched_at': datetime.now().isoformat(), 'users': users}, f)
+        os.replace(f"{path}.tmp", path)
+
+
+class PunchArchive:
+    """Append-only columnar store of every raw punch, partitioned by device and month.
+
+    Each partition directory (<root>/<device>/<YYYY-MM>/) holds one flat
+    little-endian file per column - ts.i64 (punch wall-clock time as seconds
+    since 1970-01-01, no time zone), uid.i32 (index into meta.json's uid list),
+    state.i16 and type.i16 - so a partition can be scanned with array.fromfile
+    or numpy.fromfile/memmap without parsing. Rows are unique per
+    (device, uid, timestamp).
+    """
+
+    COLUMNS = (('ts', 'q'), ('uid', 'i'), ('state', 'h'), ('type', 'h'))
+    MAX_OPEN_PARTITIONS = 64  # dedup key sets kept in memory
+
+    def __init__(self, root: str):
+        self.root = root
+        self._partitions = OrderedDict()  # (device_id, month) -> {'uids', 'codes', 'keys', 'rows'}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _to_seconds(timestamp: datetime) -> int:
+        return calendar.timegm(timestamp.timetuple())
+
+    @staticmethod
+    def _from_seconds(seconds: int) -> datetime:
+        return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+
+    def _directory(self, device_id: str, month: str) -> str:
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9_.-]', '_', device_id), month)
+
+    def _read_columns(self, directory: str) -> tuple:
+        """Column arrays and metadata of one partition, cut to the rows every column has"""
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        columns = {}
+        for name, typecode in self.COLUMNS:
+            column = array(typecode)
+            path = os.path.join(directory, f"{name}.{typecode}")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                column.frombytes(data[:len(data) - len(data) % column.itemsize])
+            if sys.byteorder != 'little':
+                column.byteswap()
+            columns[name] = column
+        # An append cut short by a crash can leave the first columns longer than the last
+        rows = min(len(column) for column in columns.values())
+        for name in columns:
+            del columns[name][rows:]
+        return meta, columns
+
+    def _open(self, device_id: str, month: str) -> Dict:
+        key = (device_id, month)
+        partition = self._partitions.get(key)
+        if partition is not None:
+            self._partitions.move_to_end(key)
+            return partition
+        
+        directory = self._directory(device_id, month)
+        if os.path.exists(os.path.join(directory, 'meta.json')):
+            meta, columns = self._read_columns(directory)
+            rows = len(columns['ts'])
+            for name, typecode in self.COLUMNS:
+                path = os.path.join(directory, f"{name}.{typecode}")
+                if os.path.exists(path) and os.path.getsize(path) != rows * columns[name].itemsize:
+                    with open(path, 'r+b') as f:
+                        f.truncate(rows * columns[name].itemsize)
+            uids = meta['uids']
+            keys = set(zip(columns['uid'], columns['ts']))
+        else:
+            os.makedirs(directory, exist_ok=True)
+            uids, keys, rows = [], set(), 0
+        
+        partition = {'directory': directory, 'uids': uids, 'codes': {uid: code for code, uid in enumerate(uids)},
+                     'keys': keys, 'rows': rows}
+        self._partitions[key] = partition
+        if len(self._partitions) > self.MAX_OPEN_PARTITIONS:
+            self._partitions.popitem(last=False)
+        return partition
+
+    def append(self, device_id: str, punches: List[Dict]) -> int:
+        """Store punches not already archived for this device; returns how many were new"""
+        by_month = {}
+        for punch in punches:
+            timestamp = datetime.fromisoformat(punch['timestamp'])
+            by_month.setdefault(timestamp.strftime('%Y-%m'), []).append((punch, self._to_seconds(timestamp)))
+        
+        added = 0
+        with self._lock:
+            for month, month_punches in by_month.items():
+                partition = self._open(device_id, month)
+                # Codes and keys are only committed to the partition once every column is on disk
+                uids = list(partition['uids'])
+                codes = dict(partition['codes'])
+                new_keys = set()
+                columns = {name: array(typecode) for name, typecode in self.COLUMNS}
+                for punch, seconds in month_punches:
+                    code = codes.get(punch['uid'])
+                    if code is None:
+                        code = codes[punch['uid']] = len(uids)
+                        uids.append(punch['uid'])
+                    if (code, seconds) in partition['keys'] or (code, seconds) in new_keys:
+                        continue
+                    new_keys.add((code, seconds))
+                    columns['ts'].append(seconds)
+                    columns['uid'].append(code)
+                    columns['state'].append(int(punch.get('state') or 0))
+                    columns['type'].append(int(punch.get('type') or 0))
+                if not columns['ts']:
+                    continue
+                
+                directory = partition['directory']
+                try:
+                    # The uid list is written first so every stored code can be resolved
+                    if len(uids) > len(partition['uids']):
+                        with open(os.path.join(directory, 'meta.json.tmp'), 'w', encoding='utf-8') as f:
+                            json.dump({'device_id': device_id, 'month': month, 'uids': uids}, f)
+                        os.replace(os.path.join(directory, 'meta.json.tmp'), os.path.join(directory, 'meta.json'))
+                    for name, typecode in self.COLUMNS:
+                        column = columns[name]
+                        if sys.byteorder != 'little':
+                            column.byteswap()
+                        with open(os.path.join(directory, f"{name}.{typecode}"), 'ab') as f:
+                            column.tofile(f)
+                except BaseException:
+                    self._rollback(device_id, month, partition)
+                    raise
+                partition['uids'], partition['codes'] = uids, codes
+                partition['keys'] |= new_keys
+                partition['rows'] += len(columns['ts'])
+                added += len(columns['ts'])
+        return added
+
+    def _rollback(self, device_id: str, month: str, partition: Dict):
+        """Cut every column back to the rows it had before a failed append, so they stay aligned"""
+        self._partitions.pop((device_id, month), None)
+        for name, typecode in self.COLUMNS:
+            path = os.path.join(partition['directory'], f"{name}.{typecode}")
+            try:
+                if os.path.exists(path):
+                    with open(path, 'r+b') as f:
+                        f.truncate(partition['rows'] * array(typecode).itemsize)
+            except OSError as e:
+                logger.error(f"🗄️ Could not roll back {path} after a failed append: {e}")
+
+    def partitions(self, device_id: Optional[str] = None) -> List[tuple]:
+        """(device_id, month, directory) for every stored partition, oldest month first"""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for device_dir in sorted(os.scandir(self.root), key=lambda entry: entry.name):
+            if not device_dir.is_dir():
+                continue
+            for month_dir in sorted(os.scandir(device_dir.path), key=lambda entry: entry.name):
+                meta_path = os.path.join(month_dir.path, 'meta.json')
+                if not os.path.exists(meta_path):
+                    continue
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if device_id is None or meta['device_id'] == device_id:
+                    found.append((meta['device_id'], meta['month'], month_dir.path))
+        return found
+
+    def read_partition(self, directory: str) -> Dict:
+        """One partition as columns: 'ts', 'uid' (codes), 'state', 'type' arrays plus the 'uids' list"""
+        with self._lock:
+            meta, columns = self._read_columns(directory)
+        columns['uids'] = meta['uids']
+        return columns
+
+    def scan(self, device_id: Optional[str] = None, start: Optional[datetime] = None,
+             end: Optional[datetime] = None, uid: Optional[str] = None):
+        """Yield archived punches as dicts, skipping whole partitions outside [start, end]"""
+        start_seconds = self._to_seconds(start) if start else None
+        end_seconds = self._to_seconds(end) if end else None
+        for partition_device, month, directory in self.partitions(device_id):
+            if (start and month < start.strftime('%Y-%m')) or (end and month > end.strftime('%Y-%m')):
+                continue
+            columns = self.read_partition(directory)
+            uids = columns['uids']
+            wanted_code = uids.index(uid) if uid in uids else None
+            if uid is not None and wanted_code is None:
+                continue
+            for row, seconds in enumerate(columns['ts']):
+                if start_seconds is not None and seconds < start_seconds:
+                    continue
+                if end_seconds is not None and seconds > end_seconds:
+                    continue
+                if wanted_code is not None and columns['uid'][row] != wanted_code:
+                    continue
+                yield {'device_id': partition_device, 'uid': uids[columns['uid'][row]],
+                       'timestamp': self._from_seconds(seconds).isoformat(),
+                       'state': columns['state'][row], 'type': columns['type'][row]}
+
+    @staticmethod
+    def _column_rows(directory: str, name: str, typecode: str) -> int:
+        path = os.path.join(directory, f"{name}.{typecode}")
+        return os.path.getsize(path) // array(typecode).itemsize if os.path.exists(path) else 0
+
+    def summary(self) -> List[Dict]:
+        """Punch and distinct-user counts per partition, read from file sizes and metadata"""
+        rows = []
+        for device_id, month, directory in self.partitions():
+            with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+                uids = len(json.load(f)['uids'])
+            punches = min(self._column_rows(directory, name, typecode) for name, typecode in self.COLUMNS)
+            rows.append({'device_id': device_id, 'month': month, 'punches': punches, 'uids': uids})
+        return rows
+
+
+def collapse_partition(archive_root: str, directory: str, shards: int, start_seconds: int, end_seconds: int) -> Dict:
+    """First and last punch per UID per day in one archive partition (runs in a worker process).
+
+    The spans are returned as columns split into UID shards, so each shard can
+    be merged across devices and months by a single process.
+    """
+    columns = PunchArchive(archive_root).read_partition(directory)
+    uids = columns['uids']
+    shard_of = [zlib.crc32(uid.encode('utf-8')) % shards for uid in uids]
+    spans = [{} for _ in range(shards)]  # per shard: (uid, day number) -> [first, last] in archive seconds
+    punches = 0
+    for code, seconds in zip(columns['uid'], columns['ts']):
+        if seconds < start_seconds or seconds > end_seconds:
+            continue
+        punches += 1
+        key = (uids[code], seconds // 86400)
+        shard_spans = spans[shard_of[code]]
+        span = shard_spans.get(key)
+        if span is None:
+            shard_spans[key] = [seconds, seconds]
+        elif seconds < span[0]:
+            span[0] = seconds
+        elif seconds > span[1]:
+            span[1] = seconds
+    
+    # Columns pickle far faster than a dict of tuples on the way to the merging process
+    columns = []
+    for shard_spans in spans:
+        shard_columns = {'uid': [], 'day': array('i'), 'first': array('q'), 'last': array('q')}
+        for (uid, day), (first, last) in shard_spans.items():
+            shard_columns['uid'].append(uid)
+            shard_columns['day'].append(day)
+            shard_columns['first'].append(first)
+            shard_columns['last'].append(last)
+        columns.append(shard_columns)
+    return {'punches': punches, 'spans': columns}
+
+
+def merge_shard(partials: List[Dict]) -> Dict[str, List[str]]:
+    """Merge one UID shard's spans from every partition into daily record columns (runs in a worker process)"""
+    merged = {}
+    for spans in partials:
+        for key, first, last in zip(zip(spans['uid'], spans['day']), spans['first'], spans['last']):
+            span = merged.get(key)
+            if span is None:
+                merged[key] = [first, last]
+            else:
+                if first < span[0]:
+                    span[0] = first
+                if last > span[1]:
+                    span[1] = last
+    
+    epoch = datetime(1970, 1, 1)
+    records = {'uid': [], 'date': [], 'checkIn': [], 'checkOut': []}
+    for (uid, day), (first, last) in merged.items():
+        records['uid'].append(uid)
+        records['date'].append((epoch + timedelta(days=day)).date().isoformat())
+        records['checkIn'].append((epoch + timedelta(seconds=first)).isoformat())
+        records['checkOut'].append((epoch + timedelta(seconds=last)).isoformat())
+    return records
+
+
+def parse_command_options(argv: List[str]) -> tuple:
+    """Split command arguments into positionals and --option value pairs"""
+    args, options = [], {}
+    remaining = list(argv)
+    while remaining:
+        if remaining[0].startswith('--') and len(remaining) > 1:
+            options[remaining[0]] = remaining[1]
+            remaining = remaining[2:]
+        else:
+            args.append(remaining.pop(0))
+    return args, options
+
+
+def parse_date_option(value: Optional[str], end_of_day: bool = False) -> Optional[datetime]:
+    """ISO date or datetime from the command line; a bare end date covers the whole day"""
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed
+
+
 class AttendanceSyncTool:
-    def __init__(self, base_url: str = "http://localhost:3000", sync_interval: int = 30):
+    FULL_SYNC_MAX_RESUMES = 3  # server restarts the full command rides out before giving up
+
+    def __init__(self, base_url: str = "http://localhost:3000", sync_interval: int = 30, max_workers: int = 1,
+                 sync_mode: str = "api", zk_timeout: int = 5, state_file: str = "sync_state.json",
+                 spool_file: str = "punch_spool.db", spool_batch_size: int = 5000,
+                 bulk_max_punches: int = 20000, bulk_max_latency: float = 2.0,
+                 scheduler: Optional[AdaptivePollScheduler] = None,
+                 breaker: Optional[DeviceCircuitBreaker] = None,
+                 limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 metrics_port: int = 0, metrics_host: str = "127.0.0.1",
+                 rotate_logs: bool = False, rotate_min_records: int = 10000, rotate_keep_days: int = 90,
+                 rotate_archive_dir: str = "rotated_logs", archive_dir: str = "punch_archive",
+                 worker_id: str = "", lease_seconds: int = 90, trace_dir: str = "", trace_keep: int = 100,
+                 status_file: str = "sync_status.json", status_interval: float = 5):
         """
         Initialize the sync tool
         
         Args:
             base_url: Base URL of the HR system API
             sync_interval: Sync interval in seconds (default: 30 seconds)
+            max_workers: Most devices synced in parallel (default: 1 = sequential)
+            sync_mode: "api" lets the server pull each device, "direct" pulls devices
+                here with pyzk and uploads only the parsed punches
+            zk_timeout: Device socket timeout in seconds for direct mode
+            state_file: JSON file holding per-device sync watermarks
+            spool_file: SQLite file buffering punches while the API is unreachable (direct mode)
+            spool_batch_size: Punches per request when replaying the spool
+            bulk_max_punches: Upload a bulk batch once it holds this many punches (direct mode)
+            bulk_max_latency: ...or once its oldest punch has waited this many seconds
+            scheduler: Optional adaptive per-device scheduler; None polls every device every cycle
+            breaker: Per-device circuit breaker (default: 3 failures, 30s-30min backoff)
+            limiter: Adaptive cap on device syncs in flight (default: max_workers, lowered while
+                the API pushes back)
+            metrics_port: Serve Prometheus metrics on this port while syncing continuously (0 = off)
+            metrics_host: Interface for the metrics endpoint
+            rotate_logs: Clear device logs once every punch on them is confirmed by the server (direct mode)
+            rotate_min_records: Only rotate a device holding at least this many records
+            rotate_keep_days: Days a cleared log is kept in rotate_archive_dir (0 = forever)
+            rotate_archive_dir: Where each cleared device log is saved before clearing
+            archive_dir: Columnar archive of every raw punch read in direct mode ('' = off)
+            worker_id: Share the devices with other instances, syncing only those the server
+                leases to this worker ('' = sync every device)
+            lease_seconds: How long a device lease lasts without a heartbeat
+            trace_dir: Write a Chrome trace file of every sync cycle here ('' = off)
+            trace_keep: Newest trace files kept in trace_dir (0 = all)
+            status_file: Where a running sync publishes its live state for the status command ('' = off)
+            status_interval: Seconds between live state updates
         """
         self.base_url = base_url.rstrip('/')
         self.sync_interval = sync_interval
+        self.max_workers = max(1, max_workers)
         self.session = requests.Session()
+        self.state = SyncStateStore(state_file)
+        self.limiter = limiter or AdaptiveConcurrencyLimiter(initial=self.max_workers, max_limit=self.max_workers)
+        # Size the connection pool so parallel device syncs don't queue on sockets
+        adapter = RateLimitedAdapter(self.limiter, pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.last_sync_times = {}
         self.known_devices = set()  # Track known device IDs
         self.device_check_interval = 5  # Check for new devices every 5 cycles
         self.cycle_count = 0
+        self.device_info = {}  # deviceId -> device record from the API
+        self.device_list = []  # last device list, reused while the server answers 304
+        self.device_list_etag = None
+        self.sync_mode = sync_mode
+        self.zk_timeout = zk_timeout
+        self.zk_pool = ZKConnectionPool(timeout=zk_timeout) if sync_mode == 'direct' else None
+        # Only direct mode holds punches locally; in api mode the watermark alone prevents loss
+        self.spool = PunchSpool(spool_file) if sync_mode == 'direct' else None
+        self.spool_batch_size = spool_batch_size
+        self.batcher = PunchBatcher(bulk_max_punches, bulk_max_latency) if sync_mode == 'direct' else None
+        self.archive = PunchArchive(archive_dir) if sync_mode == 'direct' and archive_dir else None
+        self._cycle_processed = 0
+        self._cycle_spooled = 0
+        self._cycle_lock = threading.Lock()
+        self.scheduler = scheduler
+        self.breaker = breaker or DeviceCircuitBreaker()
+        self.metrics_port = metrics_port
+        self._streams = {}  # device_id -> {'thread', 'stop', 'conn'} while streaming
+        self.metrics_host = metrics_host
+        self.rotate_logs = rotate_logs and sync_mode == 'direct'
+        self.rotate_min_records = rotate_min_records
+        self.rotate_keep_days = rotate_keep_days
+        self.rotate_archive_dir = rotate_archive_dir
+        self._ledger_lock = threading.Lock()
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.leased_devices = None  # device IDs leased to this worker, None before the first heartbeat
+        self._lease_deadline = 0.0  # monotonic time our last granted leases run out
+        self._next_heartbeat = 0.0
+        self._lease_lock = threading.Lock()
+        self.tracer = CycleTracer(trace_dir, keep=trace_keep) if trace_dir else None
+        self._profiles = None  # per-thread profilers of device syncs while run_profile is active
+        self._profiles_lock = threading.Lock()
+        self.status_file = status_file
+        self.status_interval = status_interval
+        self.started_at = datetime.now()
+        self._cycle_started_at = None  # while a cycle runs
+        self._last_cycle = None  # timing and totals of the last finished cycle
+        self.metrics = SyncMetrics()
+        self.metrics.gauge('attendance_sync_last_success_age_seconds', self._collect_last_success_age)
+        self.metrics.gauge('attendance_sync_spool_pending_punches', self._collect_spool_pending)
+        self.metrics.gauge('attendance_sync_backlog_age_seconds', self._collect_backlog_age)
+        self.metrics.gauge('attendance_sync_concurrency_limit', lambda: [({}, int(self.limiter.limit))])
+        self.metrics.gauge('attendance_sync_open_circuits', lambda: [({}, sum(
+            1 for entry in list(self.breaker.devices.values()) if entry['state'] != DeviceCircuitBreaker.CLOSED))])
+        self.session.hooks['response'].append(self._observe_api_response)
+        
+        # Restore last sync times from the previous run
+        for device_id in self.state.device_ids():
+            last_sync = self.state.get(device_id).get('last_sync')
+            if last_sync:
+                self.last_sync_times[device_id] = datetime.fromisoformat(last_sync)
         
         logger.info(f"Attendance Sync Tool initialized")
         logger.info(f"API Base URL: {self.base_url}")
         logger.info(f"Sync Interval: {self.sync_interval} seconds")
+        logger.info(f"Concurrency: {int(self.limiter.limit)}-{self.limiter.max_limit} device(s) in parallel, "
+                    f"adapted to API backpressure")
+        logger.info(f"Sync Mode: {self.sync_mode}")
+        logger.info(f"Sync State File: {state_file}")
+        if self.archive:
+            logger.info(f"Punch Archive: {archive_dir}")
+        if self.worker_id:
+            logger.info(f"Sharding: worker {self.worker_id}, {self.lease_seconds}s device leases")
+        if self.tracer:
+            logger.info(f"Cycle Traces: {trace_dir} (newest {trace_keep or 'all'} kept)")
+        if self.rotate_logs:
+            logger.info(f"Log Rotation: devices holding {self.rotate_min_records}+ confirmed records, "
+                        f"archived to {self.rotate_archive_dir} for {self.rotate_keep_days or 'unlimited'} days")
+        if self.scheduler:
+            logger.info(f"Adaptive Schedule: {self.scheduler.min_interval:g}-{self.scheduler.max_interval:g}s in office hours "
+                        f"({self.scheduler.office_start}-{self.scheduler.office_end}), "
+                        f"{self.scheduler.offhours_min_interval:g}-{self.scheduler.offhours_max_interval:g}s otherwise")
         logger.info(f"Mode: Attendance sync only (no employee sync)")
 
+    def _span(self, name: str, **args):
+        """Trace span when cycle tracing is on, otherwise a no-op"""
+        return self.tracer.span(name, **args) if self.tracer else nullcontext()
+
+    def _observe_api_response(self, response, *args, **kwargs):
+        """requests response hook: time every HR API call by endpoint"""
+        endpoint = re.sub(r'/device/[^/]+', '/device/:deviceId', requests.utils.urlparse(response.url).path)
+        self.metrics.observe('attendance_sync_api_request_duration_seconds', response.elapsed.total_seconds(),
+                             endpoint=endpoint, status=response.status_code)
+
+    def _collect_last_success_age(self) -> List[tuple]:
+        now = datetime.now()
+        return [({'device': device_id}, (now - last_sync).total_seconds())
+                for device_id, last_sync in list(self.last_sync_times.items())]
+
+    def _collect_spool_pending(self) -> List[tuple]:
+        pending = self.batcher.pending_count() if self.batcher else 0
+        if self.spool:
+            pending += self.spool.pending_count()
+        return [({}, pending)]
+
+    def _collect_backlog_age(self) -> List[tuple]:
+        oldest = self.spool.oldest_timestamp() if self.spool else None
+        if not oldest:
+            return [({}, 0)]
+        return [({}, max(0.0, (datetime.now() - datetime.fromisoformat(oldest)).total_seconds()))]
+
     def get_biometric_devices(self) -> List[Dict]:
         """Get list of all biometric devices and detect new ones"""
         try:
-            response = self.session.get(f"{self.base_url}/api/biometric-devices")
+            headers = {'If-None-Match': self.device_list_etag} if self.device_list_etag else {}
+            response = self.session.get(f"{self.base_url}/api/biometric-devices", headers=headers)
+            if response.status_code == 304:
+                # Device list unchanged since the last fetch
+                return self.device_list
             response.raise_for_status()
             devices = response.json()
+            self.device_list_etag = response.headers.get('ETag')
             
             # Extract device IDs from current devices
             current_device_ids = {device.get('deviceId') for device in devices if device.get('deviceId')}
@@ -73,26 +1544,56 @@ class AttendanceSyncTool:
                 # Clean up sync times for removed devices
                 for device_id in removed_devices:
                     self.last_sync_times.pop(device_id, None)
+                    self.device_info.pop(device_id, None)
+                    self.state.remove(device_id)
+                    if self.scheduler:
+                        self.scheduler.forget(device_id)
+                    self.breaker.forget(device_id)
+                    if self.zk_pool:
+                        self.zk_pool.close(device_id)
             
             # Update known devices
             self.known_devices = current_device_ids
+            for device in devices:
+                if device.get('deviceId'):
+                    self.device_info[device['deviceId']] = device
             
             logger.info(f"📋 Total active devices: {len(devices)} ({', '.join(current_device_ids)})")
+            self.device_list = devices
             return devices
         except requests.RequestException as e:
             logger.error(f"Failed to get biometric devices: {e}")
+            if self.spool and self.device_info:
+                # Keep pulling devices into the spool while the API is unavailable
+                logger.warning(f"📦 Using cached device list ({len(self.device_info)} devices), punches will be spooled")
+                return list(self.device_info.values())
             return []
 
     def sync_device(self, device_id: str, device_name: str = None) -> Dict:
         """Sync attendance data for a specific device (attendance only, no employee sync)"""
+        if self.sync_mode == 'direct':
+            return self.sync_device_direct(device_id, device_name)
+        
         try:
             display_name = device_name or device_id
             logger.info(f"🔄 Starting attendance sync for device: {display_name}")
             
-            response = self.session.post(f"{self.base_url}/api/auto-sync/device/{device_id}")
+            # Only ask for punches newer than this device's watermark
+            watermark = self.state.get(device_id)
+            params = {}
+            if watermark.get('last_timestamp'):
+                params['since'] = watermark['last_timestamp']
+                if watermark.get('record_count') is not None:
+                    params['count'] = watermark['record_count']
+            
+            request_started = time.perf_counter()
+            with self._span('api_request', endpoint='device', device=device_id):
+                response = self.session.post(f"{self.base_url}/api/auto-sync/device/{device_id}", params=params)
             response.raise_for_status()
             
             result = response.json()
+            if self.tracer:
+                self.tracer.add_server_phases(request_started, result.get('timings'), device=device_id)
             
             if result.get('success'):
                 raw_records = result.get('rawRecords', 0)
@@ -101,6 +1602,12 @@ class AttendanceSyncTool:
                 logger.info(f"✅ Device {display_name}: {raw_records} raw → {processed_records} attendance records saved")
                 
                 self.last_sync_times[device_id] = datetime.now()
+                self.state.update(
+                    device_id,
+                    last_timestamp=result.get('lastTimestamp') or watermark.get('last_timestamp'),
+                    record_count=result.get('totalRecords'),
+                    last_sync=self.last_sync_times[device_id].isoformat()
+                )
                 
                 return {
                     'success': True,
@@ -112,11 +1619,293 @@ class AttendanceSyncTool:
             else:
                 error_msg = result.get('message', 'Unknown error')
                 logger.error(f"❌ Sync failed for device {display_name}: {error_msg}")
-                return {'success': False, 'device_id': device_id, 'device_name': display_name, 'error': error_msg}
+                return {'success': False, 'device_id': device_id, 'device_name': display_name, 'error': error_msg,
+                        'error_class': 'ServerError'}
                 
         except requests.RequestException as e:
             logger.error(f"🌐 Network error syncing device {display_name}: {e}")
-            return {'success': False, 'device_id': device_id, 'device_name': display_name, 'error': str(e)}
+            return {'success': False, 'device_id': device_id, 'device_name': display_name, 'error': str(e),
+                    'error_class': type(e).__name__}
+
+    @staticmethod
+    def _parse_watermark(value: Optional[str]) -> Optional[datetime]:
+        """Parse a stored watermark into the naive local time pyzk uses"""
+        if not value:
+            return None
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            # Written by the server in api mode (UTC)
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        return parsed
+
+    @staticmethod
+    def parse_punches(records) -> List[Dict]:
+        """Convert pyzk Attendance objects into the punch format the API expects"""
+        punches = []
+        for record in records:
+            uid = str(record.user_id).strip()
+            # Same filter as the server: drop empty UIDs and year-2000 placeholder logs
+            if not uid or uid == '0' or record.timestamp.year < 2020:
+                continue
+            punches.append({
+                'uid': uid,
+                'timestamp': record.timestamp.isoformat(),
+                'state': record.status,
+                'type': record.punch
+            })
+        return punches
+
+    def sync_device_direct(self, device_id: str, device_name: str = None) -> Dict:
+        """Pull attendance straight from the device and queue the parsed punches for bulk upload"""
+        display_name = device_name or device_id
+        device = self.device_info.get(device_id, {})
+        
+        watermark = self.state.get(device_id)
+        if self.rotate_logs and 'ledger_count' not in watermark:
+            # Rotation needs the server to have confirmed every punch on the device; re-sending
+            # the whole log once is harmless (the server merges) and starts that ledger
+            logger.info(f"🧾 Device {display_name}: re-sending its log once to start the rotation ledger")
+            self.state.update(device_id, last_timestamp=None, record_count=None, ledger_count=0, ledger_checksum=0)
+            watermark = self.state.get(device_id)
+        since = self._parse_watermark(watermark.get('last_timestamp'))
+        
+        try:
+            logger.info(f"🔄 Starting direct attendance sync for device: {display_name}")
+            
+            with self._span('device_pull', device=device_id):
+                records, record_count = self.zk_pool.get_attendance(
+                    device_id, device.get('ip'), int(device.get('port') or 4370),
+                    known_count=watermark.get('record_count') if since else None
+                )
+            if since:
+                # The watermark's second is read again (1s resolution), skipping only UIDs already sent in it
+                sent = set(watermark.get('boundary_uids') or ())
+                records = [record for record in records if record.timestamp > since
+                           or (record.timestamp == since and str(record.user_id).strip() not in sent)]
+            punches = self.parse_punches(records)
+        except Exception as e:
+            logger.error(f"📡 Device error syncing {display_name}: {e}")
+            return {'success': False, 'device_id': device_id, 'device_name': display_name, 'error': str(e),
+                    'error_class': type(e).__name__}
+        
+        boundary_uids = watermark.get('boundary_uids') or []
+        if records:
+            newest = max(record.timestamp for record in records)
+            last_timestamp = newest.isoformat()
+            if newest != since:
+                boundary_uids = []
+            boundary_uids = sorted(set(boundary_uids) | {str(record.user_id).strip()
+                                                         for record in records if record.timestamp == newest})
+        else:
+            last_timestamp = watermark.get('last_timestamp')
+        
+        with self._span('archive', device=device_id):
+            self._archive_punches(device_id, punches)
+        
+        # Punches are uploaded in bulk batches; anything that fails to upload is spooled,
+        # so the watermark can move past them once they are queued (never before)
+        flush = bool(punches) and self.batcher.add(device_id, punches)
+        self.last_sync_times[device_id] = datetime.now()
+        self.state.update(device_id, last_timestamp=last_timestamp, boundary_uids=boundary_uids,
+                          record_count=record_count, last_sync=self.last_sync_times[device_id].isoformat())
+        
+        if not punches:
+            logger.info(f"✅ Device {display_name}: no new punches")
+            return {'success': True, 'device_id': device_id, 'device_name': display_name,
+                    'raw_records': 0, 'processed_records': 0}
+        
+        logger.info(f"✅ Device {display_name}: {len(punches)} new punches queued for upload")
+        if flush:
+            self.flush_punches()
+        
+        return {
+            'success': True,
+            'device_id': device_id,
+            'device_name': display_name,
+            'raw_records': len(punches),
+            'processed_records': 0
+        }
+
+    def _archive_punches(self, device_id: str, punches: List[Dict]):
+        """Keep raw punches locally; a full disk must not stop them reaching the server"""
+        if not self.archive or not punches:
+            return
+        try:
+            added = self.archive.append(device_id, punches)
+        except OSError as e:
+            logger.warning(f"🗄️ Could not archive punches from device {device_id}: {e}")
+            return
+        self.metrics.inc('attendance_sync_archived_punches_total', added, device=device_id)
+
+    def upload_bulk(self, device_punches: Dict[str, List[Dict]]) -> Dict:
+        """Send punches for many devices in one compressed request"""
+        punch_count = sum(len(punches) for punches in device_punches.values())
+        try:
+            with self._span('encode_bulk', punches=punch_count):
+                body = PunchBatcher.encode(device_punches)
+            request_started = time.perf_counter()
+            with self._span('api_request', endpoint='punches/bulk', punches=punch_count):
+                response = self.session.post(
+                    f"{self.base_url}/api/auto-sync/punches/bulk",
+                    data=body,
+                    headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+                )
+            response.raise_for_status()
+            result = response.json()
+            if self.tracer:
+                self.tracer.add_server_phases(request_started, result.get('timings'), endpoint='punches/bulk')
+            
+            if result.get('success'):
+                for device_id in result.get('unknownDevices', []):
+                    logger.warning(f"⚠️ Server does not know device {device_id}, its punches were dropped")
+                return {'success': True, 'raw_records': result.get('rawRecords', 0),
+                        'processed_records': result.get('processedRecords', 0),
+                        'unknown_devices': result.get('unknownDevices', [])}
+            
+            error_msg = result.get('message', 'Unknown error')
+        except (requests.RequestException, ValueError) as e:
+            error_msg = str(e)
+        
+        logger.error(f"🌐 Bulk upload of {punch_count} punches from {len(device_punches)} devices failed: {error_msg}")
+        return {'success': False, 'error': error_msg}
+
+    def flush_punches(self) -> int:
+        """Upload the pending bulk batch, spooling it if the upload fails"""
+        if not self.batcher:
+            return 0
+        
+        batch = self.batcher.take()
+        if not batch:
+            return 0
+        
+        result = self.upload_bulk(batch)
+        if result['success']:
+            self._record_ingested(batch, result['unknown_devices'])
+            logger.info(f"📤 Bulk upload: {result['raw_records']} punches from {len(batch)} devices → "
+                        f"{result['processed_records']} attendance records saved")
+            with self._cycle_lock:
+                self._cycle_processed += result['processed_records']
+            return result['processed_records']
+        
+        spooled = sum(self.spool.append(device_id, punches) for device_id, punches in batch.items())
+        logger.warning(f"📦 Spooled {spooled} punches ({self.spool.pending_count()} pending)")
+        with self._cycle_lock:
+            self._cycle_spooled += spooled
+        return 0
+
+    def replay_spool(self) -> int:
+        """Upload spooled punches in large bulk batches; stops at the first failure"""
+        if not self.spool:
+            return 0
+        
+        replayed = 0
+        while True:
+            row_ids, device_punches = self.spool.fetch_pending(self.spool_batch_size)
+            if not row_ids:
+                break
+            
+            result = self.upload_bulk(device_punches)
+            if not result['success']:
+                logger.warning(f"📦 Spool replay paused ({self.spool.pending_count()} punches pending)")
+                break
+            
+            # Punches for devices the server no longer knows are dropped server-side, so ack them too
+            self.spool.ack(row_ids)
+            self._record_ingested(device_punches, result['unknown_devices'])
+            replayed += len(row_ids)
+        
+        if replayed:
+            logger.info(f"📤 Replayed {replayed} spooled punches")
+        return replayed
+
+    @staticmethod
+    def punch_checksum(punches: List[Dict]) -> int:
+        """Order-independent checksum of punches: 64-bit digests of (uid, timestamp) summed mod 2^64"""
+        total = 0
+        for punch in punches:
+            digest = hashlib.blake2b(f"{punch['uid']}|{punch['timestamp']}".encode('utf-8'), digest_size=8).digest()
+            total += int.from_bytes(digest, 'big')
+        return total % 2**64
+
+    def _record_ingested(self, device_punches: Dict[str, List[Dict]], unknown_devices: List[str]):
+        """Add punches the server accepted to each device's rotation ledger"""
+        if not self.rotate_logs:
+            return
+        with self._ledger_lock:
+            for device_id, punches in device_punches.items():
+                entry = self.state.get(device_id)
+                if device_id in unknown_devices or 'ledger_count' not in entry:
+                    continue
+                self.state.update(device_id, ledger_count=entry['ledger_count'] + len(punches),
+                                  ledger_checksum=(entry['ledger_checksum'] + self.punch_checksum(punches)) % 2**64)
+
+    def renew_leases(self) -> Optional[set]:
+        """
+        Heartbeat to the server and return the device IDs leased to this worker,
+        or None when sharding is off. The server splits the devices between live
+        workers by rendezvous hashing and only hands over a device once its
+        previous owner released it or let its lease expire, so no device is
+        pulled by two workers. While the server is unreachable the last leases
+        are used until they would have expired, then this worker stops pulling.
+        """
+        if not self.worker_id:
+            return None
+        with self._lease_lock:
+            return self._renew_leases()
+
+    def _renew_leases(self) -> set:
+        now = time.monotonic()
+        if self.leased_devices is not None and now < self._next_heartbeat:
+            return self.leased_devices
+        
+        previous = self.leased_devices or set()
+        try:
+            response = self.session.post(f"{self.base_url}/api/sync-workers/heartbeat",
+                                         json={'workerId': self.worker_id, 'hostname': socket.gethostname(),
+                                               'leaseSeconds': self.lease_seconds},
+                                         timeout=10)
+            response.raise_for_status()
+            result = response.json()
+            leased = set(result.get('deviceIds', []))
+            # Measured from before the request, so we never trust a lease longer than the server does
+            self._lease_deadline = now + self.lease_seconds
+            self._next_heartbeat = now + self.lease_seconds / 3
+            if leased != previous:
+                logger.info(f"🔑 Leased {len(leased)} of {result.get('totalDevices', '?')} devices "
+                            f"across {result.get('workers', '?')} workers")
+            if result.get('waiting'):
+                logger.info(f"🔑 {result['waiting']} devices assigned here are still leased to another worker")
+        except requests.exceptions.RequestException as e:
+            # Retry soon, and never trust the old leases past their deadline
+            self._next_heartbeat = now + 5 if now >= self._lease_deadline else min(now + 5, self._lease_deadline)
+            if now < self._lease_deadline:
+                logger.warning(f"⚠️ Lease heartbeat failed ({e}); keeping current leases for "
+                               f"{self._lease_deadline - now:.0f}s")
+                return previous
+            if previous:
+                logger.error(f"❌ Lease heartbeat failed ({e}) and leases expired; pausing device sync")
+            leased = set()
+        
+        for device_id in previous - leased:
+            # Another worker owns it now; don't keep its only TCP session busy
+            if self.zk_pool:
+                self.zk_pool.close(device_id)
+            if self.scheduler:
+                self.scheduler.forget(device_id)
+        self.leased_devices = leased
+        return leased
+
+    def release_leases(self):
+        """Hand this worker's devices back so the others pick them up without waiting for expiry"""
+        if not self.worker_id or self.leased_devices is None:
+            return
+        try:
+            response = self.session.delete(f"{self.base_url}/api/sync-workers/{self.worker_id}", timeout=10)
+            response.raise_for_status()
+            logger.info(f"🔑 Released {response.json().get('released', 0)} device leases")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"⚠️ Could not release device leases ({e}); they expire in {self.lease_seconds}s")
+        self.leased_devices = None
 
     def sync_all_devices(self) -> Dict:
         """Sync all biometric devices (attendance data only)"""
@@ -124,7 +1913,21 @@ class AttendanceSyncTool:
         if self.cycle_count % self.device_check_interval == 0:
             logger.info(f"🔍 Checking for device changes (cycle #{self.cycle_count})")
         
-        devices = self.get_biometric_devices()
+        cycle_started = time.monotonic()
+        with self._span('discover_devices'):
+            devices = self.get_biometric_devices()
+        with self._span('renew_leases'):
+            leased = self.renew_leases()
+        if leased is not None:
+            devices = [device for device in devices if device.get('deviceId') in leased]
+        
+        with self._cycle_lock:
+            self._cycle_processed = 0
+            self._cycle_spooled = 0
+        
+        if self.spool and self.spool.pending_count():
+            with self._span('replay_spool'):
+                self.replay_spool()
         
         if not devices:
             logger.warning("⚠️ No devices found to sync")
@@ -139,6 +1942,7 @@ class AttendanceSyncTool:
             'total_processed_records': 0
         }
         
+        targets = []
         for device in devices:
             device_id = device.get('deviceId')
             device_name = device.get('deviceName', device_id)
@@ -146,19 +1950,79 @@ class AttendanceSyncTool:
             if not device_id:
                 logger.warning(f"⚠️ Device missing deviceId: {device}")
                 continue
-                
-            result = self.sync_device(device_id, device_name)
+            
+            targets.append((device_id, device_name))
+        
+        if self.scheduler:
+            # Only poll devices whose adaptive interval has elapsed
+            due_targets = [target for target in targets if self.scheduler.is_due(target[0])]
+            results['skipped_not_due'] = len(targets) - len(due_targets)
+            targets = due_targets
+        
+        # Devices with an open circuit don't get to eat into the cycle
+        open_circuit = [target[0] for target in targets if not self.breaker.allow(target[0])]
+        if open_circuit:
+            logger.info(f"⛔ Skipping {len(open_circuit)} devices with open circuit: {', '.join(open_circuit)}")
+            targets = [target for target in targets if target[0] not in open_circuit]
+        results['skipped_open_circuit'] = len(open_circuit)
+        results['total_devices'] = len(targets)
+        
+        if self.max_workers > 1:
+            device_results = self._sync_devices_parallel(targets)
+        else:
+            device_results = []
+            for device_id, device_name in targets:
+                device_results.append(self._timed_sync_device(device_id, device_name))
+        
+        lost = [result['device_id'] for result in device_results if result.get('lease_lost')]
+        if lost:
+            logger.info(f"🔑 Skipped {len(lost)} devices whose lease moved mid-cycle: {', '.join(lost)}")
+            device_results = [result for result in device_results if not result.get('lease_lost')]
+            results['total_devices'] -= len(lost)
+        
+        for result in device_results:
             results['device_results'].append(result)
             
             if result['success']:
                 results['successful_syncs'] += 1
                 results['total_raw_records'] += result.get('raw_records', 0)
                 results['total_processed_records'] += result.get('processed_records', 0)
+                self.metrics.inc('attendance_sync_raw_records_total', result.get('raw_records', 0), device=result['device_id'])
+                self.metrics.inc('attendance_sync_processed_records_total', result.get('processed_records', 0),
+                                 device=result['device_id'])
             else:
                 results['failed_syncs'] += 1
-                
-            # Small delay between device syncs to avoid overwhelming the system
-            time.sleep(1)
+                self.metrics.inc('attendance_sync_failures_total', device=result['device_id'],
+                                 error_class=result.get('error_class', 'SyncError'))
+            
+            if self.scheduler:
+                self.scheduler.record(result['device_id'], result.get('raw_records', 0), result['success'])
+            
+            if result['success']:
+                self.breaker.record_success(result['device_id'])
+            else:
+                delay = self.breaker.record_failure(result['device_id'])
+                if delay is not None:
+                    logger.warning(f"⛔ Circuit opened for device {result['device_name']}, next probe in {delay:.0f}s")
+        
+        if self.batcher:
+            # Upload whatever is still queued, then fold bulk results into the summary
+            with self._span('flush_punches'):
+                self.flush_punches()
+            with self._cycle_lock:
+                results['total_processed_records'] += self._cycle_processed
+                results['spooled_punches'] = self._cycle_spooled
+        
+        if self.rotate_logs:
+            with self._span('rotate_logs'):
+                self.rotate_device_logs([result['device_id'] for result in device_results if result['success']])
+        
+        # Persist watermarks once per cycle
+        with self._span('save_state'):
+            self.state.save()
+        
+        self.metrics.observe('attendance_sync_cycle_duration_seconds', time.monotonic() - cycle_started)
+        self.metrics.inc('attendance_sync_cycles_total')
         
         # Log summary
         success_rate = (results['successful_syncs'] / results['total_devices']) * 100 if results['total_devices'] > 0 else 0
@@ -167,6 +2031,160 @@ class AttendanceSyncTool:
         
         return results
 
+    def _timed_sync_device(self, device_id: str, device_name: str) -> Dict:
+        """Sync one device and record how long it took"""
+        if self.worker_id and device_id not in self.renew_leases():
+            # A long cycle outlived the lease and the device moved to another worker
+            return {'success': False, 'lease_lost': True, 'device_id': device_id, 'device_name': device_name}
+        # The limiter, not a fixed sleep, paces device syncs against the API
+        with self._span('limiter_wait', device=device_id):
+            self.limiter.acquire()
+        profiler = self._start_thread_profiler()
+        log_context.device = device_id
+        try:
+            started = time.monotonic()
+            with self._span('sync_device', device=device_id):
+                result = self.sync_device(device_id, device_name)
+        finally:
+            log_context.device = None
+            self.limiter.release()
+            self._stop_thread_profiler(profiler)
+        self.metrics.observe('attendance_sync_device_duration_seconds', time.monotonic() - started, device=device_id)
+        return result
+
+    def _start_thread_profiler(self) -> Optional[cProfile.Profile]:
+        """cProfile only sees the thread that enabled it, so pool threads profile themselves"""
+        if self._profiles is None or threading.current_thread() is threading.main_thread():
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None  # Python 3.12+: the main profiler already covers every thread
+        return profiler
+
+    def _stop_thread_profiler(self, profiler: Optional[cProfile.Profile]):
+        if profiler is None:
+            return
+        profiler.disable()
+        with self._profiles_lock:
+            self._profiles.append(profiler)
+
+    def _sync_devices_parallel(self, targets: List[tuple]) -> List[Dict]:
+        """Sync devices on a thread pool, returning results in device order"""
+        device_results: List[Optional[Dict]] = [None] * len(targets)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='device-sync') as executor:
+            futures = {
+                executor.submit(self._timed_sync_device, device_id, device_name): index
+                for index, (device_id, device_name) in enumerate(targets)
+            }
+            
+            for future in as_completed(futures):
+                index = futures[future]
+                device_id, device_name = targets[index]
+                try:
+                    device_results[index] = future.result()
+                except Exception as e:
+                    # A single misbehaving device must not abort the whole cycle
+                    logger.error(f"💥 Unexpected error syncing device {device_name}: {e}")
+                    device_results[index] = {'success': False, 'device_id': device_id, 'device_name': device_name,
+                                             'error': str(e), 'error_class': type(e).__name__}
+        
+        return device_results
+
+    # A device whose rotation was refused is not checked again for this long
+    ROTATION_RETRY_SECONDS = 3600
+
+    def rotate_device_logs(self, device_ids: List[str]):
+        """Clear the logs of devices whose every punch the server has confirmed (ROTATE_LOGS)"""
+        if self.batcher.pending_count() or self.spool.pending_count():
+            logger.info("🧾 Log rotation postponed: punches are still waiting to be uploaded")
+            return
+        
+        now = time.time()
+        for device_id in device_ids:
+            entry = self.state.get(device_id)
+            if 'ledger_count' not in entry or (entry.get('record_count') or 0) < self.rotate_min_records:
+                continue
+            if now - entry.get('rotation_checked_at', 0) < self.ROTATION_RETRY_SECONDS:
+                continue
+            self.state.update(device_id, rotation_checked_at=now)
+            result = self._rotate_device_log(device_id, entry)
+            self.metrics.inc('attendance_sync_log_rotations_total', device=device_id, result=result)
+
+    def _rotate_device_log(self, device_id: str, entry: Dict) -> str:
+        """Verify the device log against the ledger, archive it and clear the device"""
+        device = self.device_info.get(device_id, {})
+        display_name = device.get('deviceName', device_id)
+        watermark = self._parse_watermark(entry.get('last_timestamp'))
+        outcome = {}
+        
+        def verify(records) -> bool:
+            if watermark is None or any(record.timestamp > watermark for record in records):
+                outcome['result'] = 'behind'
+                return False
+            punches = self.parse_punches(records)
+            checksum = self.punch_checksum(punches)
+            if len(punches) != entry['ledger_count'] or checksum != entry['ledger_checksum']:
+                outcome['result'] = 'mismatch'
+                outcome['detail'] = (f"device holds {len(punches)} punches (checksum {checksum:016x}), "
+                                     f"server confirmed {entry['ledger_count']} ({entry['ledger_checksum']:016x})")
+                return False
+            outcome['archive'] = self._archive_device_log(device_id, records)
+            outcome['result'] = 'rotated'
+            outcome['records'] = len(records)
+            return True
+        
+        try:
+            self.zk_pool.rotate_attendance(device_id, device.get('ip'), int(device.get('port') or 4370), verify)
+        except Exception as e:
+            logger.error(f"🧾 Log rotation of device {display_name} failed, log left in place: {e}")
+            return 'error'
+        
+        result = outcome['result']
+        if result == 'rotated':
+            self.state.update(device_id, record_count=0, ledger_count=0, ledger_checksum=0)
+            self.state.save()
+            logger.info(f"🧾 Device {display_name}: cleared {outcome['records']} verified records "
+                        f"(archived to {outcome['archive']})")
+            self._prune_archives()
+        elif result == 'behind':
+            # Punched since this cycle read it; try again after the next sync
+            self.state.update(device_id, rotation_checked_at=0)
+            logger.info(f"🧾 Device {display_name}: rotation deferred, new punches since the last sync")
+        else:
+            # Re-send the whole log (the server merges) so the ledger is exact again
+            logger.warning(f"🧾 Device {display_name}: log not cleared, {outcome['detail']}; re-sending the log")
+            self.state.update(device_id, last_timestamp=None, record_count=None, ledger_count=0, ledger_checksum=0)
+        return result
+
+    def _archive_device_log(self, device_id: str, records) -> str:
+        """Write a device's full log to a gzip JSON-lines file, durably, before it is cleared"""
+        os.makedirs(self.rotate_archive_dir, exist_ok=True)
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', device_id)
+        path = os.path.join(self.rotate_archive_dir, f"{safe_id}_{datetime.now().strftime('%Y%m%dT%H%M%S')}.jsonl.gz")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                for record in records:
+                    f.write(json.dumps({'uid': str(record.user_id).strip(), 'timestamp': record.timestamp.isoformat(),
+                                        'state': record.status, 'type': record.punch}).encode('utf-8') + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+        return path
+
+    def _prune_archives(self):
+        """Delete rotated logs older than the keep window"""
+        if not self.rotate_keep_days:
+            return
+        cutoff = time.time() - self.rotate_keep_days * 86400
+        for archive in os.scandir(self.rotate_archive_dir):
+            if archive.name.endswith('.jsonl.gz') and archive.stat().st_mtime < cutoff:
+                os.remove(archive.path)
+                logger.info(f"🧹 Removed rotated log {archive.name}")
+
     def check_api_health(self) -> bool:
         """Check if the API is accessible"""
         try:
@@ -192,12 +2210,27 @@ class AttendanceSyncTool:
         print("="*70)
         print(f"🌐 API URL: {self.base_url}")
         print(f"⏱️ Sync Interval: {self.sync_interval} seconds")
+        print(f"🧵 Concurrency: {self.limiter.describe()}")
+        print(f"🔀 Sync Mode: {self.sync_mode}")
+        if self.spool:
+            print(f"📦 Spooled Punches: {self.spool.pending_count()}")
         print(f"🕐 Current Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"🔄 Sync Cycles: {self.cycle_count}")
         print(f"📱 Known Devices: {len(self.known_devices)}")
         
         if self.known_devices:
             print(f"🔗 Active Devices: {', '.join(sorted(self.known_devices))}")
+        if self.worker_id:
+            leased = sorted(self.leased_devices) if self.leased_devices is not None else []
+            print(f"🔑 Worker {self.worker_id}: {len(leased)} leased devices"
+                  + (f" ({', '.join(leased)})" if leased else ""))
+        
+        tripped = {device_id: self.breaker.describe(device_id) for device_id in sorted(self.breaker.devices)
+                   if self.breaker.devices[device_id]['state'] != DeviceCircuitBreaker.CLOSED}
+        if tripped:
+            print("\n⛔ Circuit Breakers:")
+            for device_id, description in tripped.items():
+                print(f"  🔴 {device_id}: {description}")
         
         if self.last_sync_times:
             print("\n📅 Last Sync Times:")
@@ -205,6 +2238,13 @@ class AttendanceSyncTool:
                 time_diff = datetime.now() - last_sync
                 status = "🟢" if time_diff.seconds < 120 else "🟡" if time_diff.seconds < 300 else "🔴"
                 print(f"  {status} {device_id}: {last_sync.strftime('%Y-%m-%d %H:%M:%S')}")
+                if self.scheduler and device_id in self.scheduler.intervals:
+                    print(f"      ↳ polled every {self.scheduler.intervals[device_id]:.0f}s")
+                watermark = self.state.get(device_id)
+                if watermark.get('last_timestamp'):
+                    print(f"      ↳ last punch {watermark['last_timestamp']}, {watermark.get('record_count', '?')} records on device")
+                if 'ledger_count' in watermark:
+                    print(f"      ↳ {watermark['ledger_count']} punches confirmed by the server since the last rotation")
         else:
             print("\n⚠️ No syncs performed yet")
         
@@ -212,8 +2252,172 @@ class AttendanceSyncTool:
         print("💡 Note: This tool syncs ATTENDANCE data only (no employee sync)")
         print("🔄 New devices added to web app will be auto-detected")
 
-    def run_continuous_sync(self):
-        """Run continuous attendance sync in a loop with dynamic device detection"""
+    def _start_status_publisher(self, mode: str) -> Optional[StatusPublisher]:
+        if not self.status_file:
+            return None
+        publisher = StatusPublisher(self.status_file, lambda: self._collect_status(mode), self.status_interval)
+        publisher.start()
+        logger.info(f"📡 Live status published to {self.status_file} every {self.status_interval:g}s")
+        return publisher
+
+    def _collect_status(self, mode: str) -> Dict:
+        """Snapshot of this process for the status command; called from the publisher thread"""
+        now = datetime.now()
+        devices = {}
+        for device_id in sorted(set(self.known_devices) | set(self.state.device_ids())):
+            watermark = self.state.get(device_id)
+            last_sync = self.last_sync_times.get(device_id)
+            entry = {
+                'name': self.device_info.get(device_id, {}).get('deviceName', device_id),
+                'last_sync': last_sync.isoformat() if last_sync else None,
+                'last_punch': watermark.get('last_timestamp'),
+                'record_count': watermark.get('record_count'),
+                'breaker': self.breaker.describe(device_id),
+            }
+            if self.scheduler and device_id in self.scheduler.intervals:
+                entry['poll_interval_seconds'] = round(self.scheduler.intervals[device_id], 1)
+            if 'ledger_count' in watermark:
+                entry['ledger_count'] = watermark['ledger_count']
+            if mode == 'stream':
+                stream = self._streams.get(device_id)
+                entry['stream'] = 'live' if stream and stream['conn'] is not None else 'polling' if stream else 'stopped'
+            devices[device_id] = entry
+        
+        oldest = self.spool.oldest_timestamp() if self.spool else None
+        return {
+            'state': 'running',
+            'mode': mode,
+            'pid': os.getpid(),
+            'hostname': socket.gethostname(),
+            'started_at': self.started_at.isoformat(),
+            'api_url': self.base_url,
+            'sync_mode': self.sync_mode,
+            'sync_interval': self.sync_interval,
+            'cycle_count': self.cycle_count,
+            'cycle_running_seconds': round((now - self._cycle_started_at).total_seconds(), 1)
+            if self._cycle_started_at else None,
+            'last_cycle': self._last_cycle,
+            'concurrency': {'limit': int(self.limiter.limit), 'max': self.limiter.max_limit,
+                            'in_flight': self.limiter.in_flight, 'summary': self.limiter.describe()},
+            'queue': {
+                'batch_pending': self.batcher.pending_count() if self.batcher else 0,
+                'spool_pending': self.spool.pending_count() if self.spool else 0,
+                'backlog_age_seconds': round(max(0.0, (now - datetime.fromisoformat(oldest)).total_seconds()), 1)
+                if oldest else 0,
+            },
+            'worker': {'id': self.worker_id, 'leased_devices': sorted(self.leased_devices or [])}
+            if self.worker_id else None,
+            'devices': devices,
+        }
+
+    def print_live_status(self, path: str) -> bool:
+        """Print the state a running sync published to `path`; False when there is none"""
+        snapshot = StatusPublisher.read(path) if path else None
+        if not snapshot:
+            return False
+        
+        now = datetime.now()
+        age = (now - datetime.fromisoformat(snapshot['updated_at'])).total_seconds()
+        print("\n" + "="*70)
+        print("📊 ATTENDANCE SYNC DAEMON STATUS (live)")
+        print("="*70)
+        state = snapshot.get('state', 'running')
+        print(f"🖥️ Process: {snapshot.get('pid')} on {snapshot.get('hostname')}, {snapshot.get('mode')} since "
+              f"{snapshot.get('started_at', '?')[:19].replace('T', ' ')}")
+        if state == 'stopped':
+            print(f"⏹️ State: stopped ({age:.0f}s ago)")
+        elif age > max(30, 3 * snapshot.get('publish_interval', 5)):
+            print(f"⚠️ State: no update for {age:.0f}s - the sync process may have died")
+        else:
+            print(f"🟢 State: running (updated {age:.0f}s ago)")
+        print(f"🌐 API URL: {snapshot.get('api_url')}")
+        print(f"🔀 Sync Mode: {snapshot.get('sync_mode')}, every {snapshot.get('sync_interval')} seconds")
+        print(f"🧵 Concurrency: {snapshot['concurrency']['summary']}")
+        queue = snapshot.get('queue', {})
+        print(f"📦 Queue: {queue.get('batch_pending', 0)} punches batched, {queue.get('spool_pending', 0)} spooled"
+              + (f", oldest {queue['backlog_age_seconds']:.0f}s old" if queue.get('backlog_age_seconds') else ""))
+        print(f"🔄 Sync Cycles: {snapshot.get('cycle_count', 0)}")
+        if snapshot.get('cycle_running_seconds') is not None:
+            print(f"   ↳ cycle in progress for {snapshot['cycle_running_seconds']:.0f}s")
+        last_cycle = snapshot.get('last_cycle')
+        if last_cycle:
+            print(f"   ↳ last cycle #{last_cycle['cycle']} took {last_cycle['duration_seconds']:.1f}s: "
+                  f"{last_cycle['successful_syncs']}/{last_cycle['devices']} devices, "
+                  f"{last_cycle['raw_records']} raw → {last_cycle['processed_records']} records")
+        worker = snapshot.get('worker')
+        if worker:
+            print(f"🔑 Worker {worker['id']}: {len(worker['leased_devices'])} leased devices")
+        
+        devices = snapshot.get('devices', {})
+        if devices:
+            print(f"\n📅 Devices ({len(devices)}):")
+            for device_id, device in devices.items():
+                if device.get('last_sync'):
+                    since = (now - datetime.fromisoformat(device['last_sync'])).total_seconds()
+                    marker = "🟢" if since < 120 else "🟡" if since < 300 else "🔴"
+                    line = f"  {marker} {device_id}: last sync {device['last_sync'][:19].replace('T', ' ')}"
+                else:
+                    line = f"  ⚪ {device_id}: not synced yet"
+                if device.get('breaker', 'closed') != 'closed':
+                    line += f" ⛔ {device['breaker']}"
+                if device.get('stream'):
+                    line += f" [{device['stream']}]"
+                print(line)
+                if device.get('last_punch'):
+                    print(f"      ↳ last punch {device['last_punch']}, {device.get('record_count', '?')} records on device")
+                if device.get('poll_interval_seconds'):
+                    print(f"      ↳ polled every {device['poll_interval_seconds']:.0f}s")
+        print("="*70)
+        return True
+
+    def _start_metrics_server(self) -> Optional[ThreadingHTTPServer]:
+        if not self.metrics_port:
+            return None
+        server = self.metrics.serve(self.metrics_host, self.metrics_port)
+        logger.info(f"📈 Metrics available at http://{self.metrics_host}:{self.metrics_port}/metrics")
+        return server
+
+    def _run_cycle(self, publisher: Optional[StatusPublisher] = None) -> Dict:
+        """One sync cycle: timed for the live status and published once it is done"""
+        self._cycle_started_at = datetime.now()
+        started = time.monotonic()
+        try:
+            results = self._traced_cycle()
+        finally:
+            self._cycle_started_at = None
+        self._last_cycle = {
+            'cycle': self.cycle_count,
+            'finished_at': datetime.now().isoformat(),
+            'duration_seconds': round(time.monotonic() - started, 3),
+            'devices': results.get('total_devices', 0),
+            'successful_syncs': results.get('successful_syncs', 0),
+            'failed_syncs': results.get('failed_syncs', 0),
+            'raw_records': results.get('total_raw_records', 0),
+            'processed_records': results.get('total_processed_records', 0),
+        }
+        if publisher:
+            publisher.publish()
+        return results
+
+    def _traced_cycle(self) -> Dict:
+        """One sync cycle, written to a trace file when tracing is on"""
+        if not self.tracer:
+            return self.sync_all_devices()
+        
+        self.tracer.start_cycle(self.cycle_count)
+        try:
+            with self.tracer.span('cycle', cycle=self.cycle_count):
+                return self.sync_all_devices()
+        finally:
+            try:
+                path = self.tracer.finish_cycle()
+                if path:
+                    logger.info(f"🧭 Cycle trace written to {path}")
+            except OSError as e:
+                logger.warning(f"🧭 Could not write cycle trace: {e}")
+
+    def run_continuous_sync(self, max_cycles: int = 0):
+        """Run continuous attendance sync in a loop with dynamic device detection (max_cycles 0 = forever)"""
         logger.info("🚀 Starting continuous attendance sync...")
         logger.info("📱 Dynamic device detection enabled - new devices will be auto-discovered")
         
@@ -226,21 +2430,32 @@ class AttendanceSyncTool:
         logger.info("🔍 Initial device discovery...")
         self.get_biometric_devices()
         
+        metrics_server = self._start_metrics_server()
+        publisher = self._start_status_publisher('continuous')
+        
         try:
             while True:
                 self.cycle_count += 1
                 logger.info(f"\n--- 🔄 Sync Cycle #{self.cycle_count} ---")
                 
                 # Perform sync (with dynamic device detection)
-                results = self.sync_all_devices()
+                results = self._run_cycle(publisher)
                 
                 # Print detailed status every 10 cycles
                 if self.cycle_count % 10 == 0:
                     self.print_status()
                 
+                if max_cycles and self.cycle_count >= max_cycles:
+                    break
+                
                 # Wait for next sync
-                logger.info(f"⏱️ Waiting {self.sync_interval} seconds for next sync...")
-                time.sleep(self.sync_interval)
+                if self.scheduler:
+                    # Wake when the next device is due, but re-check the device list at least every interval
+                    wait = min(self.sync_interval, max(1.0, self.scheduler.seconds_until_next()))
+                else:
+                    wait = self.sync_interval
+                logger.info(f"⏱️ Waiting {wait:.0f} seconds for next sync...")
+                time.sleep(wait)
                 
         except KeyboardInterrupt:
             logger.info("\n🛑 Sync tool stopped by user (Ctrl+C)")
@@ -249,6 +2464,470 @@ class AttendanceSyncTool:
         except Exception as e:
             logger.error(f"💥 Unexpected error in sync loop: {e}")
             raise
+        finally:
+            if metrics_server:
+                metrics_server.shutdown()
+            if self.zk_pool:
+                self.zk_pool.close_all()
+            self.release_leases()
+            if publisher:
+                publisher.stop()
+            if self.spool:
+                self.spool.close()
+
+    def run_stream(self, resync_interval: float = 300, idle_timeout: int = 10):
+        """
+        Stream punches in real time instead of polling (direct mode).
+        
+        Each device gets a thread holding a pyzk live-capture session; punches are
+        forwarded through the bulk batcher, so they reach the API within
+        bulk_max_latency seconds. Before every session, after a disconnect and at
+        least every resync_interval, the device is polled incrementally to pick up
+        punches no session was listening for.
+        """
+        logger.info("📡 Starting real-time punch streaming...")
+        
+        if not self.check_api_health():
+            logger.error("❌ API health check failed. Exiting.")
+            return
+        
+        metrics_server = self._start_metrics_server()
+        publisher = self._start_status_publisher('stream')
+        last_refresh = 0.0
+        
+        try:
+            while True:
+                if time.monotonic() - last_refresh >= self.sync_interval:
+                    last_refresh = time.monotonic()
+                    self._refresh_streams(resync_interval, idle_timeout)
+                    if self.spool.pending_count():
+                        self.replay_spool()
+                    self._save_stream_state()
+                
+                # Micro-batching: a batch goes out once it is full or its oldest punch is bulk_max_latency old
+                if self.batcher.due():
+                    self.flush_punches()
+                time.sleep(0.2)
+                
+        except KeyboardInterrupt:
+            logger.info("\n🛑 Streaming stopped by user (Ctrl+C)")
+        except Exception as e:
+            logger.error(f"💥 Unexpected error in stream loop: {e}")
+            raise
+        finally:
+            for stream in self._streams.values():
+                self._stop_stream(stream)
+            for stream in self._streams.values():
+                stream['thread'].join(timeout=idle_timeout + self.zk_pool.timeout)
+            self._save_stream_state()
+            if metrics_server:
+                metrics_server.shutdown()
+            self.zk_pool.close_all()
+            self.release_leases()
+            if publisher:
+                publisher.stop()
+            self.spool.close()
+
+    def _refresh_streams(self, resync_interval: float, idle_timeout: int):
+        """Start a stream for every new device and stop streams of removed ones"""
+        devices = self.get_biometric_devices()
+        current = {device['deviceId'] for device in devices if device.get('deviceId')}
+        leased = self.renew_leases()
+        if leased is not None:
+            current &= leased
+        
+        for device_id in list(self._streams):
+            if device_id not in current:
+                self._stop_stream(self._streams.pop(device_id))
+        
+        for device_id in sorted(current - set(self._streams)):
+            stream = {'stop': threading.Event(), 'conn': None}
+            stream['thread'] = threading.Thread(target=self._stream_device, args=(device_id, stream, resync_interval, idle_timeout),
+                                                name=f'stream-{device_id}', daemon=True)
+            self._streams[device_id] = stream
+            stream['thread'].start()
+
+    @staticmethod
+    def _stop_stream(stream: Dict):
+        stream['stop'].set()
+        conn = stream['conn']
+        if conn is not None:
+            # The capture loop checks this flag after its next event or idle timeout
+            conn.end_live_capture = True
+
+    def _stream_device(self, device_id: str, stream: Dict, resync_interval: float, idle_timeout: int):
+        """Catch-up poll, then live capture until disconnect or resync; repeat until stopped"""
+        log_context.device = device_id
+        stop = stream['stop']
+        while not stop.is_set():
+            device = self.device_info.get(device_id, {})
+            display_name = device.get('deviceName', device_id)
+            
+            if not self.breaker.allow(device_id):
+                stop.wait(5)
+                continue
+            
+            result = self.sync_device_direct(device_id, display_name)
+            if not result['success']:
+                self._record_stream_failure(device_id, display_name, result.get('error_class', 'SyncError'))
+                stop.wait(5)
+                continue
+            self.breaker.record_success(device_id)
+            
+            # Terminals often accept a single TCP session, so give the socket to the live session
+            self.zk_pool.close(device_id)
+            try:
+                conn = ZK(device.get('ip'), port=int(device.get('port') or 4370), timeout=self.zk_pool.timeout,
+                          password=self.zk_pool.password, force_udp=self.zk_pool.force_udp, ommit_ping=True).connect()
+            except Exception as e:
+                logger.error(f"📡 Could not open live session on device {display_name}: {e}")
+                self._record_stream_failure(device_id, display_name, type(e).__name__)
+                stop.wait(5)
+                continue
+            
+            stream['conn'] = conn
+            session_started = time.monotonic()
+            logger.info(f"📡 Live capture started on device {display_name}")
+            try:
+                for record in conn.live_capture(new_timeout=idle_timeout):
+                    if record is not None:
+                        self._forward_live_punch(device_id, record)
+                    if stop.is_set() or time.monotonic() - session_started >= resync_interval:
+                        conn.end_live_capture = True
+            except Exception as e:
+                logger.warning(f"📡 Live capture on device {display_name} dropped ({e}), falling back to polling")
+                self.metrics.inc('attendance_sync_failures_total', device=device_id, error_class=type(e).__name__)
+            finally:
+                stream['conn'] = None
+                try:
+                    conn.disconnect()
+                except Exception:
+                    pass
+
+    def _record_stream_failure(self, device_id: str, display_name: str, error_class: str):
+        self.metrics.inc('attendance_sync_failures_total', device=device_id, error_class=error_class)
+        delay = self.breaker.record_failure(device_id)
+        if delay is not None:
+            logger.warning(f"⛔ Circuit opened for device {display_name}, next probe in {delay:.0f}s")
+
+    def _save_stream_state(self):
+        """
+        Save watermarks only once the punches behind them are uploaded or spooled.
+        Stream threads queue a punch before moving its watermark, so every
+        watermark in a snapshot taken before the flush is covered by it.
+        """
+        snapshot = self.state.snapshot()
+        self.flush_punches()
+        self.state.save(snapshot)
+
+    def _forward_live_punch(self, device_id: str, record):
+        """Queue one live punch for the next micro-batch"""
+        punches = self.parse_punches([record])
+        self.last_sync_times[device_id] = datetime.now()
+        
+        self.metrics.inc('attendance_sync_raw_records_total', len(punches), device=device_id)
+        self._archive_punches(device_id, punches)
+        if punches:
+            logger.debug(f"👆 Live punch on device {device_id}: user {punches[0]['uid']} at {punches[0]['timestamp']}")
+            self.batcher.add(device_id, punches)
+        
+        # Only the record count follows live punches, and only once the punch is queued. The
+        # timestamp watermark stays at the last poll, so if an event was missed the next
+        # catch-up poll re-reads from there.
+        record_count = self.state.get(device_id).get('record_count')
+        if record_count is not None:
+            self.state.update(device_id, record_count=record_count + 1, last_sync=self.last_sync_times[device_id].isoformat())
+
+    def _start_full_sync(self, restart: bool) -> Optional[int]:
+        """Ask the server to start or resume its full sync job; returns the job id"""
+        try:
+            response = self.session.post(f"{self.base_url}/api/auto-sync/full-sync", json={'restart': restart}, timeout=30)
+            response.raise_for_status()
+            started = response.json()
+        except requests.RequestException as e:
+            logger.error(f"❌ Could not start full sync: {e}")
+            return None
+        
+        job_id = started['jobId']
+        logger.info(f"📚 {started.get('message', f'Full sync job {job_id} started')}")
+        return job_id
+
+    def run_full_sync(self, restart: bool = False, poll_interval: float = 5) -> bool:
+        """Start (or resume) the server's full historical sync job and follow it to the end"""
+        if not self.check_api_health():
+            logger.error("API health check failed.")
+            return False
+        
+        job_id = self._start_full_sync(restart)
+        if job_id is None:
+            return False
+        reported = {}
+        resumes = 0
+        while True:
+            try:
+                response = self.session.get(f"{self.base_url}/api/auto-sync/full-sync/status",
+                                            params={'jobId': job_id}, timeout=30)
+                response.raise_for_status()
+                status = response.json()
+            except requests.RequestException as e:
+                # The job keeps running on the server; just try again
+                logger.warning(f"⚠️ Could not read full sync progress: {e}")
+                time.sleep(poll_interval)
+                continue
+            
+            for device in status['devices']:
+                progress = (device['status'], device['processedPunches'])
+                if reported.get(device['deviceId']) == progress:
+                    continue
+                reported[device['deviceId']] = progress
+                total = device.get('totalPunches')
+                if device['status'] == 'failed':
+                    logger.error(f"❌ {device['deviceId']}: {device.get('error')}")
+                elif total:
+                    logger.info(f"📥 {device['deviceId']}: {device['status']}, "
+                                f"{device['processedPunches']}/{total} punches ({device['processedPunches'] * 100 // total}%)")
+                else:
+                    logger.info(f"📥 {device['deviceId']}: {device['status']}")
+            
+            job = status['job']
+            if job['status'] == 'running' and not status.get('active', True):
+                # The server restarted mid-job; nothing runs it until it is started again
+                if resumes >= self.FULL_SYNC_MAX_RESUMES:
+                    logger.error(f"❌ Full sync job {job_id} was interrupted {resumes} times by a server restart; "
+                                 f"run the full command again to resume it")
+                    return False
+                resumes += 1
+                logger.warning(f"⚠️ Full sync job {job_id} was interrupted by a server restart, resuming from its checkpoints")
+                job_id = self._start_full_sync(False)
+                if job_id is None:
+                    return False
+                continue
+            if job['status'] != 'running':
+                logger.info(f"🏁 Full sync job {job_id} {job['status']}: {status['devicesDone']}/{job['totalDevices']} devices, "
+                            f"{status['processedPunches']} punches, {status['attendanceRecords']} attendance records")
+                if job.get('error'):
+                    logger.error(f"❌ {job['error']}")
+                return job['status'] == 'completed'
+            time.sleep(poll_interval)
+
+    def fetch_roster(self, device: Dict, cache: RosterCache, refresh: bool = False) -> Dict:
+        """Read one device's enrolled users, from the snapshot cache when its user count is unchanged"""
+        device_id = device['deviceId']
+        ip, port = device.get('ip'), int(device.get('port') or 4370)
+        conn = ZK(ip, port=port, timeout=self.zk_timeout, ommit_ping=True).connect()
+        try:
+            conn.read_sizes()
+            users = None if refresh else cache.load(device_id, ip, port, conn.users)
+            if users is not None:
+                return {'device_id': device_id, 'users': users, 'cached': True}
+            
+            # Enrolment is locked only for the user download itself
+            conn.disable_device()
+            try:
+                records = conn.get_users() or []
+            finally:
+                conn.enable_device()
+        finally:
+            conn.disconnect()
+        
+        users = [{'uid': user.uid, 'user_id': str(user.user_id).strip(), 'name': user.name, 'card': user.card}
+                 for user in records]
+        cache.store(device_id, ip, port, users)
+        return {'device_id': device_id, 'users': users, 'cached': False}
+
+    @staticmethod
+    def roster_diff(rosters: Dict[str, List[Dict]], employees: List[Dict]) -> Dict:
+        """
+        Compare device rosters with the employees table.
+        
+        A UID resolves the way server/employeeResolver.ts resolves punches:
+        employeeId first, then biometricDeviceId, then the row id.
+        """
+        by_employee_id, by_biometric_id, employee_ids = {}, {}, set()
+        duplicates = []
+        for employee in employees:
+            employee_ids.add(employee['id'])
+            by_employee_id.setdefault(str(employee['employeeId']).strip(), employee)
+            biometric_id = (employee.get('biometricDeviceId') or '').strip()
+            if not biometric_id:
+                continue
+            if biometric_id in by_biometric_id:
+                duplicates.append(f"biometricDeviceId {biometric_id} is set on employees "
+                                  f"{by_biometric_id[biometric_id]['employeeId']} and {employee['employeeId']}")
+            else:
+                by_biometric_id[biometric_id] = employee
+        for biometric_id, employee in by_biometric_id.items():
+            owner = by_employee_id.get(biometric_id)
+            if owner and owner['id'] != employee['id']:
+                duplicates.append(f"UID {biometric_id} is employee {owner['employeeId']}'s employeeId but employee "
+                                  f"{employee['employeeId']}'s biometricDeviceId; punches go to {owner['employeeId']}")
+        
+        unmapped = []
+        enrolments = {}  # user_id -> [(device_id, name)]
+        for device_id, users in sorted(rosters.items()):
+            seen_on_device = set()
+            for user in users:
+                uid = user['user_id']
+                if not uid or uid == '0':
+                    continue
+                if uid in seen_on_device:
+                    duplicates.append(f"UID {uid} is enrolled more than once on device {device_id}")
+                seen_on_device.add(uid)
+                enrolments.setdefault(uid, []).append((device_id, user.get('name') or ''))
+                if uid not in by_employee_id and uid not in by_biometric_id and uid not in employee_ids:
+                    unmapped.append({'device_id': device_id, 'uid': uid, 'name': user.get('name') or ''})
+        for uid, entries in sorted(enrolments.items()):
+            names = {name.strip() for _, name in entries if name.strip()}
+            if len(names) > 1:
+                duplicates.append(f"UID {uid} has different names across devices: "
+                                  + ', '.join(f"{device_id}={name!r}" for device_id, name in entries))
+        
+        return {'unmapped': unmapped, 'duplicates': duplicates}
+
+    def run_roster_diff(self, cache_dir: str = "roster_cache", concurrency: int = 16, refresh: bool = False) -> bool:
+        """Snapshot every device's users in parallel and print how they differ from the employees table"""
+        devices = [device for device in self.get_biometric_devices() if device.get('deviceId')]
+        if not devices:
+            logger.error("No devices to read")
+            return False
+        try:
+            response = self.session.get(f"{self.base_url}/api/employees", timeout=60)
+            response.raise_for_status()
+            employees = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Failed to get employees: {e}")
+            return False
+        
+        cache = RosterCache(cache_dir)
+        rosters, failed = {}, []
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(devices))), thread_name_prefix='roster') as executor:
+            futures = {executor.submit(self.fetch_roster, device, cache, refresh): device['deviceId'] for device in devices}
+            for future in as_completed(futures):
+                device_id = futures[future]
+                try:
+                    snapshot = future.result()
+                except Exception as e:
+                    logger.error(f"📡 Could not read users from device {device_id}: {e}")
+                    failed.append(device_id)
+                    continue
+                rosters[device_id] = snapshot['users']
+                logger.info(f"👥 {device_id}: {len(snapshot['users'])} users{' (cached)' if snapshot['cached'] else ''}")
+        
+        diff = self.roster_diff(rosters, employees)
+        print(f"\nRoster check: {len(rosters)}/{len(devices)} devices, {len(employees)} employees")
+        print(f"\nUnmapped UIDs ({len(diff['unmapped'])}): punches from these users are dropped")
+        for entry in diff['unmapped']:
+            print(f"  {entry['device_id']:<15} {entry['uid']:<15} {entry['name']}")
+        print(f"\nDuplicates and conflicts ({len(diff['duplicates'])}):")
+        for line in diff['duplicates']:
+            print(f"  {line}")
+        if failed:
+            print(f"\nNot read: {', '.join(sorted(failed))}")
+        return not (diff['unmapped'] or diff['duplicates'] or failed)
+
+    def run_archive_query(self, archive_dir: str, device_id: Optional[str] = None, start: Optional[datetime] = None,
+                          end: Optional[datetime] = None, uid: Optional[str] = None) -> bool:
+        """Summarise the punch archive, or print matching punches as JSON lines when filtered"""
+        archive = self.archive or PunchArchive(archive_dir)
+        if device_id is None and start is None and end is None and uid is None:
+            summary = archive.summary()
+            if not summary:
+                print(f"No punches archived in {archive_dir}")
+                return False
+            print(f"\nPunch archive: {archive_dir}")
+            print(f"  {'Device':<15} {'Month':<8} {'Punches':>10} {'Users':>7}")
+            for row in summary:
+                print(f"  {row['device_id']:<15} {row['month']:<8} {row['punches']:>10} {row['uids']:>7}")
+            print(f"  {sum(row['punches'] for row in summary)} punches from {len(set(row['device_id'] for row in summary))} devices")
+            return True
+        
+        for punch in archive.scan(device_id=device_id, start=start, end=end, uid=uid):
+            print(json.dumps(punch))
+        return True
+
+    def upload_daily_records(self, records: Dict[str, List[str]]) -> Dict:
+        """Send recomputed daily first-in/last-out rows in one compressed columnar request"""
+        payload = json.dumps({'format': 'daily-v1', **records}, separators=(',', ':'))
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/auto-sync/daily-records/bulk",
+                data=gzip.compress(payload.encode('utf-8'), compresslevel=5),
+                headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+                timeout=300
+            )
+            response.raise_for_status()
+            result = response.json()
+            if result.get('success'):
+                return {'success': True, 'processed_records': result.get('processedRecords', 0),
+                        'unmapped_uids': result.get('unmappedUids', [])}
+            error_msg = result.get('message', 'Unknown error')
+        except (requests.RequestException, ValueError) as e:
+            error_msg = str(e)
+        logger.error(f"🌐 Upload of {len(records['uid'])} daily records failed: {error_msg}")
+        return {'success': False, 'error': error_msg}
+
+    def run_reprocess(self, start: datetime, end: datetime, archive_dir: str = "punch_archive",
+                      workers: int = 0, batch_size: int = 5000) -> bool:
+        """Rebuild daily attendance for a date range from the raw punch archive, sharded by UID across processes"""
+        archive = self.archive or PunchArchive(archive_dir)
+        directories = [directory for _, month, directory in archive.partitions()
+                       if start.strftime('%Y-%m') <= month <= end.strftime('%Y-%m')]
+        if not directories:
+            logger.error(f"No archived punches between {start.date()} and {end.date()} in {archive_dir}")
+            return False
+        if not self.check_api_health():
+            logger.error("API health check failed.")
+            return False
+        
+        workers = workers or os.cpu_count() or 1
+        shards = workers
+        logger.info(f"♻️ Reprocessing {start.date()} to {end.date()}: {len(directories)} archive partitions, "
+                    f"{workers} worker processes")
+        
+        started = time.monotonic()
+        punches = records = saved = 0
+        upload_seconds = 0.0
+        unmapped = set()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Map: each partition is read and collapsed once, by whichever worker is free
+            partials = [[] for _ in range(shards)]
+            futures = [executor.submit(collapse_partition, archive.root, directory, shards,
+                                       PunchArchive._to_seconds(start), PunchArchive._to_seconds(end))
+                       for directory in directories]
+            for future in as_completed(futures):
+                result = future.result()
+                punches += result['punches']
+                for shard, spans in enumerate(result['spans']):
+                    if spans['uid']:
+                        partials[shard].append(spans)
+            logger.info(f"🧮 Collapsed {punches} punches in {time.monotonic() - started:.1f}s")
+            
+            # Reduce: one UID shard per task, so an employee's devices and months meet in one process.
+            # Each shard is uploaded as it finishes while the others are still merging.
+            futures = [executor.submit(merge_shard, shard_partials) for shard_partials in partials if shard_partials]
+            for future in as_completed(futures):
+                shard_records = future.result()
+                for i in range(0, len(shard_records['uid']), batch_size):
+                    batch = {field: values[i:i + batch_size] for field, values in shard_records.items()}
+                    upload_started = time.monotonic()
+                    upload = self.upload_daily_records(batch)
+                    upload_seconds += time.monotonic() - upload_started
+                    if not upload['success']:
+                        for pending in futures:
+                            pending.cancel()
+                        logger.error("❌ Reprocess stopped; it is safe to run again, days already saved are merged")
+                        return False
+                    records += len(batch['uid'])
+                    saved += upload['processed_records']
+                    unmapped.update(upload['unmapped_uids'])
+        
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info(f"🏁 Reprocessed {punches} punches into {records} employee-days ({saved} saved) in {elapsed:.1f}s: "
+                    f"{punches / elapsed:,.0f} punches/s, {records / elapsed:,.0f} days/s, {upload_seconds:.1f}s uploading")
+        if unmapped:
+            logger.warning(f"⚠️ {len(unmapped)} UIDs match no employee and were skipped: "
+                           f"{', '.join(sorted(unmapped)[:20])}{' ...' if len(unmapped) > 20 else ''}")
+        return True
 
     def run_single_sync(self):
         """Run a single sync cycle"""
@@ -258,7 +2937,12 @@ class AttendanceSyncTool:
             logger.error("API health check failed.")
             return False
         
-        results = self.sync_all_devices()
+        results = self._run_cycle()
+        
+        if self.zk_pool:
+            self.zk_pool.close_all()
+        if self.spool:
+            self.spool.close()
         
         if results['total_devices'] > 0:
             success_rate = (results['successful_syncs'] / results['total_devices']) * 100
@@ -268,6 +2952,30 @@ class AttendanceSyncTool:
         return False
 
 
+    def run_profile(self, cycles: int, output_dir: str) -> bool:
+        """Run `cycles` sync cycles under cProfile, then save and print the hottest functions"""
+        logger.info(f"🔬 Profiling {cycles} sync cycles...")
+        self._profiles = []
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self.run_continuous_sync(max_cycles=cycles)
+        finally:
+            profiler.disable()
+            thread_profiles, self._profiles = self._profiles, None
+        
+        stats = pstats.Stats(profiler)
+        if thread_profiles:
+            stats.add(*thread_profiles)
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"profile-{datetime.now():%Y%m%d-%H%M%S}.prof")
+        stats.dump_stats(path)
+        logger.info(f"🔬 Profile of {self.cycle_count} cycles written to {path} "
+                    f"(python -m pstats {path}, or snakeviz)")
+        stats.sort_stats('cumulative').print_stats(30)
+        return self.cycle_count >= cycles
+
+
 def main():
     """Main function"""
     print("Ministry of Finance Sri Lanka")
@@ -277,9 +2985,107 @@ def main():
     # Configuration
     API_URL = os.getenv('API_URL', 'http://localhost:3000')
     SYNC_INTERVAL = int(os.getenv('SYNC_INTERVAL', '30'))  # seconds
+    SYNC_CONCURRENCY = int(os.getenv('SYNC_CONCURRENCY', '1'))  # devices synced in parallel at start
+    SYNC_MAX_CONCURRENCY = int(os.getenv('SYNC_MAX_CONCURRENCY', str(max(8, SYNC_CONCURRENCY))))  # adaptive ceiling
+    API_LATENCY_TARGET = float(os.getenv('API_LATENCY_TARGET', '0'))  # slower API answers lower concurrency (0 = auto)
+    SYNC_MODE = os.getenv('SYNC_MODE', 'api').lower()  # api | direct
+    ZK_TIMEOUT = int(os.getenv('ZK_TIMEOUT', '5'))  # seconds, direct mode only
+    SYNC_STATE_FILE = os.getenv('SYNC_STATE_FILE', 'sync_state.json')  # per-device watermarks
+    SPOOL_FILE = os.getenv('SPOOL_FILE', 'punch_spool.db')  # direct mode only
+    SPOOL_BATCH_SIZE = int(os.getenv('SPOOL_BATCH_SIZE', '5000'))
+    BULK_MAX_PUNCHES = int(os.getenv('BULK_MAX_PUNCHES', '20000'))  # direct mode upload batch size
+    BULK_MAX_LATENCY = float(os.getenv('BULK_MAX_LATENCY', '2'))  # seconds a punch may wait for a batch
+    STREAM_RESYNC_INTERVAL = float(os.getenv('STREAM_RESYNC_INTERVAL', '300'))  # stream: catch-up poll period
+    STREAM_IDLE_TIMEOUT = int(os.getenv('STREAM_IDLE_TIMEOUT', '10'))  # stream: seconds between liveness checks
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0 disables the /metrics endpoint
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    ROTATE_LOGS = os.getenv('ROTATE_LOGS', 'false').lower() in ('1', 'true', 'yes')  # direct mode only
+    ROTATE_MIN_RECORDS = int(os.getenv('ROTATE_MIN_RECORDS', '10000'))  # rotate devices holding this many records
+    ROTATE_KEEP_DAYS = int(os.getenv('ROTATE_KEEP_DAYS', '90'))  # days cleared logs stay archived (0 = forever)
+    ROTATE_ARCHIVE_DIR = os.getenv('ROTATE_ARCHIVE_DIR', 'rotated_logs')
+    ROSTER_CACHE_DIR = os.getenv('ROSTER_CACHE_DIR', 'roster_cache')  # device user snapshots for 'roster'
+    ROSTER_CONCURRENCY = int(os.getenv('ROSTER_CONCURRENCY', '16'))  # devices read in parallel by 'roster'
+    PUNCH_ARCHIVE_DIR = os.getenv('PUNCH_ARCHIVE_DIR', 'punch_archive')  # direct mode raw punch archive ('' = off)
+    REPROCESS_WORKERS = int(os.getenv('REPROCESS_WORKERS', '0'))  # 'reprocess' worker processes (0 = one per core)
+    REPROCESS_BATCH_SIZE = int(os.getenv('REPROCESS_BATCH_SIZE', '5000'))  # daily records per upload
+    SYNC_SHARDING = os.getenv('SYNC_SHARDING', 'false').lower() in ('1', 'true', 'yes')  # split devices between instances
+    SYNC_WORKER_ID = os.getenv('SYNC_WORKER_ID', socket.gethostname())  # unique per instance when sharding
+    LEASE_SECONDS = int(os.getenv('LEASE_SECONDS', str(max(90, 3 * SYNC_INTERVAL))))  # device lease without a heartbeat
+    TRACE_DIR = os.getenv('TRACE_DIR', '')  # Chrome trace file per sync cycle ('' = off)
+    TRACE_KEEP = int(os.getenv('TRACE_KEEP', '100'))  # newest trace files kept (0 = all)
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')  # --profile output (and traces, unless TRACE_DIR is set)
+    STATUS_FILE = os.getenv('STATUS_FILE', 'sync_status.json')  # live state read by 'status' ('' = off)
+    STATUS_INTERVAL = float(os.getenv('STATUS_INTERVAL', '5'))  # seconds between live state updates
+    
+    # --profile N runs N continuous sync cycles under cProfile
+    profile_cycles = 0
+    if '--profile' in sys.argv:
+        index = sys.argv.index('--profile')
+        value = sys.argv[index + 1] if index + 1 < len(sys.argv) else ''
+        profile_cycles = int(value) if value.isdigit() else 3
+        del sys.argv[index:index + (2 if value.isdigit() else 1)]
+        TRACE_DIR = TRACE_DIR or PROFILE_DIR
+    
+    # Streaming talks to the devices itself, whatever SYNC_MODE says
+    if len(sys.argv) > 1 and sys.argv[1].lower() == 'stream':
+        SYNC_MODE = 'direct'
+    
+    if len(sys.argv) > 1 and sys.argv[1].lower() == 'roster' and ZK is None:
+        print("❌ The roster command needs the pyzk package: pip3 install pyzk")
+        sys.exit(1)
+    
+    if SYNC_MODE not in ('api', 'direct'):
+        print(f"Unknown SYNC_MODE: {SYNC_MODE} (expected 'api' or 'direct')")
+        sys.exit(1)
+    
+    if ROTATE_LOGS and SYNC_MODE != 'direct':
+        print("❌ ROTATE_LOGS needs SYNC_MODE=direct: the tool must see every punch it is about to clear")
+        sys.exit(1)
+    
+    if SYNC_MODE == 'direct' and ZK is None:
+        print("❌ Direct mode and streaming need the pyzk package: pip3 install pyzk")
+        sys.exit(1)
+    
+    # Adaptive per-device polling (off by default: every device every SYNC_INTERVAL)
+    scheduler = None
+    if os.getenv('ADAPTIVE_SCHEDULE', 'false').lower() in ('1', 'true', 'yes'):
+        office_start, office_end = os.getenv('OFFICE_HOURS', '07:00-18:00').split('-')
+        scheduler = AdaptivePollScheduler(
+            base_interval=SYNC_INTERVAL,
+            min_interval=float(os.getenv('SCHEDULE_MIN_INTERVAL', '10')),
+            max_interval=float(os.getenv('SCHEDULE_MAX_INTERVAL', '300')),
+            offhours_min_interval=float(os.getenv('OFFHOURS_MIN_INTERVAL', '60')),
+            offhours_max_interval=float(os.getenv('OFFHOURS_MAX_INTERVAL', '1800')),
+            office_hours=(office_start.strip(), office_end.strip()),
+            busy_records=int(os.getenv('SCHEDULE_BUSY_RECORDS', '20'))
+        )
+    
+    breaker = DeviceCircuitBreaker(
+        failure_threshold=int(os.getenv('BREAKER_THRESHOLD', '3')),
+        base_delay=float(os.getenv('BREAKER_BASE_DELAY', '30')),
+        max_delay=float(os.getenv('BREAKER_MAX_DELAY', '1800'))
+    )
+    
+    limiter = AdaptiveConcurrencyLimiter(initial=SYNC_CONCURRENCY, max_limit=SYNC_MAX_CONCURRENCY,
+                                         latency_target=API_LATENCY_TARGET)
     
     # Create sync tool
-    sync_tool = AttendanceSyncTool(base_url=API_URL, sync_interval=SYNC_INTERVAL)
+    sync_tool = AttendanceSyncTool(base_url=API_URL, sync_interval=SYNC_INTERVAL, max_workers=limiter.max_limit,
+                                   sync_mode=SYNC_MODE, zk_timeout=ZK_TIMEOUT, state_file=SYNC_STATE_FILE,
+                                   spool_file=SPOOL_FILE, spool_batch_size=SPOOL_BATCH_SIZE,
+                                   bulk_max_punches=BULK_MAX_PUNCHES, bulk_max_latency=BULK_MAX_LATENCY,
+                                   scheduler=scheduler, breaker=breaker, limiter=limiter,
+                                   metrics_port=METRICS_PORT, metrics_host=METRICS_HOST,
+                                   rotate_logs=ROTATE_LOGS, rotate_min_records=ROTATE_MIN_RECORDS,
+                                   rotate_keep_days=ROTATE_KEEP_DAYS, rotate_archive_dir=ROTATE_ARCHIVE_DIR,
+                                   archive_dir=PUNCH_ARCHIVE_DIR,
+                                   worker_id=SYNC_WORKER_ID if SYNC_SHARDING else '', lease_seconds=LEASE_SECONDS,
+                                   trace_dir=TRACE_DIR, trace_keep=TRACE_KEEP,
+                                   status_file=STATUS_FILE, status_interval=STATUS_INTERVAL)
+    
+    if profile_cycles:
+        success = sync_tool.run_profile(profile_cycles, PROFILE_DIR)
+        sys.exit(0 if success else 1)
     
     # Check command line arguments
     if len(sys.argv) > 1:
@@ -291,8 +3097,48 @@ def main():
             sys.exit(0 if success else 1)
             
         elif command == 'status':
-            # Show status only
-            sync_tool.print_status()
+            # Live state of the running sync, if one is publishing; otherwise this process' saved view
+            if not sync_tool.print_live_status(STATUS_FILE):
+                print(f"ℹ️ No live status in {STATUS_FILE or '(STATUS_FILE is off)'}; showing saved state")
+                sync_tool.print_status()
+            sys.exit(0)
+            
+        elif command == 'roster':
+            # Device users that do not map to an employee record
+            success = sync_tool.run_roster_diff(cache_dir=ROSTER_CACHE_DIR, concurrency=ROSTER_CONCURRENCY,
+                                                refresh='--refresh' in sys.argv[2:])
+            sys.exit(0 if success else 1)
+            
+        elif command == 'archive':
+            # Read the local raw punch archive: archive [DEVICE_ID] [--from DATE] [--to DATE] [--uid UID]
+            args, options = parse_command_options(sys.argv[2:])
+            success = sync_tool.run_archive_query(PUNCH_ARCHIVE_DIR or 'punch_archive', device_id=args[0] if args else None,
+                                                  start=parse_date_option(options.get('--from')),
+                                                  end=parse_date_option(options.get('--to'), end_of_day=True),
+                                                  uid=options.get('--uid'))
+            sys.exit(0 if success else 1)
+            
+        elif command == 'reprocess':
+            # Recompute daily records from the archive: reprocess --from DATE --to DATE [--workers N]
+            args, options = parse_command_options(sys.argv[2:])
+            if '--from' not in options or '--to' not in options:
+                print("Usage: python python_sync_tool.py reprocess --from YYYY-MM-DD --to YYYY-MM-DD [--workers N]")
+                sys.exit(1)
+            success = sync_tool.run_reprocess(parse_date_option(options['--from']),
+                                              parse_date_option(options['--to'], end_of_day=True),
+                                              archive_dir=PUNCH_ARCHIVE_DIR or 'punch_archive',
+                                              workers=int(options.get('--workers', REPROCESS_WORKERS)),
+                                              batch_size=REPROCESS_BATCH_SIZE)
+            sys.exit(0 if success else 1)
+            
+        elif command == 'full':
+            # Full historical sync on the server, resumed if a previous run was interrupted
+            success = sync_tool.run_full_sync(restart='--restart' in sys.argv[2:])
+            sys.exit(0 if success else 1)
+            
+        elif command == 'stream':
+            # Real-time punch capture instead of polling
+            sync_tool.run_stream(resync_interval=STREAM_RESYNC_INTERVAL, idle_timeout=STREAM_IDLE_TIMEOUT)
             sys.exit(0)
             
         elif command == 'test':
@@ -308,7 +3154,7 @@ def main():
                 
         else:
             print(f"Unknown command: {command}")
-            print("Usage: python python_sync_tool.py [single|status|test]")
+            print("Usage: python python_sync_tool.py [--profile N] [single|status|test|stream|full [--restart]|roster [--refresh]|archive [DEVICE_ID] [--from DATE] [--to DATE] [--uid UID]|reprocess --from DATE --to DATE [--workers N]]")
             sys.exit(1)
     
     # Default: run continuous sync
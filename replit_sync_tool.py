@@ -7,35 +7,488 @@ This tool integrates with Replit's infrastructure for better deployment and mana
 Designed to run on Replit or connect to Replit-hosted HR systems.
 """
 
+import atexit
+import gzip
 import time
+import random
+import re
 import requests
 import json
 import logging
+import logging.handlers
 import os
+import queue
+import shutil
 import sys
-from datetime import datetime
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from typing import Dict, List, Optional
 from urllib.parse import urlparse, urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class DeviceLogContext(threading.local):
+    """Device the current thread is syncing; log records made meanwhile are tagged with it"""
+    device = None
+
+
+log_context = DeviceLogContext()
+
+
+class DeviceRepeatFilter(logging.Filter):
+    """
+    Per-device rate limit for repetitive log lines.
+    
+    Lines that differ only in their numbers count as the same message, and a
+    device may log the same message `limit` times per `window` seconds. The
+    next line that gets through says how many were suppressed, so the log size
+    no longer grows with the number of devices times the number of cycles.
+    Errors and lines not tied to a device always pass.
+    """
+
+    MAX_KEYS = 10000
+
+    def __init__(self, limit: int = 3, window: float = 300):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._seen = {}  # (device, level, message shape) -> [window start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.device = getattr(record, 'device', None) or log_context.device
+        if not self.limit or record.device is None or record.levelno >= logging.ERROR:
+            return True
+        
+        key = (record.device, record.levelno, re.sub(r'\d+', '#', record.getMessage()))
+        now = time.monotonic()
+        suppressed = 0
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if entry is None and len(self._seen) >= self.MAX_KEYS:
+                    self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+                suppressed = entry[2] if entry else 0
+                self._seen[key] = [now, 1, 0]
+            elif entry[1] < self.limit:
+                entry[1] += 1
+            else:
+                entry[2] += 1
+                return False
+        
+        if suppressed:
+            record.msg = f"{record.getMessage()} [{suppressed} similar messages suppressed]"
+            record.args = None
+        return True
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if getattr(record, 'device', None):
+            entry['device'] = record.device
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class CompressingRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    Log file rolled over once it reaches max_bytes or at the next midnight or
+    hour (`when`), whichever comes first. Rolled files get a timestamp suffix
+    and are gzip-compressed, and only the newest backup_count are kept.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 50 * 1024 * 1024, when: str = 'midnight',
+                 backup_count: int = 14, compress: bool = True):
+        super().__init__(filename, 'a', encoding='utf-8', delay=True)
+        self.max_bytes = max_bytes
+        self.when = when
+        self.backup_count = backup_count
+        self.compress = compress
+        self.next_rollover = self._next_rollover()
+
+    def _next_rollover(self) -> float:
+        now = datetime.now()
+        if self.when == 'midnight':
+            return (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+        if self.when == 'hourly':
+            return (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+        return float('inf')
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.next_rollover:
+            return True
+        if not self.max_bytes:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.next_rollover = self._next_rollover()
+        if not os.path.exists(self.baseFilename) or os.path.getsize(self.baseFilename) == 0:
+            return
+        
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        rolled = f"{self.baseFilename}.{stamp}"
+        suffix = 1
+        while os.path.exists(rolled) or os.path.exists(rolled + '.gz'):
+            rolled = f"{self.baseFilename}.{stamp}_{suffix}"
+            suffix += 1
+        os.replace(self.baseFilename, rolled)
+        if self.compress:
+            with open(rolled, 'rb') as src, gzip.open(rolled + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rolled)
+        
+        if self.backup_count:
+            directory, base = os.path.split(self.baseFilename)
+            backups = sorted(name for name in os.listdir(directory or '.')
+                             if name.startswith(base + '.') and name[len(base) + 1:len(base) + 2].isdigit())
+            for name in backups[:-self.backup_count]:
+                os.remove(os.path.join(directory, name))
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread; drops them instead of blocking a sync when it falls behind"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.dropped and not self.queue.full():
+            dropped, self.dropped = self.dropped, 0
+            self.enqueue(logging.makeLogRecord({'name': record.name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                                'msg': f"Log writer fell behind: dropped {dropped} log records"}))
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(log_file: str, max_bytes: int, when: str, backup_count: int, json_format: bool,
+                      repeat_limit: int, repeat_window: float, queue_size: int):
+    """
+    Send log records through a bounded queue to a writer thread, so a slow disk
+    or console never stalls a sync. The file handler rotates and compresses.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return  # configured by the embedding program
+    
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    handlers = [console]
+    if log_file:
+        file_handler = CompressingRotatingFileHandler(log_file, max_bytes=max_bytes, when=when, backup_count=backup_count)
+        file_handler.setFormatter(JsonLogFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+        handlers.append(file_handler)
+    
+    queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(DeviceRepeatFilter(repeat_limit, repeat_window))
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+    
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    
+    def flush_on_exit():
+        # Write out whatever is still queued; the stop marker waits for room if the queue is full
+        while True:
+            try:
+                listener.stop()
+                return
+            except queue.Full:
+                time.sleep(0.05)
+    atexit.register(flush_on_exit)
+
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('replit_attendance_sync.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
+configure_logging(
+    log_file=os.getenv('LOG_FILE', 'replit_attendance_sync.log'),  # '' logs to the console only
+    max_bytes=int(os.getenv('LOG_MAX_BYTES', str(50 * 1024 * 1024))),  # roll over at this size (0 = no limit)
+    when=os.getenv('LOG_ROTATE_WHEN', 'midnight'),  # midnight | hourly | never
+    backup_count=int(os.getenv('LOG_BACKUP_COUNT', '14')),  # compressed old logs kept (0 = all)
+    json_format=os.getenv('LOG_FORMAT', 'text').lower() == 'json',  # file format; the console stays text
+    repeat_limit=int(os.getenv('LOG_REPEAT_LIMIT', '3')),  # same message per device per window (0 = no limit)
+    repeat_window=float(os.getenv('LOG_REPEAT_WINDOW', '300')),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
 )
 logger = logging.getLogger(__name__)
 
+class SyncStateStore:
+    """Per-device sync watermarks persisted to a JSON file so restarts resume incrementally"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._devices = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('devices', {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read sync state from {self.path}, starting fresh: {e}")
+            return {}
+
+    def get(self, device_id: str) -> Dict:
+        with self._lock:
+            return dict(self._devices.get(device_id, {}))
+
+    def device_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._devices)
+
+    def update(self, device_id: str, **fields):
+        with self._lock:
+            self._devices.setdefault(device_id, {}).update(fields)
+
+    def remove(self, device_id: str):
+        with self._lock:
+            self._devices.pop(device_id, None)
+
+    def save(self):
+        """Write atomically so a crash never leaves a half-written state file"""
+        with self._lock:
+            data = json.dumps({'devices': self._devices}, indent=2)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to save sync state to {self.path}: {e}")
+
+
+class DeviceCircuitBreaker:
+    """
+    Per-device circuit breaker with jittered exponential backoff.
+    
+    After `failure_threshold` consecutive failures a device's circuit opens and
+    it is skipped until its backoff expires. It then goes half-open: one probe
+    sync is allowed, which either closes the circuit or re-opens it with a
+    doubled delay.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 3, base_delay: float = 30, max_delay: float = 1800):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.devices = {}  # device_id -> {'state', 'failures', 'open_until'}
+
+    def _entry(self, device_id: str) -> Dict:
+        return self.devices.setdefault(device_id, {'state': self.CLOSED, 'failures': 0, 'open_until': 0.0})
+
+    def allow(self, device_id: str) -> bool:
+        """Whether the device should be synced this cycle"""
+        entry = self._entry(device_id)
+        if entry['state'] == self.OPEN and time.monotonic() >= entry['open_until']:
+            entry['state'] = self.HALF_OPEN
+        return entry['state'] != self.OPEN
+
+    def record_success(self, device_id: str):
+        self.devices[device_id] = {'state': self.CLOSED, 'failures': 0, 'open_until': 0.0}
+
+    def record_failure(self, device_id: str) -> Optional[float]:
+        """Count a failure; returns the backoff delay if the circuit (re)opened"""
+        entry = self._entry(device_id)
+        entry['failures'] += 1
+        if entry['state'] != self.HALF_OPEN and entry['failures'] < self.failure_threshold:
+            return None
+        
+        exponent = entry['failures'] - self.failure_threshold
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, exponent)))
+        delay *= random.uniform(0.8, 1.2)  # jitter so dead devices don't all probe in the same cycle
+        entry['state'] = self.OPEN
+        entry['open_until'] = time.monotonic() + delay
+        return delay
+
+    def forget(self, device_id: str):
+        self.devices.pop(device_id, None)
+
+    def describe(self, device_id: str) -> str:
+        entry = self.devices.get(device_id)
+        if not entry or entry['state'] == self.CLOSED:
+            return 'closed'
+        if entry['state'] == self.HALF_OPEN:
+            return f"half-open after {entry['failures']} failures"
+        remaining = max(0, entry['open_until'] - time.monotonic())
+        return f"open after {entry['failures']} failures, next probe in {remaining:.0f}s"
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on device syncs in flight, steered by how the HR API answers.
+    
+    Every API response is reported through RateLimitedAdapter. A quick success
+    raises the limit by one per full window of requests; a 429, a 5xx or a
+    timeout halves it, and a response slower than the latency target trims it
+    by a tenth. Only requests sent after the last cut can cut again, so one
+    burst of overload costs one halving. A Retry-After header pauses every new
+    request until it has passed.
+    
+    The latency target is per endpoint path (so per device for server-side
+    syncs): `latency_target` seconds, or when 0, three times the fastest of
+    that path's recent responses and at least a second.
+    """
+
+    HISTORY = 50  # recent latencies kept per path for the automatic target
+
+    def __init__(self, initial: int = 1, max_limit: int = 8, min_limit: int = 1,
+                 latency_target: float = 0, max_pause: float = 300):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.latency_target = latency_target
+        self.max_pause = max_pause
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self.last_reason = None  # why the limit was last cut
+        self._last_decrease = 0.0
+        self._latencies = {}  # path -> deque of recent latencies
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a device sync may start"""
+        with self._cond:
+            while True:
+                paused = self.pause_until - time.monotonic()
+                if paused > 0:
+                    self._cond.wait(paused)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    break
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def wait_if_paused(self):
+        """Hold an API request while the server's Retry-After is running"""
+        while True:
+            with self._cond:
+                paused = self.pause_until - time.monotonic()
+            if paused <= 0:
+                return
+            time.sleep(min(paused, 1.0))
+
+    def observe(self, path: str, started: float, latency: Optional[float], status: Optional[int],
+                retry_after: Optional[str] = None):
+        """Feed one API outcome; latency and status are None for a timeout"""
+        with self._cond:
+            now = time.monotonic()
+            if retry_after:
+                delay = self._parse_retry_after(retry_after)
+                if delay and delay > 0:
+                    self.pause_until = max(self.pause_until, now + min(delay, self.max_pause))
+            
+            if status is None:
+                self._decrease(0.5, 'timeout', started)
+            elif status == 429 or status >= 500:
+                self._decrease(0.5, f'HTTP {status}', started)
+            elif status < 400:
+                history = self._latencies.setdefault(path, deque(maxlen=self.HISTORY))
+                target = self.latency_target or max(1.0, 3 * min(history, default=latency))
+                history.append(latency)
+                if latency > target:
+                    self._decrease(0.9, f'{latency:.1f}s response from {path}', started)
+                elif self.limit < self.max_limit:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def _decrease(self, factor: float, reason: str, started: float):
+        if started < self._last_decrease:
+            return  # sent before the last cut, which already accounted for it
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._last_decrease = time.monotonic()
+        self.last_reason = reason
+        if int(self.limit) < previous:
+            logger.warning(f"API backpressure ({reason}): concurrency limit {previous} -> {int(self.limit)}")
+
+    @staticmethod
+    def _parse_retry_after(value: str) -> Optional[float]:
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return (retry_at - datetime.now(timezone.utc)).total_seconds()
+
+    def describe(self) -> str:
+        with self._cond:
+            text = f"limit {int(self.limit)} of {self.max_limit} ({self.in_flight} in flight)"
+            paused = self.pause_until - time.monotonic()
+            if paused > 0:
+                text += f", paused {paused:.0f}s by Retry-After"
+            if self.last_reason:
+                text += f", last cut: {self.last_reason}"
+            return text
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter reporting every HR API response and timeout to the concurrency limiter"""
+
+    def __init__(self, limiter: AdaptiveConcurrencyLimiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.limiter.wait_if_paused()
+        path = urlparse(request.url).path
+        started = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.exceptions.Timeout:
+            self.limiter.observe(path, started, None, None)
+            raise
+        self.limiter.observe(path, started, time.monotonic() - started, response.status_code,
+                             response.headers.get('Retry-After'))
+        return response
+
+
 class ReplitAttendanceSyncTool:
-    def __init__(self, replit_url: str = None, sync_interval: int = 30):
+    def __init__(self, replit_url: str = None, sync_interval: int = 30, max_workers: int = 1,
+                 state_file: str = "replit_sync_state.json", breaker: Optional[DeviceCircuitBreaker] = None,
+                 limiter: Optional[AdaptiveConcurrencyLimiter] = None):
         """
         Initialize the Replit-enhanced sync tool
         
         Args:
             replit_url: Replit app URL (e.g., https://your-app.your-username.repl.co)
             sync_interval: Sync interval in seconds (default: 30 seconds)
+            max_workers: Most devices synced in parallel (default: 1 = sequential)
+            state_file: JSON file holding per-device sync watermarks
+            breaker: Per-device circuit breaker (default: 3 failures, 30s-30min backoff)
+            limiter: Adaptive cap on device syncs in flight (default: max_workers, lowered while
+                the API pushes back)
         """
         # Auto-detect Replit environment
         self.is_replit = self._detect_replit_environment()
@@ -53,11 +506,26 @@ class ReplitAttendanceSyncTool:
             self.base_url = "http://localhost:3000"
         
         self.sync_interval = sync_interval
+        self.max_workers = max(1, max_workers)
         self.session = requests.Session()
+        self.limiter = limiter or AdaptiveConcurrencyLimiter(initial=self.max_workers, max_limit=self.max_workers)
+        adapter = RateLimitedAdapter(self.limiter, pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.known_devices = set()
+        self.device_list = []  # last device list, reused while the server answers 304
+        self.device_list_etag = None
         self.last_sync_times = {}
         self.device_check_interval = 5
         self.cycle_count = 0
+        self.state = SyncStateStore(state_file)
+        self.breaker = breaker or DeviceCircuitBreaker()
+        
+        # Restore last sync times from the previous run
+        for device_id in self.state.device_ids():
+            last_sync = self.state.get(device_id).get('last_sync')
+            if last_sync:
+                self.last_sync_times[device_id] = datetime.fromisoformat(last_sync)
         
         # Replit-specific configuration
         self.replit_token = os.getenv('REPLIT_TOKEN')
@@ -69,6 +537,8 @@ class ReplitAttendanceSyncTool:
         logger.info(f"Environment: {'Replit' if self.is_replit else 'External'}")
         logger.info(f"API Base URL: {self.base_url}")
         logger.info(f"Sync Interval: {self.sync_interval} seconds")
+        logger.info(f"Concurrency: {int(self.limiter.limit)}-{self.limiter.max_limit} device(s) in parallel, "
+                    f"adapted to API backpressure")
 
     def _detect_replit_environment(self) -> bool:
         """Detect if running in Replit environment"""
@@ -118,9 +588,14 @@ class ReplitAttendanceSyncTool:
             # Use Replit-optimized endpoint
             url = f"{self.base_url}/api/biometric-devices"
             
-            response = self.session.get(url, timeout=15)
+            headers = {'If-None-Match': self.device_list_etag} if self.device_list_etag else {}
+            response = self.session.get(url, headers=headers, timeout=15)
+            if response.status_code == 304:
+                # Device list unchanged since the last fetch
+                return self.device_list
             response.raise_for_status()
             devices = response.json()
+            self.device_list_etag = response.headers.get('ETag')
             
             # Extract device IDs from current devices
             current_device_ids = {device.get('deviceId') for device in devices if device.get('deviceId')}
@@ -139,11 +614,14 @@ class ReplitAttendanceSyncTool:
                 # Clean up sync times for removed devices
                 for device_id in removed_devices:
                     self.last_sync_times.pop(device_id, None)
+                    self.state.remove(device_id)
+                    self.breaker.forget(device_id)
             
             # Update known devices
             self.known_devices = current_device_ids
             
             logger.info(f"Active devices: {len(devices)} ({', '.join(current_device_ids)})")
+            self.device_list = devices
             return devices
             
         except requests.RequestException as e:
@@ -161,7 +639,15 @@ class ReplitAttendanceSyncTool:
             # Use Replit-optimized sync endpoint
             url = f"{self.base_url}/api/auto-sync/device/{device_id}"
             
-            response = self.session.post(url, timeout=60)  # Longer timeout for sync operations
+            # Only ask for punches newer than this device's watermark
+            watermark = self.state.get(device_id)
+            params = {}
+            if watermark.get('last_timestamp'):
+                params['since'] = watermark['last_timestamp']
+                if watermark.get('record_count') is not None:
+                    params['count'] = watermark['record_count']
+            
+            response = self.session.post(url, params=params, timeout=60)  # Longer timeout for sync operations
             response.raise_for_status()
             
             result = response.json()
@@ -173,6 +659,12 @@ class ReplitAttendanceSyncTool:
                 logger.info(f"Device {display_name}: {raw_records} raw -> {processed_records} attendance records")
                 
                 self.last_sync_times[device_id] = datetime.now()
+                self.state.update(
+                    device_id,
+                    last_timestamp=result.get('lastTimestamp') or watermark.get('last_timestamp'),
+                    record_count=result.get('totalRecords'),
+                    last_sync=self.last_sync_times[device_id].isoformat()
+                )
                 
                 return {
                     'success': True,
@@ -257,6 +749,7 @@ class ReplitAttendanceSyncTool:
             'total_processed_records': 0
         }
         
+        targets = []
         for device in devices:
             device_id = device.get('deviceId')
             device_name = device.get('deviceName', device_id)
@@ -264,8 +757,25 @@ class ReplitAttendanceSyncTool:
             if not device_id:
                 logger.warning(f"Device missing deviceId: {device}")
                 continue
-                
-            result = self.sync_device(device_id, device_name)
+            
+            targets.append((device_id, device_name))
+        
+        # Devices with an open circuit don't get to eat into the cycle
+        open_circuit = [target[0] for target in targets if not self.breaker.allow(target[0])]
+        if open_circuit:
+            logger.info(f"Skipping {len(open_circuit)} devices with open circuit: {', '.join(open_circuit)}")
+            targets = [target for target in targets if target[0] not in open_circuit]
+        results['skipped_open_circuit'] = len(open_circuit)
+        results['total_devices'] = len(targets)
+        
+        if self.max_workers > 1:
+            device_results = self._sync_devices_parallel(targets)
+        else:
+            device_results = []
+            for device_id, device_name in targets:
+                device_results.append(self._limited_sync_device(device_id, device_name))
+        
+        for result in device_results:
             results['device_results'].append(result)
             
             if result['success']:
@@ -274,9 +784,16 @@ class ReplitAttendanceSyncTool:
                 results['total_processed_records'] += result.get('processed_records', 0)
             else:
                 results['failed_syncs'] += 1
-                
-            # Small delay between device syncs
-            time.sleep(2)
+            
+            if result['success']:
+                self.breaker.record_success(result['device_id'])
+            else:
+                delay = self.breaker.record_failure(result['device_id'])
+                if delay is not None:
+                    logger.warning(f"Circuit opened for device {result['device_name']}, next probe in {delay:.0f}s")
+        
+        # Persist watermarks once per cycle
+        self.state.save()
         
         # Log summary
         success_rate = (results['successful_syncs'] / results['total_devices']) * 100 if results['total_devices'] > 0 else 0
@@ -285,6 +802,37 @@ class ReplitAttendanceSyncTool:
         
         return results
 
+    def _limited_sync_device(self, device_id: str, device_name: str) -> Dict:
+        """Sync one device once the limiter has room; it paces syncs instead of a fixed sleep"""
+        self.limiter.acquire()
+        log_context.device = device_id
+        try:
+            return self.sync_device(device_id, device_name)
+        finally:
+            log_context.device = None
+            self.limiter.release()
+
+    def _sync_devices_parallel(self, targets: List[tuple]) -> List[Dict]:
+        """Sync devices on a thread pool, returning results in device order"""
+        device_results: List[Optional[Dict]] = [None] * len(targets)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='device-sync') as executor:
+            futures = {
+                executor.submit(self._limited_sync_device, device_id, device_name): index
+                for index, (device_id, device_name) in enumerate(targets)
+            }
+            
+            for future in as_completed(futures):
+                index = futures[future]
+                device_id, device_name = targets[index]
+                try:
+                    device_results[index] = future.result()
+                except Exception as e:
+                    logger.error(f"Unexpected error syncing device {device_name}: {e}")
+                    device_results[index] = {'success': False, 'device_id': device_id, 'device_name': device_name, 'error': str(e)}
+        
+        return device_results
+
     def print_status(self):
         """Print current sync status with Replit information"""
         print("\n" + "="*80)
@@ -301,6 +849,7 @@ class ReplitAttendanceSyncTool:
         
         print(f"API URL: {self.base_url}")
         print(f"Sync Interval: {self.sync_interval} seconds")
+        print(f"Concurrency: {self.limiter.describe()}")
         print(f"Current Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"Sync Cycles: {self.cycle_count}")
         print(f"Known Devices: {len(self.known_devices)}")
@@ -308,6 +857,13 @@ class ReplitAttendanceSyncTool:
         if self.known_devices:
             print(f"Active Devices: {', '.join(sorted(self.known_devices))}")
         
+        tripped = {device_id: self.breaker.describe(device_id) for device_id in sorted(self.breaker.devices)
+                   if self.breaker.devices[device_id]['state'] != DeviceCircuitBreaker.CLOSED}
+        if tripped:
+            print("\nCircuit Breakers:")
+            for device_id, description in tripped.items():
+                print(f"  [OPEN] {device_id}: {description}")
+        
         if self.last_sync_times:
             print("\nLast Sync Times:")
             for device_id, last_sync in sorted(self.last_sync_times.items()):
@@ -393,6 +949,10 @@ def main():
     # Configuration with Replit environment variables
     API_URL = os.getenv('REPLIT_APP_URL') or os.getenv('API_URL')
     SYNC_INTERVAL = int(os.getenv('SYNC_INTERVAL', '30'))
+    SYNC_CONCURRENCY = int(os.getenv('SYNC_CONCURRENCY', '1'))
+    SYNC_MAX_CONCURRENCY = int(os.getenv('SYNC_MAX_CONCURRENCY', str(max(8, SYNC_CONCURRENCY))))
+    API_LATENCY_TARGET = float(os.getenv('API_LATENCY_TARGET', '0'))
+    SYNC_STATE_FILE = os.getenv('SYNC_STATE_FILE', 'replit_sync_state.json')
     
     # Auto-detect Replit URL if not provided
     if not API_URL and os.getenv('REPL_SLUG') and os.getenv('REPL_OWNER'):
@@ -400,8 +960,18 @@ def main():
         repl_owner = os.getenv('REPL_OWNER')
         API_URL = f"https://{repl_slug}.{repl_owner}.repl.co"
     
+    breaker = DeviceCircuitBreaker(
+        failure_threshold=int(os.getenv('BREAKER_THRESHOLD', '3')),
+        base_delay=float(os.getenv('BREAKER_BASE_DELAY', '30')),
+        max_delay=float(os.getenv('BREAKER_MAX_DELAY', '1800'))
+    )
+    
+    limiter = AdaptiveConcurrencyLimiter(initial=SYNC_CONCURRENCY, max_limit=SYNC_MAX_CONCURRENCY,
+                                         latency_target=API_LATENCY_TARGET)
+    
     # Create sync tool
-    sync_tool = ReplitAttendanceSyncTool(replit_url=API_URL, sync_interval=SYNC_INTERVAL)
+    sync_tool = ReplitAttendanceSyncTool(replit_url=API_URL, sync_interval=SYNC_INTERVAL, max_workers=limiter.max_limit,
+                                         state_file=SYNC_STATE_FILE, breaker=breaker, limiter=limiter)
     
     # Check command line arguments
     if len(sys.argv) > 1:
@@ -0,0 +1,365 @@
+import { and, asc, count, eq, gt, gte, inArray, lt, lte, ne, sql } from "drizzle-orm";
+import { db } from "./db";
+import { getGroupWorkingHours } from "./hrSettings";
+import {
+  attendance,
+  attendanceDailySummary,
+  attendanceMonthlySummary,
+  employees,
+  type Attendance,
+  type GroupWorkingHours,
+} from "../shared/schema";
+
+// Day length beyond which hours count as OT, as in AttendanceCalculator
+const REQUIRED_HOURS = { group_a: 7.75, group_b: 8.75 } as const;
+
+// Rows read or written per statement during refresh and rebuild
+const AGGREGATE_CHUNK_SIZE = 1000;
+
+type EmployeeGroup = keyof typeof REQUIRED_HOURS;
+
+interface AttendanceDay {
+  employeeId: string;
+  date: Date;
+  status: Attendance['status'];
+  checkIn: Date | null;
+  checkOut: Date | null;
+  employeeGroup: EmployeeGroup;
+}
+
+export interface AttendanceDayKey {
+  employeeId: string;
+  date: Date | string;
+}
+
+function atTimeOfDay(day: Date, time: string): Date {
+  const [hour, minute] = time.split(':').map(Number);
+  const result = new Date(day);
+  result.setHours(hour, minute, 0, 0);
+  return result;
+}
+
+function monthStart(date: Date): Date {
+  return new Date(date.getFullYear(), date.getMonth(), 1);
+}
+
+// Late and half-day use the group's grace period and half-day cut-off, as the
+// late arrival report does; OT is everything past the required day, or the
+// whole day at weekends, as the monthly attendance sheet does.
+function summarizeDay(day: AttendanceDay, settings: GroupWorkingHours): typeof attendanceDailySummary.$inferInsert {
+  const policy = day.employeeGroup === 'group_a' ? settings.groupA : settings.groupB;
+  const weekday = new Date(day.date).getDay();
+  const isWeekend = weekday === 0 || weekday === 6;
+
+  let workingHours = 0;
+  let overtimeHours = 0;
+  if (day.checkIn && day.checkOut) {
+    workingHours = Math.max(0, (day.checkOut.getTime() - day.checkIn.getTime()) / (1000 * 60 * 60));
+    overtimeHours = isWeekend ? workingHours : Math.max(0, workingHours - REQUIRED_HOURS[day.employeeGroup]);
+  }
+
+  let minutesLate = 0;
+  let isLate = false;
+  let isHalfDay = false;
+  if (day.checkIn) {
+    const graceTime = atTimeOfDay(day.checkIn, policy.lateArrivalPolicy.gracePeriodUntil);
+    if (day.checkIn > graceTime) {
+      isLate = true;
+      minutesLate = Math.floor((day.checkIn.getTime() - graceTime.getTime()) / (1000 * 60));
+      isHalfDay = day.checkIn > atTimeOfDay(day.checkIn, policy.lateArrivalPolicy.halfDayAfter);
+    }
+  }
+
+  return {
+    employeeId: day.employeeId,
+    date: day.date,
+    employeeGroup: day.employeeGroup,
+    status: day.status,
+    checkIn: day.checkIn,
+    checkOut: day.checkOut,
+    workingHours: workingHours.toFixed(2),
+    overtimeHours: overtimeHours.toFixed(2),
+    isWeekend,
+    isLate,
+    isHalfDay,
+    minutesLate,
+    updatedAt: new Date(),
+  };
+}
+
+const attendanceDayColumns = {
+  employeeId: attendance.employeeId,
+  date: attendance.date,
+  status: attendance.status,
+  checkIn: attendance.checkIn,
+  checkOut: attendance.checkOut,
+  employeeGroup: employees.employeeGroup,
+};
+
+class AttendanceAggregates {
+  private rebuilding: Promise<void> | null = null;
+
+  // Reports wait for a running rebuild so they never read a half-built table
+  async ready(): Promise<void> {
+    if (this.rebuilding) {
+      await this.rebuilding;
+    }
+  }
+
+  // Re-derive the daily rows for these employee-days and the monthly rows they
+  // roll up into. Called after every attendance write.
+  async refresh(keys: AttendanceDayKey[]): Promise<void> {
+    if (keys.length === 0) {
+      return;
+    }
+    const settings = getGroupWorkingHours();
+    const wanted = new Set(keys.map(key => `${key.employeeId}|${new Date(key.date).getTime()}`));
+    const employeeIds = Array.from(new Set(keys.map(key => key.employeeId)));
+    const times = keys.map(key => new Date(key.date).getTime());
+    const from = new Date(Math.min(...times));
+    const to = new Date(Math.max(...times));
+
+    const months = new Map<number, Set<string>>();
+    for (let i = 0; i < employeeIds.length; i += AGGREGATE_CHUNK_SIZE) {
+      const chunk = employeeIds.slice(i, i + AGGREGATE_CHUNK_SIZE);
+      const days = await db
+        .select(attendanceDayColumns)
+        .from(attendance)
+        .innerJoin(employees, eq(attendance.employeeId, employees.id))
+        .where(and(inArray(attendance.employeeId, chunk), gte(attendance.date, from), lte(attendance.date, to)));
+
+      const summaries = days
+        .filter(day => wanted.has(`${day.employeeId}|${day.date.getTime()}`))
+        .map(day => summarizeDay(day, settings));
+      await this.writeDaily(summaries);
+
+      for (const summary of summaries) {
+        const month = monthStart(summary.date).getTime();
+        if (!months.has(month)) {
+          months.set(month, new Set());
+        }
+        months.get(month)!.add(summary.employeeId);
+      }
+    }
+
+    for (const [month, monthEmployees] of months) {
+      await this.rollUpMonth(new Date(month), Array.from(monthEmployees));
+    }
+  }
+
+  // Re-derive every day of these employees, e.g. after their group changed:
+  // each daily row carries the employee's group and that group's thresholds.
+  async refreshEmployees(employeeIds: string[]): Promise<void> {
+    if (employeeIds.length === 0) {
+      return;
+    }
+    await this.ready();
+    const settings = getGroupWorkingHours();
+    const months = new Set<number>();
+    for (let i = 0; i < employeeIds.length; i += AGGREGATE_CHUNK_SIZE) {
+      const chunk = employeeIds.slice(i, i + AGGREGATE_CHUNK_SIZE);
+      // Page by id so an employee with years of attendance stays bounded too
+      let lastId = 0;
+      while (true) {
+        const page = await db
+          .select({ id: attendance.id, ...attendanceDayColumns })
+          .from(attendance)
+          .innerJoin(employees, eq(attendance.employeeId, employees.id))
+          .where(and(inArray(attendance.employeeId, chunk), gt(attendance.id, lastId)))
+          .orderBy(asc(attendance.id))
+          .limit(AGGREGATE_CHUNK_SIZE * 5);
+        if (page.length === 0) {
+          break;
+        }
+        await this.writeDaily(page.map(day => summarizeDay(day, settings)));
+        for (const day of page) {
+          months.add(monthStart(day.date).getTime());
+        }
+        lastId = page[page.length - 1].id;
+      }
+    }
+
+    for (const month of Array.from(months).sort()) {
+      await this.rollUpMonth(new Date(month), employeeIds);
+    }
+  }
+
+  // Days with attendance per employee between two dates (inclusive). Whole
+  // calendar months are read from the monthly summary, any partial months at
+  // either end from the daily summary.
+  async presentDays(from: Date, to: Date): Promise<Map<string, number>> {
+    await this.ready();
+    const result = new Map<string, number>();
+    const add = (rows: { employeeId: string; days: number }[]) => {
+      for (const row of rows) {
+        result.set(row.employeeId, (result.get(row.employeeId) ?? 0) + row.days);
+      }
+    };
+    const countDaily = async (start: Date, end: Date) => {
+      if (start > end) {
+        return;
+      }
+      add(await db
+        .select({ employeeId: attendanceDailySummary.employeeId, days: sql<number>`count(*)::int` })
+        .from(attendanceDailySummary)
+        .where(and(gte(attendanceDailySummary.date, start), lte(attendanceDailySummary.date, end)))
+        .groupBy(attendanceDailySummary.employeeId));
+    };
+
+    // First whole month on or after `from`, and the month after the last whole one before `to`
+    const firstMonth = from.getTime() === monthStart(from).getTime()
+      ? monthStart(from)
+      : new Date(from.getFullYear(), from.getMonth() + 1, 1);
+    const endMonth = monthStart(new Date(to.getTime() + 1));
+    if (firstMonth >= endMonth) {
+      await countDaily(from, to);
+      return result;
+    }
+
+    add(await db
+      .select({ employeeId: attendanceMonthlySummary.employeeId, days: sql<number>`sum(${attendanceMonthlySummary.presentDays})::int` })
+      .from(attendanceMonthlySummary)
+      .where(and(gte(attendanceMonthlySummary.month, firstMonth), lt(attendanceMonthlySummary.month, endMonth)))
+      .groupBy(attendanceMonthlySummary.employeeId));
+    await countDaily(from, new Date(firstMonth.getTime() - 1));
+    await countDaily(endMonth, to);
+    return result;
+  }
+
+  // Recompute everything, e.g. after the group working hours change
+  rebuild(): Promise<void> {
+    if (!this.rebuilding) {
+      this.rebuilding = this.rebuildAll().finally(() => {
+        this.rebuilding = null;
+      });
+    }
+    return this.rebuilding;
+  }
+
+  // Build the tables on startup if they are missing rows (first deploy, or
+  // attendance written by something other than this server), and re-derive
+  // employees whose group was changed by something other than this server
+  async rebuildIfStale(): Promise<void> {
+    const [[{ attendanceRows }], [{ summaryRows }]] = await Promise.all([
+      db.select({ attendanceRows: count() }).from(attendance),
+      db.select({ summaryRows: count() }).from(attendanceDailySummary),
+    ]);
+    if (attendanceRows !== summaryRows) {
+      console.log(`Attendance summaries out of date (${summaryRows} of ${attendanceRows} days), rebuilding...`);
+      await this.rebuild();
+      return;
+    }
+
+    const regrouped = await db
+      .selectDistinct({ employeeId: attendanceDailySummary.employeeId })
+      .from(attendanceDailySummary)
+      .innerJoin(employees, eq(attendanceDailySummary.employeeId, employees.id))
+      .where(ne(attendanceDailySummary.employeeGroup, employees.employeeGroup));
+    if (regrouped.length > 0) {
+      console.log(`Attendance summaries out of date for ${regrouped.length} regrouped employees, refreshing...`);
+      await this.refreshEmployees(regrouped.map(row => row.employeeId));
+    }
+  }
+
+  private async rebuildAll(): Promise<void> {
+    const started = Date.now();
+    const settings = getGroupWorkingHours();
+    await db.delete(attendanceMonthlySummary);
+    await db.delete(attendanceDailySummary);
+
+    // Page through attendance by id so memory stays bounded however large it is
+    let lastId = 0;
+    let total = 0;
+    const months = new Set<number>();
+    while (true) {
+      const page = await db
+        .select({ id: attendance.id, ...attendanceDayColumns })
+        .from(attendance)
+        .innerJoin(employees, eq(attendance.employeeId, employees.id))
+        .where(gt(attendance.id, lastId))
+        .orderBy(asc(attendance.id))
+        .limit(AGGREGATE_CHUNK_SIZE * 5);
+      if (page.length === 0) {
+        break;
+      }
+      await this.writeDaily(page.map(day => summarizeDay(day, settings)));
+      for (const day of page) {
+        months.add(monthStart(day.date).getTime());
+      }
+      lastId = page[page.length - 1].id;
+      total += page.length;
+    }
+
+    for (const month of Array.from(months).sort()) {
+      await this.rollUpMonth(new Date(month));
+    }
+    console.log(`Rebuilt attendance summaries: ${total} days, ${months.size} months in ${Date.now() - started}ms`);
+  }
+
+  private async writeDaily(summaries: (typeof attendanceDailySummary.$inferInsert)[]): Promise<void> {
+    for (let i = 0; i < summaries.length; i += AGGREGATE_CHUNK_SIZE) {
+      await db
+        .insert(attendanceDailySummary)
+        .values(summaries.slice(i, i + AGGREGATE_CHUNK_SIZE))
+        .onConflictDoUpdate({
+          target: [attendanceDailySummary.employeeId, attendanceDailySummary.date],
+          set: {
+            employeeGroup: sql`excluded.employee_group`,
+            status: sql`excluded.status`,
+            checkIn: sql`excluded.check_in`,
+            checkOut: sql`excluded.check_out`,
+            workingHours: sql`excluded.working_hours`,
+            overtimeHours: sql`excluded.overtime_hours`,
+            isWeekend: sql`excluded.is_weekend`,
+            isLate: sql`excluded.is_late`,
+            isHalfDay: sql`excluded.is_half_day`,
+            minutesLate: sql`excluded.minutes_late`,
+            updatedAt: sql`excluded.updated_at`,
+          },
+        });
+    }
+  }
+
+  // Aggregate a month's daily rows (for some employees, or everyone) into the monthly table
+  private async rollUpMonth(month: Date, employeeIds?: string[]): Promise<void> {
+    const nextMonth = new Date(month.getFullYear(), month.getMonth() + 1, 1);
+    const conditions = [gte(attendanceDailySummary.date, month), lt(attendanceDailySummary.date, nextMonth)];
+    if (employeeIds) {
+      conditions.push(inArray(attendanceDailySummary.employeeId, employeeIds));
+    }
+
+    const totals = await db
+      .select({
+        employeeId: attendanceDailySummary.employeeId,
+        presentDays: sql<number>`count(*)::int`,
+        weekdayPresentDays: sql<number>`(count(*) filter (where not ${attendanceDailySummary.isWeekend}))::int`,
+        lateDays: sql<number>`(count(*) filter (where ${attendanceDailySummary.isLate} and not ${attendanceDailySummary.isHalfDay}))::int`,
+        halfDays: sql<number>`(count(*) filter (where ${attendanceDailySummary.isHalfDay}))::int`,
+        workingHours: sql<string>`sum(${attendanceDailySummary.workingHours})`,
+        overtimeHours: sql<string>`sum(${attendanceDailySummary.overtimeHours})`,
+      })
+      .from(attendanceDailySummary)
+      .where(and(...conditions))
+      .groupBy(attendanceDailySummary.employeeId);
+
+    for (let i = 0; i < totals.length; i += AGGREGATE_CHUNK_SIZE) {
+      await db
+        .insert(attendanceMonthlySummary)
+        .values(totals.slice(i, i + AGGREGATE_CHUNK_SIZE).map(total => ({ ...total, month, updatedAt: new Date() })))
+        .onConflictDoUpdate({
+          target: [attendanceMonthlySummary.employeeId, attendanceMonthlySummary.month],
+          set: {
+            presentDays: sql`excluded.present_days`,
+            weekdayPresentDays: sql`excluded.weekday_present_days`,
+            lateDays: sql`excluded.late_days`,
+            halfDays: sql`excluded.half_days`,
+            workingHours: sql`excluded.working_hours`,
+            overtimeHours: sql`excluded.overtime_hours`,
+            updatedAt: sql`excluded.updated_at`,
+          },
+        });
+    }
+  }
+}
+
+export const attendanceAggregates = new AttendanceAggregates();
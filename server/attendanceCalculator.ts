@@ -1,8 +1,10 @@
 // Comprehensive Attendance Calculation Engine
 // Implements exact Group A and Group B policies as per requirements
 
-import { GroupWorkingHours } from '../shared/schema';
+import { and, eq, gte, inArray, lte } from 'drizzle-orm';
+import { attendance, employees, holidays, shortLeaveRequests, GroupWorkingHours } from '../shared/schema';
 import { getGroupWorkingHours } from './hrSettings';
+import { db } from './db';
 
 export interface AttendanceCalculationResult {
   status: 'present' | 'absent' | 'late' | 'early_departure' | 'half_day';
@@ -20,12 +22,100 @@ export interface HolidayInfo {
   isSpecialHoliday: boolean;
 }
 
-export class AttendanceCalculator {
-  private groupSettings: GroupWorkingHours;
+type EmployeeGroup = 'group_a' | 'group_b';
 
-  constructor() {
-    this.groupSettings = getGroupWorkingHours();
-  }
+// Time-of-day thresholds in minutes since midnight, so a policy check is an
+// integer comparison instead of formatting each punch as an HH:MM string
+interface GroupThresholds {
+  graceUntil: number;
+  halfDayAfter: number;
+  halfDayBefore: number;
+  morningShortLeave: [number, number];
+  eveningShortLeave: [number, number];
+  offerFrom: number;
+  requiredHours: number;
+}
+
+// Status codes used by the batch result columns
+export const BATCH_STATUSES: AttendanceCalculationResult['status'][] = ['present', 'absent', 'late', 'early_departure', 'half_day'];
+const STATUS_PRESENT = 0;
+const STATUS_ABSENT = 1;
+const STATUS_LATE = 2;
+const STATUS_HALF_DAY = 4;
+
+// Bits in AttendanceBatchResult.flags
+export const BATCH_FLAG_WEEKEND = 1;
+export const BATCH_FLAG_HOLIDAY = 2;
+export const BATCH_FLAG_SHORT_LEAVE_APPLICABLE = 4;
+export const BATCH_FLAG_LATE_PENALTY = 8;
+export const BATCH_FLAG_HALF_DAY_PENALTY = 16;
+
+export interface AttendanceBatchInput {
+  from: Date;
+  to: Date;
+  employees: { id: string; employeeGroup: EmployeeGroup }[];
+  records: { employeeId: string; date: Date; checkIn: Date | null; checkOut: Date | null }[];
+  holidays?: { date: Date; isRecurring: boolean; isActive: boolean; applicableGroups: string[] }[];
+  shortLeaves?: { employeeId: string; date: Date }[];
+}
+
+/**
+ * Results for every employee on every day of the range, one typed array per
+ * field. Row `e * days.length + d` is employeeIds[e] on days[d].
+ */
+export interface AttendanceBatchResult {
+  employeeIds: string[];
+  days: Date[];
+  status: Uint8Array;
+  flags: Uint8Array;
+  workingHours: Float64Array;
+  overtimeHours: Float64Array;
+  offerHours: Float64Array;
+}
+
+const MS_PER_DAY = 24 * 60 * 60 * 1000;
+const MS_PER_HOUR = 60 * 60 * 1000;
+
+function toMinutes(time: string): number {
+  const [hour, minute] = time.split(':').map(Number);
+  return hour * 60 + minute;
+}
+
+// 600 -> "10:00 AM", for notes
+function formatMinutes(minutes: number): string {
+  const hour = Math.floor(minutes / 60);
+  const minute = String(minutes % 60).padStart(2, '0');
+  return `${hour % 12 || 12}:${minute} ${hour < 12 ? 'AM' : 'PM'}`;
+}
+
+function minuteOfDay(date: Date): number {
+  return date.getHours() * 60 + date.getMinutes();
+}
+
+// Calendar day number, unaffected by DST changes within the range
+function dayNumber(date: Date): number {
+  return Math.round(Date.UTC(date.getFullYear(), date.getMonth(), date.getDate()) / MS_PER_DAY);
+}
+
+/**
+ * Row finder for a batch result: the row of an employee on a day, or -1 when
+ * either is outside the batch
+ */
+export function batchRowLookup(result: Pick<AttendanceBatchResult, 'employeeIds' | 'days'>): (employeeId: string, date: Date) => number {
+  const employeeIndex = new Map(result.employeeIds.map((id, e) => [id, e]));
+  const dayCount = result.days.length;
+  const firstDay = dayCount > 0 ? dayNumber(result.days[0]) : 0;
+  return (employeeId, date) => {
+    const e = employeeIndex.get(employeeId);
+    const d = dayNumber(new Date(date)) - firstDay;
+    return e === undefined || d < 0 || d >= dayCount ? -1 : e * dayCount + d;
+  };
+}
+
+export class AttendanceCalculator {
+  // Thresholds for the most recently seen settings, keyed by their JSON so an
+  // unchanged settings file is not derived again
+  private thresholdCache: { key: string; thresholds: Record<EmployeeGroup, GroupThresholds> } | null = null;
 
   /**
    * Calculate attendance based on Group A or Group B policies
@@ -47,9 +137,8 @@ export class AttendanceCalculator {
       notes: []
     };
 
-    // Get group-specific settings
-    const groupConfig = employeeGroup === 'group_a' ? this.groupSettings.groupA : this.groupSettings.groupB;
-    const requiredHours = groupConfig.durationMinutes / 60; // Convert minutes to hours
+    // Get group-specific thresholds
+    const thresholds = this.thresholdsFor(getGroupWorkingHours())[employeeGroup];
 
     if (!checkIn) {
       result.status = 'absent';
@@ -58,8 +147,8 @@ export class AttendanceCalculator {
     }
 
     // Extract time components
-    const checkInTime = this.getTimeString(checkIn);
-    const checkOutTime = checkOut ? this.getTimeString(checkOut) : null;
+    const checkInTime = minuteOfDay(checkIn);
+    const checkOutTime = checkOut ? minuteOfDay(checkOut) : null;
 
     // Calculate total working hours if check-out exists
     if (checkOut) {
@@ -80,9 +169,9 @@ export class AttendanceCalculator {
 
     // Apply group-specific policies
     if (employeeGroup === 'group_a') {
-      return this.calculateGroupAAttendance(checkInTime, checkOutTime, result, groupConfig, shortLeaveUsed);
+      return this.calculateGroupAAttendance(checkInTime, checkOutTime, result, thresholds, shortLeaveUsed);
     } else {
-      return this.calculateGroupBAttendance(checkInTime, checkOutTime, result, groupConfig, shortLeaveUsed);
+      return this.calculateGroupBAttendance(checkInTime, checkOutTime, result, thresholds, shortLeaveUsed);
     }
   }
 
@@ -91,24 +180,24 @@ export class AttendanceCalculator {
    * Standard Time: 8:30 AM – 4:15 PM (7.75 hours)
    */
   private calculateGroupAAttendance(
-    checkInTime: string,
-    checkOutTime: string | null,
+    checkInTime: number,
+    checkOutTime: number | null,
     result: AttendanceCalculationResult,
-    groupConfig: any,
+    thresholds: GroupThresholds,
     shortLeaveUsed: boolean
   ): AttendanceCalculationResult {
     
-    const requiredHours = 7.75;
+    const requiredHours = thresholds.requiredHours;
     
     // Late arrival analysis
-    if (checkInTime <= '09:00') {
+    if (checkInTime <= thresholds.graceUntil) {
       // Within 30-minute grace period
       result.status = 'present';
-    } else if (checkInTime > '09:00' && checkInTime <= '10:00') {
+    } else if (checkInTime <= thresholds.halfDayAfter) {
       result.status = 'late';
       result.lateArrivalPenalty = 'Late arrival';
-      result.notes.push('Arrived after grace period');
-    } else if (checkInTime > '10:00' && checkInTime < '14:45') {
+      result.notes.push(`Arrived after grace period (${formatMinutes(thresholds.graceUntil)})`);
+    } else if (checkInTime < thresholds.halfDayBefore) {
       // Half day rule
       if (shortLeaveUsed) {
         result.status = 'present';
@@ -117,7 +206,7 @@ export class AttendanceCalculator {
       } else {
         result.status = 'half_day';
         result.lateArrivalPenalty = 'Half day';
-        result.notes.push('Arrival after 10:00 AM - marked as half day');
+        result.notes.push(`Arrival after ${formatMinutes(thresholds.halfDayAfter)} - marked as half day`);
       }
     } else {
       result.status = 'absent';
@@ -125,15 +214,14 @@ export class AttendanceCalculator {
     }
 
     // Check short leave eligibility
-    if ((checkInTime >= '08:30' && checkInTime <= '10:00') || 
-        (checkOutTime && checkOutTime >= '14:45' && checkOutTime <= '16:15')) {
+    if (this.isShortLeaveWindow(checkInTime, checkOutTime, thresholds)) {
       result.isShortLeaveApplicable = true;
     }
 
     // Calculate overtime (only if meeting minimum working hours)
     if (result.workingHours > requiredHours && result.status !== 'half_day') {
       result.overtimeHours = result.workingHours - requiredHours;
-      result.notes.push(`Overtime: ${result.overtimeHours.toFixed(2)} hours beyond 7.75 hours`);
+      result.notes.push(`Overtime: ${result.overtimeHours.toFixed(2)} hours beyond ${requiredHours} hours`);
     }
 
     return result;
@@ -144,24 +232,24 @@ export class AttendanceCalculator {
    * Standard Time: 8:00 AM – 4:45 PM (8.75 hours)
    */
   private calculateGroupBAttendance(
-    checkInTime: string,
-    checkOutTime: string | null,
+    checkInTime: number,
+    checkOutTime: number | null,
     result: AttendanceCalculationResult,
-    groupConfig: any,
+    thresholds: GroupThresholds,
     shortLeaveUsed: boolean
   ): AttendanceCalculationResult {
     
-    const requiredHours = 8.75;
+    const requiredHours = thresholds.requiredHours;
     
     // Late arrival analysis
-    if (checkInTime <= '08:15') {
+    if (checkInTime <= thresholds.graceUntil) {
       // Within 15-minute grace period
       result.status = 'present';
-    } else if (checkInTime > '08:15' && checkInTime <= '09:30') {
+    } else if (checkInTime <= thresholds.halfDayAfter) {
       result.status = 'late';
       result.lateArrivalPenalty = 'Late arrival';
-      result.notes.push('Arrived after 15-minute grace period');
-    } else if (checkInTime > '09:30' && checkInTime < '15:15') {
+      result.notes.push(`Arrived after grace period (${formatMinutes(thresholds.graceUntil)})`);
+    } else if (checkInTime < thresholds.halfDayBefore) {
       // Half day rule (unless covered by short leave)
       if (shortLeaveUsed) {
         result.status = 'present';
@@ -170,7 +258,7 @@ export class AttendanceCalculator {
       } else {
         result.status = 'half_day';
         result.lateArrivalPenalty = 'Half day';
-        result.notes.push('Arrival after 9:30 AM - marked as half day');
+        result.notes.push(`Arrival after ${formatMinutes(thresholds.halfDayAfter)} - marked as half day`);
       }
     } else {
       result.status = 'absent';
@@ -178,15 +266,14 @@ export class AttendanceCalculator {
     }
 
     // Check short leave eligibility
-    if ((checkInTime >= '08:00' && checkInTime <= '09:30') || 
-        (checkOutTime && checkOutTime >= '15:15' && checkOutTime <= '16:45')) {
+    if (this.isShortLeaveWindow(checkInTime, checkOutTime, thresholds)) {
       result.isShortLeaveApplicable = true;
     }
 
     // Calculate overtime (only if meeting minimum working hours)
     if (result.workingHours > requiredHours && result.status !== 'half_day') {
       result.overtimeHours = result.workingHours - requiredHours;
-      result.notes.push(`Overtime: ${result.overtimeHours.toFixed(2)} hours beyond 8.75 hours`);
+      result.notes.push(`Overtime: ${result.overtimeHours.toFixed(2)} hours beyond ${requiredHours} hours`);
     }
 
     return result;
@@ -207,12 +294,11 @@ export class AttendanceCalculator {
     
     if (!checkOut) return 0;
 
-    const overtimeStartTime = employeeGroup === 'group_a' ? '16:15' : '16:45';
-    const [hour, minute] = overtimeStartTime.split(':').map(Number);
+    const { offerFrom } = this.thresholdsFor(getGroupWorkingHours())[employeeGroup];
     
     // Create overtime start time for the same date
     const overtimeStart = new Date(checkIn);
-    overtimeStart.setHours(hour, minute, 0, 0);
+    overtimeStart.setHours(Math.floor(offerFrom / 60), offerFrom % 60, 0, 0);
     
     let offerHours = 0;
 
@@ -238,15 +324,45 @@ export class AttendanceCalculator {
     employeeGroup: 'group_a' | 'group_b',
     currentMonthUsage: number
   ): boolean {
-    const groupConfig = employeeGroup === 'group_a' ? this.groupSettings.groupA : this.groupSettings.groupB;
+    const settings = getGroupWorkingHours();
+    const groupConfig = employeeGroup === 'group_a' ? settings.groupA : settings.groupB;
     return currentMonthUsage < groupConfig.shortLeavePolicy.maxPerMonth;
   }
 
   /**
-   * Get time string in HH:MM format
+   * Minute thresholds for both groups, derived again only when the settings
+   * change. Every public method resolves settings through here, so single-day
+   * and batch results always follow the same HR settings. Required hours stay
+   * fixed at the standard day (7.75 / 8.75) and offer hours start at the
+   * group's end time.
+   */
+  private thresholdsFor(settings: GroupWorkingHours): Record<EmployeeGroup, GroupThresholds> {
+    const key = JSON.stringify(settings);
+    let cached = this.thresholdCache;
+    if (!cached || cached.key !== key) {
+      const derive = (config: GroupWorkingHours['groupA'] | GroupWorkingHours['groupB'], requiredHours: number): GroupThresholds => ({
+        graceUntil: toMinutes(config.lateArrivalPolicy.gracePeriodUntil),
+        halfDayAfter: toMinutes(config.lateArrivalPolicy.halfDayAfter),
+        halfDayBefore: toMinutes(config.lateArrivalPolicy.halfDayBefore),
+        morningShortLeave: [toMinutes(config.shortLeavePolicy.morningStart), toMinutes(config.shortLeavePolicy.morningEnd)],
+        eveningShortLeave: [toMinutes(config.shortLeavePolicy.eveningStart), toMinutes(config.shortLeavePolicy.eveningEnd)],
+        offerFrom: toMinutes(config.endTime),
+        requiredHours,
+      });
+      cached = { key, thresholds: { group_a: derive(settings.groupA, 7.75), group_b: derive(settings.groupB, 8.75) } };
+      this.thresholdCache = cached;
+    }
+    return cached.thresholds;
+  }
+
+  /**
+   * Arrival in the morning short leave window or departure in the evening one
    */
-  private getTimeString(date: Date): string {
-    return date.toTimeString().substring(0, 5);
+  private isShortLeaveWindow(checkInTime: number, checkOutTime: number | null, thresholds: GroupThresholds): boolean {
+    const [morningStart, morningEnd] = thresholds.morningShortLeave;
+    const [eveningStart, eveningEnd] = thresholds.eveningShortLeave;
+    return (checkInTime >= morningStart && checkInTime <= morningEnd) ||
+      (checkOutTime !== null && checkOutTime >= eveningStart && checkOutTime <= eveningEnd);
   }
 
   /**
@@ -264,6 +380,187 @@ export class AttendanceCalculator {
       isSpecialHoliday: false // Check against special holidays
     };
   }
+
+  /**
+   * Evaluate every employee on every day of a range in one pass. Settings,
+   * thresholds and the weekend/holiday calendar are resolved once up front;
+   * the per-day rules are the same as calculateAttendance and
+   * calculateOfferHours, without the free-text notes.
+   */
+  calculateBatch(input: AttendanceBatchInput): AttendanceBatchResult {
+    const thresholds = this.thresholdsFor(getGroupWorkingHours());
+    const firstDay = dayNumber(input.from);
+    const dayCount = Math.max(0, dayNumber(input.to) - firstDay + 1);
+    const days = Array.from({ length: dayCount }, (_, d) =>
+      new Date(input.from.getFullYear(), input.from.getMonth(), input.from.getDate() + d));
+
+    // Weekend and per-group holiday calendars for the range
+    const calendar = {
+      group_a: new Uint8Array(dayCount),
+      group_b: new Uint8Array(dayCount),
+    };
+    days.forEach((day, d) => {
+      if (day.getDay() === 0 || day.getDay() === 6) {
+        calendar.group_a[d] = calendar.group_b[d] = BATCH_FLAG_WEEKEND;
+      }
+    });
+    for (const holiday of input.holidays ?? []) {
+      if (!holiday.isActive) continue;
+      const holidayDate = new Date(holiday.date);
+      const matches = holiday.isRecurring
+        ? days.flatMap((day, d) => day.getMonth() === holidayDate.getMonth() && day.getDate() === holidayDate.getDate() ? [d] : [])
+        : [dayNumber(holidayDate) - firstDay].filter(d => d >= 0 && d < dayCount);
+      for (const group of ['group_a', 'group_b'] as const) {
+        if (!holiday.applicableGroups.includes(group)) continue;
+        for (const d of matches) {
+          calendar[group][d] |= BATCH_FLAG_HOLIDAY;
+        }
+      }
+    }
+
+    const employeeIds = input.employees.map(employee => employee.id);
+    const rowOf = batchRowLookup({ employeeIds, days });
+
+    const rows = input.employees.length * dayCount;
+    const result: AttendanceBatchResult = {
+      employeeIds,
+      days,
+      status: new Uint8Array(rows).fill(STATUS_ABSENT),
+      flags: new Uint8Array(rows),
+      workingHours: new Float64Array(rows),
+      overtimeHours: new Float64Array(rows),
+      offerHours: new Float64Array(rows),
+    };
+    input.employees.forEach((employee, e) => {
+      result.flags.set(calendar[employee.employeeGroup], e * dayCount);
+    });
+
+    const shortLeaveRows = new Set<number>();
+    for (const shortLeave of input.shortLeaves ?? []) {
+      shortLeaveRows.add(rowOf(shortLeave.employeeId, shortLeave.date));
+    }
+
+    for (const record of input.records) {
+      const row = rowOf(record.employeeId, record.date);
+      if (row < 0 || !record.checkIn) continue;
+      const checkIn = new Date(record.checkIn);
+      const checkOut = record.checkOut ? new Date(record.checkOut) : null;
+      const group = input.employees[Math.floor(row / dayCount)].employeeGroup;
+      this.evaluateRow(result, row, checkIn, checkOut, thresholds[group], shortLeaveRows.has(row));
+    }
+
+    return result;
+  }
+
+  /**
+   * Load employees, attendance, holidays and approved short leave for a date
+   * range and evaluate them with calculateBatch
+   */
+  async calculateRange(from: Date, to: Date, employeeIds?: string[]): Promise<AttendanceBatchResult> {
+    return this.calculateBatch(await this.loadRange(from, to, employeeIds));
+  }
+
+  /**
+   * The calculateBatch input for a date range, read from the database
+   */
+  async loadRange(from: Date, to: Date, employeeIds?: string[]): Promise<AttendanceBatchInput> {
+    const rangeEnd = new Date(to.getFullYear(), to.getMonth(), to.getDate(), 23, 59, 59, 999);
+    const employeeFilter = employeeIds ? inArray(employees.id, employeeIds) : undefined;
+
+    const [employeeRows, attendanceRows, holidayRows, shortLeaveRows] = await Promise.all([
+      db.select({ id: employees.id, employeeGroup: employees.employeeGroup })
+        .from(employees)
+        .where(employeeFilter)
+        .orderBy(employees.id),
+      db.select({
+        employeeId: attendance.employeeId,
+        date: attendance.date,
+        checkIn: attendance.checkIn,
+        checkOut: attendance.checkOut,
+      })
+        .from(attendance)
+        .where(and(
+          gte(attendance.date, from),
+          lte(attendance.date, rangeEnd),
+          employeeIds ? inArray(attendance.employeeId, employeeIds) : undefined
+        )),
+      db.select().from(holidays).where(eq(holidays.isActive, true)),
+      db.select({ employeeId: shortLeaveRequests.employeeId, date: shortLeaveRequests.date })
+        .from(shortLeaveRequests)
+        .where(and(
+          eq(shortLeaveRequests.status, 'approved'),
+          gte(shortLeaveRequests.date, from),
+          lte(shortLeaveRequests.date, rangeEnd)
+        )),
+    ]);
+
+    return {
+      from,
+      to,
+      employees: employeeRows,
+      records: attendanceRows,
+      holidays: holidayRows,
+      shortLeaves: shortLeaveRows,
+    };
+  }
+
+  /**
+   * One employee-day of calculateBatch, mirroring calculateAttendance
+   */
+  private evaluateRow(
+    result: AttendanceBatchResult,
+    row: number,
+    checkIn: Date,
+    checkOut: Date | null,
+    thresholds: GroupThresholds,
+    shortLeaveUsed: boolean
+  ): void {
+    const workingHours = checkOut ? Math.max(0, (checkOut.getTime() - checkIn.getTime()) / MS_PER_HOUR) : 0;
+    result.workingHours[row] = workingHours;
+
+    // Holidays and weekends: all hours are OT and offer hours
+    if (result.flags[row] & (BATCH_FLAG_WEEKEND | BATCH_FLAG_HOLIDAY)) {
+      if (checkOut) {
+        result.status[row] = STATUS_PRESENT;
+        result.overtimeHours[row] = workingHours;
+        result.offerHours[row] = (checkOut.getTime() - checkIn.getTime()) / MS_PER_HOUR;
+      }
+      return;
+    }
+
+    const checkInTime = minuteOfDay(checkIn);
+    const checkOutTime = checkOut ? minuteOfDay(checkOut) : null;
+    let status = STATUS_ABSENT;
+    let flags = result.flags[row];
+    if (checkInTime <= thresholds.graceUntil) {
+      status = STATUS_PRESENT;
+    } else if (checkInTime <= thresholds.halfDayAfter) {
+      status = STATUS_LATE;
+      flags |= BATCH_FLAG_LATE_PENALTY;
+    } else if (checkInTime < thresholds.halfDayBefore) {
+      if (shortLeaveUsed) {
+        status = STATUS_PRESENT;
+        flags |= BATCH_FLAG_SHORT_LEAVE_APPLICABLE;
+      } else {
+        status = STATUS_HALF_DAY;
+        flags |= BATCH_FLAG_HALF_DAY_PENALTY;
+      }
+    }
+    if (this.isShortLeaveWindow(checkInTime, checkOutTime, thresholds)) {
+      flags |= BATCH_FLAG_SHORT_LEAVE_APPLICABLE;
+    }
+
+    result.status[row] = status;
+    result.flags[row] = flags;
+    if (workingHours > thresholds.requiredHours && status !== STATUS_HALF_DAY) {
+      result.overtimeHours[row] = workingHours - thresholds.requiredHours;
+    }
+    if (checkOut) {
+      const overtimeStart = new Date(checkIn);
+      overtimeStart.setHours(Math.floor(thresholds.offerFrom / 60), thresholds.offerFrom % 60, 0, 0);
+      result.offerHours[row] = Math.max(0, (checkOut.getTime() - overtimeStart.getTime()) / MS_PER_HOUR);
+    }
+  }
 }
 
 export const attendanceCalculator = new AttendanceCalculator();
\ No newline at end of file
@@ -0,0 +1,83 @@
+import { sql } from "drizzle-orm";
+import { db } from "./db";
+import { attendanceAggregates } from "./attendanceAggregates";
+import { attendance } from "../shared/schema";
+
+type AttendanceInsert = typeof attendance.$inferInsert;
+
+// 9 bound parameters per row keeps a chunk well under PostgreSQL's 65535 limit
+const UPSERT_CHUNK_SIZE = 1000;
+
+// The attendance.date of a punch or calendar day: local midnight of its local
+// calendar day. Every writer keys days this way, so rows for the same
+// employee-day always meet on employee_date_idx. A 'YYYY-MM-DD' string is
+// taken as that calendar day.
+export function attendanceDay(value: Date | string): Date {
+  if (typeof value === 'string' && /^\d{4}-\d{2}-\d{2}$/.test(value)) {
+    const [year, month, day] = value.split('-').map(Number);
+    return new Date(year, month - 1, day);
+  }
+  const date = new Date(value);
+  return new Date(date.getFullYear(), date.getMonth(), date.getDate());
+}
+
+function hoursBetween(checkIn: Date, checkOut: Date): string {
+  return ((checkOut.getTime() - checkIn.getTime()) / (1000 * 60 * 60)).toFixed(2);
+}
+
+// Write daily first-in/last-out rows with one INSERT ... ON CONFLICT per chunk
+// on employee_date_idx. A row that already exists keeps the earliest check-in
+// and latest check-out of the stored and incoming values, so a later sync can
+// extend a day but never shorten it, whatever order punches arrive in. A
+// manually set status or note is kept; only 'absent' is lifted by a punch.
+// The report summaries for those days are refreshed afterwards.
+// Returns the number of employee-days written.
+export async function upsertAttendanceRecords(records: AttendanceInsert[]): Promise<number> {
+  // One statement may not touch the same row twice, so merge duplicate days first
+  const merged = new Map<string, AttendanceInsert>();
+  for (const record of records) {
+    const date = attendanceDay(record.date);
+    const key = `${record.employeeId}|${date.getTime()}`;
+    const existing = merged.get(key);
+    if (!existing) {
+      merged.set(key, { ...record, date });
+      continue;
+    }
+    if (record.checkIn && (!existing.checkIn || record.checkIn < existing.checkIn)) {
+      existing.checkIn = record.checkIn;
+    }
+    if (record.checkOut && (!existing.checkOut || record.checkOut > existing.checkOut)) {
+      existing.checkOut = record.checkOut;
+    }
+  }
+
+  const rows = Array.from(merged.values()).map(record => ({
+    ...record,
+    workingHours: record.checkIn && record.checkOut
+      ? hoursBetween(record.checkIn, record.checkOut)
+      : record.workingHours ?? null,
+  }));
+  if (rows.length === 0) {
+    return 0;
+  }
+
+  await db.transaction(async (tx) => {
+    for (let i = 0; i < rows.length; i += UPSERT_CHUNK_SIZE) {
+      await tx
+        .insert(attendance)
+        .values(rows.slice(i, i + UPSERT_CHUNK_SIZE))
+        .onConflictDoUpdate({
+          target: [attendance.employeeId, attendance.date],
+          set: {
+            checkIn: sql`least(attendance.check_in, excluded.check_in)`,
+            checkOut: sql`greatest(attendance.check_out, excluded.check_out)`,
+            workingHours: sql`round((extract(epoch from greatest(attendance.check_out, excluded.check_out) - least(attendance.check_in, excluded.check_in)) / 3600)::numeric, 2)`,
+            status: sql`case when attendance.status = 'absent' then excluded.status else attendance.status end`,
+          },
+        });
+    }
+  });
+
+  await attendanceAggregates.refresh(rows);
+  return rows.length;
+}
@@ -0,0 +1,110 @@
+import { pool } from "./db";
+import {
+  attendanceCalculator,
+  batchRowLookup,
+  BATCH_FLAG_HALF_DAY_PENALTY,
+  BATCH_FLAG_HOLIDAY,
+  BATCH_FLAG_LATE_PENALTY,
+  BATCH_FLAG_SHORT_LEAVE_APPLICABLE,
+  BATCH_FLAG_WEEKEND,
+  BATCH_STATUSES,
+} from "./attendanceCalculator";
+
+// Evaluates a date range with calculateBatch and again one day at a time with
+// calculateAttendance and calculateOfferHours on the same inputs, and reports
+// every row where they disagree. The weekend/holiday calendar is derived
+// separately from the dates and the holidays table and compared too. Usage:
+//   npm run check:calculator -- [from YYYY-MM-DD] [to YYYY-MM-DD]
+// The range defaults to the current year so far.
+
+const TOLERANCE = 1e-9;
+const MAX_REPORTED = 20;
+
+async function checkCalculator() {
+  const now = new Date();
+  const from = new Date(process.argv[2] ?? `${now.getFullYear()}-01-01`);
+  const to = process.argv[3] ? new Date(process.argv[3]) : now;
+  let mismatches = 0;
+
+  try {
+    const input = await attendanceCalculator.loadRange(from, to);
+    const started = performance.now();
+    const batch = attendanceCalculator.calculateBatch(input);
+    const elapsed = performance.now() - started;
+    console.log(`calculateBatch: ${input.employees.length} employees x ${batch.days.length} days ` +
+      `(${input.records.length} attendance rows) in ${elapsed.toFixed(1)}ms`);
+
+    const rowOf = batchRowLookup(batch);
+    const groups = new Map(input.employees.map(employee => [employee.id, employee.employeeGroup]));
+    const shortLeaveRows = new Set((input.shortLeaves ?? []).map(leave => rowOf(leave.employeeId, leave.date)));
+    const isHoliday = (day: Date, group: string) => (input.holidays ?? []).some(holiday => {
+      const holidayDate = new Date(holiday.date);
+      return holiday.isActive && holiday.applicableGroups.includes(group) &&
+        holidayDate.getMonth() === day.getMonth() && holidayDate.getDate() === day.getDate() &&
+        (holiday.isRecurring || holidayDate.getFullYear() === day.getFullYear());
+    });
+    const report = (what: string, employeeId: string, date: Date, expected: unknown, actual: unknown) => {
+      mismatches++;
+      if (mismatches <= MAX_REPORTED) {
+        console.error(`  ${employeeId} ${date.toDateString()}: ${what} expected ${expected}, batch gave ${actual}`);
+      }
+    };
+
+    let checked = 0;
+    for (const record of input.records) {
+      const row = rowOf(record.employeeId, record.date);
+      if (row < 0 || !record.checkIn) continue;
+      checked++;
+      const checkIn = new Date(record.checkIn);
+      const checkOut = record.checkOut ? new Date(record.checkOut) : null;
+      const flags = batch.flags[row];
+      const group = groups.get(record.employeeId)!;
+      // The calendar is worked out here from the date and the holidays table, not taken from the batch
+      const day = new Date(record.date);
+      const holidayInfo = {
+        isHoliday: isHoliday(day, group),
+        isWeekend: day.getDay() === 0 || day.getDay() === 6,
+        isMercantileHoliday: false,
+        isSpecialHoliday: false,
+      };
+      if (((flags & BATCH_FLAG_WEEKEND) !== 0) !== holidayInfo.isWeekend) {
+        report('isWeekend', record.employeeId, record.date, holidayInfo.isWeekend, !holidayInfo.isWeekend);
+      }
+      if (((flags & BATCH_FLAG_HOLIDAY) !== 0) !== holidayInfo.isHoliday) {
+        report('isHoliday', record.employeeId, record.date, holidayInfo.isHoliday, !holidayInfo.isHoliday);
+      }
+      const expected = attendanceCalculator.calculateAttendance(checkIn, checkOut, group, holidayInfo, shortLeaveRows.has(row));
+      const penalty = flags & BATCH_FLAG_HALF_DAY_PENALTY ? 'Half day' : flags & BATCH_FLAG_LATE_PENALTY ? 'Late arrival' : null;
+      const offerHours = checkOut ? attendanceCalculator.calculateOfferHours(checkIn, checkOut, group, holidayInfo) : 0;
+
+      if (BATCH_STATUSES[batch.status[row]] !== expected.status) {
+        report('status', record.employeeId, record.date, expected.status, BATCH_STATUSES[batch.status[row]]);
+      }
+      if (Math.abs(batch.workingHours[row] - expected.workingHours) > TOLERANCE) {
+        report('workingHours', record.employeeId, record.date, expected.workingHours, batch.workingHours[row]);
+      }
+      if (Math.abs(batch.overtimeHours[row] - expected.overtimeHours) > TOLERANCE) {
+        report('overtimeHours', record.employeeId, record.date, expected.overtimeHours, batch.overtimeHours[row]);
+      }
+      if (((flags & BATCH_FLAG_SHORT_LEAVE_APPLICABLE) !== 0) !== expected.isShortLeaveApplicable) {
+        report('isShortLeaveApplicable', record.employeeId, record.date, expected.isShortLeaveApplicable, !expected.isShortLeaveApplicable);
+      }
+      if (penalty !== expected.lateArrivalPenalty) {
+        report('lateArrivalPenalty', record.employeeId, record.date, expected.lateArrivalPenalty, penalty);
+      }
+      if (Math.abs(batch.offerHours[row] - offerHours) > TOLERANCE) {
+        report('offerHours', record.employeeId, record.date, offerHours, batch.offerHours[row]);
+      }
+    }
+
+    console.log(`Checked ${checked} employee-days: ${mismatches === 0 ? 'batch matches calculateAttendance' : `${mismatches} mismatches`}`);
+  } catch (error) {
+    console.error("Calculator check failed:", error);
+    mismatches++;
+  } finally {
+    await pool.end();
+    process.exit(mismatches === 0 ? 0 : 1);
+  }
+}
+
+checkCalculator();
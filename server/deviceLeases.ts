@@ -0,0 +1,123 @@
+import { createHash } from "crypto";
+import { and, eq, lt, notInArray, or, sql } from "drizzle-orm";
+import { db } from "./db";
+import { deviceListCache } from "./deviceListCache";
+import { syncDeviceLeases, syncWorkers } from "../shared/schema";
+
+// Workers silent for this long are forgotten entirely (their leases expired long before)
+const FORGET_WORKER_MS = 24 * 60 * 60 * 1000;
+
+// Rendezvous hashing: a device belongs to the live worker with the highest
+// score for it, so a worker joining or leaving only moves the devices it wins
+// or held, and every worker computes the same assignment independently
+function score(workerId: string, deviceId: string): number {
+  return parseInt(createHash("sha1").update(`${workerId}|${deviceId}`).digest("hex").slice(0, 12), 16);
+}
+
+function ownerOf(deviceId: string, workerIds: string[]): string {
+  let owner = workerIds[0];
+  let best = -1;
+  for (const workerId of workerIds) {
+    const workerScore = score(workerId, deviceId);
+    if (workerScore > best || (workerScore === best && workerId < owner)) {
+      owner = workerId;
+      best = workerScore;
+    }
+  }
+  return owner;
+}
+
+class DeviceLeaseManager {
+  // Register the worker as alive, hand back devices it no longer owns and lease
+  // the ones it should. A device still leased by another worker is only taken
+  // once that lease is released or expires, so no device is pulled twice.
+  async heartbeat(workerId: string, hostname: string | null, leaseSeconds: number) {
+    const now = new Date();
+    const expiresAt = new Date(now.getTime() + leaseSeconds * 1000);
+
+    await db
+      .insert(syncWorkers)
+      .values({ workerId, hostname, leaseSeconds, lastSeen: now })
+      .onConflictDoUpdate({ target: syncWorkers.workerId, set: { hostname, leaseSeconds, lastSeen: now } });
+
+    const workers = await db.select().from(syncWorkers);
+    const liveWorkerIds = workers
+      .filter(worker => worker.lastSeen.getTime() + worker.leaseSeconds * 1000 > now.getTime())
+      .map(worker => worker.workerId);
+
+    const { devices } = await deviceListCache.get();
+    const owned = devices
+      .map(device => device.deviceId)
+      .filter(deviceId => ownerOf(deviceId, liveWorkerIds) === workerId);
+
+    // Release first, so the new owner can take them on its next heartbeat
+    await db
+      .delete(syncDeviceLeases)
+      .where(owned.length > 0
+        ? and(eq(syncDeviceLeases.workerId, workerId), notInArray(syncDeviceLeases.deviceId, owned))
+        : eq(syncDeviceLeases.workerId, workerId));
+
+    let leased: string[] = [];
+    if (owned.length > 0) {
+      const rows = await db
+        .insert(syncDeviceLeases)
+        .values(owned.map(deviceId => ({ deviceId, workerId, expiresAt, acquiredAt: now })))
+        .onConflictDoUpdate({
+          target: syncDeviceLeases.deviceId,
+          set: {
+            workerId,
+            expiresAt,
+            acquiredAt: sql`case when sync_device_leases.worker_id = excluded.worker_id then sync_device_leases.acquired_at else excluded.acquired_at end`,
+          },
+          // Renew our own lease or take over an expired one, never a live lease of another worker
+          setWhere: or(eq(syncDeviceLeases.workerId, workerId), lt(syncDeviceLeases.expiresAt, now)),
+        })
+        .returning({ deviceId: syncDeviceLeases.deviceId });
+      leased = rows.map(row => row.deviceId);
+    }
+
+    const staleWorkers = workers.filter(worker => now.getTime() - worker.lastSeen.getTime() > FORGET_WORKER_MS);
+    if (staleWorkers.length > 0) {
+      await db.delete(syncWorkers).where(lt(syncWorkers.lastSeen, new Date(now.getTime() - FORGET_WORKER_MS)));
+    }
+
+    return {
+      deviceIds: leased.sort(),
+      waiting: owned.length - leased.length,
+      workers: liveWorkerIds.length,
+      totalDevices: devices.length,
+      expiresAt,
+    };
+  }
+
+  // Called by a worker shutting down cleanly so its devices move without waiting for expiry
+  async release(workerId: string): Promise<number> {
+    const released = await db
+      .delete(syncDeviceLeases)
+      .where(eq(syncDeviceLeases.workerId, workerId))
+      .returning({ deviceId: syncDeviceLeases.deviceId });
+    await db.delete(syncWorkers).where(eq(syncWorkers.workerId, workerId));
+    return released.length;
+  }
+
+  async status() {
+    const now = Date.now();
+    const [workers, leases, { devices }] = await Promise.all([
+      db.select().from(syncWorkers).orderBy(syncWorkers.workerId),
+      db.select().from(syncDeviceLeases),
+      deviceListCache.get(),
+    ]);
+    const liveLeases = leases.filter(lease => lease.expiresAt.getTime() > now);
+    const leasedDeviceIds = new Set(liveLeases.map(lease => lease.deviceId));
+    return {
+      workers: workers.map(worker => ({
+        ...worker,
+        alive: worker.lastSeen.getTime() + worker.leaseSeconds * 1000 > now,
+        devices: liveLeases.filter(lease => lease.workerId === worker.workerId).length,
+      })),
+      unleasedDevices: devices.map(device => device.deviceId).filter(deviceId => !leasedDeviceIds.has(deviceId)),
+    };
+  }
+}
+
+export const deviceLeaseManager = new DeviceLeaseManager();
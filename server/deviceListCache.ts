@@ -0,0 +1,56 @@
+import { createHash } from "crypto";
+import { db } from "./db";
+import { biometricDevices, type BiometricDevice } from "../shared/schema";
+
+// Every sync node asks for the device list each cycle, but the list only changes
+// when someone edits a device. Keep the serialised list in memory with a content
+// ETag so those polls are answered without a table read, usually with a 304.
+// The TTL bounds staleness when another server instance edits the table.
+const DEVICE_LIST_TTL_MS = 60 * 1000;
+
+interface CachedDeviceList {
+  devices: BiometricDevice[];
+  body: string;
+  etag: string;
+  loadedAt: number;
+}
+
+class DeviceListCache {
+  private cached: CachedDeviceList | null = null;
+  private loading: Promise<CachedDeviceList> | null = null;
+  private generation = 0;
+
+  async get(): Promise<CachedDeviceList> {
+    if (this.cached && Date.now() - this.cached.loadedAt < DEVICE_LIST_TTL_MS) {
+      return this.cached;
+    }
+    if (!this.loading) {
+      this.loading = this.load().finally(() => {
+        this.loading = null;
+      });
+    }
+    return this.loading;
+  }
+
+  private async load(): Promise<CachedDeviceList> {
+    const generation = this.generation;
+    const devices = await db.select().from(biometricDevices).orderBy(biometricDevices.id);
+    const body = JSON.stringify(devices);
+    const etag = `"${createHash("sha1").update(body).digest("base64url")}"`;
+    const entry = { devices, body, etag, loadedAt: Date.now() };
+
+    // A device edited while we were reading must not be masked by this older result
+    if (generation === this.generation) {
+      this.cached = entry;
+    }
+    return entry;
+  }
+
+  // Call after any insert, update or delete on biometric_devices
+  invalidate(): void {
+    this.generation++;
+    this.cached = null;
+  }
+}
+
+export const deviceListCache = new DeviceListCache();
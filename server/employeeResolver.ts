@@ -0,0 +1,129 @@
+import { db } from "./db";
+import { employees } from "../shared/schema";
+
+// Device punches carry a UID that may match an employee's employeeId, their
+// biometricDeviceId or (rarely) the row id. Every sync path used to re-read the
+// employees table per device and scan it up to three times per punch; this keeps
+// one hashed index shared across devices and requests instead. The TTL bounds
+// staleness when another server instance edits employees.
+const EMPLOYEE_INDEX_TTL_MS = 5 * 60 * 1000;
+
+// Distinct unmapped UIDs remembered for the stats endpoint
+const MAX_TRACKED_UNMAPPED = 500;
+
+interface EmployeeIndex {
+  byEmployeeId: Map<string, string>;
+  byBiometricId: Map<string, string>;
+  ids: Set<string>;
+  size: number;
+  loadedAt: number;
+}
+
+export interface EmployeeLookup {
+  size: number;
+  resolve(uid: string | number): string | null;
+}
+
+class EmployeeResolver {
+  private index: EmployeeIndex | null = null;
+  private loading: Promise<EmployeeIndex> | null = null;
+  private generation = 0;
+  private hits = 0;
+  private misses = 0;
+  private unmapped = new Map<string, number>();
+
+  // Returns a synchronous resolver over the current snapshot, so a sync that
+  // starts before an employee edit finishes against one consistent index
+  async lookup(): Promise<EmployeeLookup> {
+    const index = await this.get();
+    return {
+      size: index.size,
+      resolve: (uid) => this.resolveIn(index, uid),
+    };
+  }
+
+  private async get(): Promise<EmployeeIndex> {
+    if (this.index && Date.now() - this.index.loadedAt < EMPLOYEE_INDEX_TTL_MS) {
+      return this.index;
+    }
+    if (!this.loading) {
+      this.loading = this.load().finally(() => {
+        this.loading = null;
+      });
+    }
+    return this.loading;
+  }
+
+  private async load(): Promise<EmployeeIndex> {
+    const generation = this.generation;
+    const rows = await db
+      .select({ id: employees.id, employeeId: employees.employeeId, biometricDeviceId: employees.biometricDeviceId })
+      .from(employees);
+
+    // First row wins on duplicates, matching the Array.find lookups this replaced
+    const byEmployeeId = new Map<string, string>();
+    const byBiometricId = new Map<string, string>();
+    for (const row of rows) {
+      if (row.employeeId && !byEmployeeId.has(row.employeeId)) {
+        byEmployeeId.set(row.employeeId, row.id);
+      }
+      if (row.biometricDeviceId && !byBiometricId.has(row.biometricDeviceId)) {
+        byBiometricId.set(row.biometricDeviceId, row.id);
+      }
+    }
+    const index = {
+      byEmployeeId,
+      byBiometricId,
+      ids: new Set(rows.map(row => row.id)),
+      size: rows.length,
+      loadedAt: Date.now(),
+    };
+
+    // An employee edited while we were reading must not be masked by this older result
+    if (generation === this.generation) {
+      this.index = index;
+    }
+    return index;
+  }
+
+  private resolveIn(index: EmployeeIndex, uid: string | number): string | null {
+    const trimmedUid = String(uid).trim();
+    const employeeDbId =
+      index.byEmployeeId.get(trimmedUid) ??
+      index.byBiometricId.get(trimmedUid) ??
+      (index.ids.has(trimmedUid) ? trimmedUid : null);
+
+    if (employeeDbId) {
+      this.hits++;
+    } else {
+      this.misses++;
+      if (this.unmapped.has(trimmedUid) || this.unmapped.size < MAX_TRACKED_UNMAPPED) {
+        this.unmapped.set(trimmedUid, (this.unmapped.get(trimmedUid) ?? 0) + 1);
+      }
+    }
+    return employeeDbId;
+  }
+
+  // Call after any insert, update or delete that touches employee IDs
+  invalidate(): void {
+    this.generation++;
+    this.index = null;
+  }
+
+  stats() {
+    const unmappedUids = Array.from(this.unmapped.entries())
+      .sort((a, b) => b[1] - a[1])
+      .slice(0, 50)
+      .map(([uid, punches]) => ({ uid, punches }));
+    return {
+      employees: this.index?.size ?? null,
+      loadedAt: this.index ? new Date(this.index.loadedAt).toISOString() : null,
+      hits: this.hits,
+      misses: this.misses,
+      distinctUnmappedUids: this.unmapped.size,
+      unmappedUids,
+    };
+  }
+}
+
+export const employeeResolver = new EmployeeResolver();
@@ -0,0 +1,246 @@
+import { and, desc, eq, ne } from "drizzle-orm";
+import { db } from "./db";
+import { zkDeviceManager, type AttendanceRecord } from "./zkdevice";
+import { employeeResolver, type EmployeeLookup } from "./employeeResolver";
+import { attendanceDay, upsertAttendanceRecords } from "./attendanceUpsert";
+import {
+  attendance,
+  biometricDevices,
+  fullSyncJobs,
+  fullSyncDeviceProgress,
+  type BiometricDevice,
+  type FullSyncJob,
+} from "../shared/schema";
+
+// Punches written per upsert and checkpoint. zklib-js can only download a
+// device's whole log at once, but everything after the download is bounded by
+// this, and a restart loses at most one chunk of work.
+const FULL_SYNC_CHUNK_SIZE = 5000;
+
+// First-in/last-out rows for one chunk, keyed the same way the polling sync keys them
+function buildDailyRecords(logs: AttendanceRecord[], lookup: EmployeeLookup) {
+  const attendanceMap = new Map<string, { employeeId: string; date: Date; checkIn: Date; checkOut: Date }>();
+  for (const log of logs) {
+    const employeeDbId = lookup.resolve(log.uid);
+    if (!employeeDbId) {
+      continue;
+    }
+    const date = attendanceDay(log.timestamp);
+    const dateKey = `${employeeDbId}-${date.getTime()}`;
+    const record = attendanceMap.get(dateKey);
+    if (!record) {
+      attendanceMap.set(dateKey, {
+        employeeId: employeeDbId,
+        date,
+        checkIn: log.timestamp,
+        checkOut: log.timestamp,
+      });
+    } else {
+      if (log.timestamp < record.checkIn) record.checkIn = log.timestamp;
+      if (log.timestamp > record.checkOut) record.checkOut = log.timestamp;
+    }
+  }
+
+  const records: (typeof attendance.$inferInsert)[] = [];
+  for (const record of attendanceMap.values()) {
+    // Skip if check-in/check-out spans multiple days
+    if (record.checkIn.toDateString() !== record.checkOut.toDateString()) {
+      console.warn(`Skipping record for employee ${record.employeeId} - check-in and check-out are on different days`);
+      continue;
+    }
+    records.push({ ...record, status: 'present', notes: '', overtimeHours: null });
+  }
+  return records;
+}
+
+class FullSyncRunner {
+  private activeJobId: number | null = null;
+  private starting: Promise<{ job: FullSyncJob; resumed: boolean; alreadyRunning: boolean }> | null = null;
+
+  // Starts a full sync in the background, or resumes the most recent one that did
+  // not complete. `restart` discards that checkpoint and starts from scratch.
+  start(restart: boolean, onFinished?: () => void) {
+    if (!this.starting) {
+      this.starting = this.begin(restart, onFinished).finally(() => {
+        this.starting = null;
+      });
+    }
+    return this.starting;
+  }
+
+  private async begin(restart: boolean, onFinished?: () => void) {
+    if (this.activeJobId !== null) {
+      return { job: (await this.getJob(this.activeJobId))!, resumed: false, alreadyRunning: true };
+    }
+
+    // A 'running' job that is not active here was cut short by a restart
+    const [unfinished] = await db
+      .select()
+      .from(fullSyncJobs)
+      .where(ne(fullSyncJobs.status, 'completed'))
+      .orderBy(desc(fullSyncJobs.id))
+      .limit(1);
+
+    let job: FullSyncJob;
+    const resumed = Boolean(unfinished) && !restart;
+    if (resumed) {
+      [job] = await db
+        .update(fullSyncJobs)
+        .set({ status: 'running', error: null, finishedAt: null })
+        .where(eq(fullSyncJobs.id, unfinished.id))
+        .returning();
+    } else {
+      [job] = await db.insert(fullSyncJobs).values({ status: 'running' }).returning();
+    }
+
+    this.activeJobId = job.id;
+    this.run(job.id)
+      .catch(async (error) => {
+        console.error(`FULL SYNC job ${job.id} failed:`, error);
+        await db
+          .update(fullSyncJobs)
+          .set({ status: 'failed', error: (error as Error).message, finishedAt: new Date() })
+          .where(eq(fullSyncJobs.id, job.id));
+      })
+      .finally(() => {
+        this.activeJobId = null;
+        onFinished?.();
+      });
+
+    return { job, resumed, alreadyRunning: false };
+  }
+
+  private async getJob(jobId: number) {
+    const [job] = await db.select().from(fullSyncJobs).where(eq(fullSyncJobs.id, jobId));
+    return job;
+  }
+
+  // The requested job (default: the latest) with per-device checkpoints and totals
+  async status(jobId?: number) {
+    const [job] = jobId
+      ? await db.select().from(fullSyncJobs).where(eq(fullSyncJobs.id, jobId))
+      : await db.select().from(fullSyncJobs).orderBy(desc(fullSyncJobs.id)).limit(1);
+    if (!job) {
+      return null;
+    }
+    const devices = await db
+      .select()
+      .from(fullSyncDeviceProgress)
+      .where(eq(fullSyncDeviceProgress.jobId, job.id))
+      .orderBy(fullSyncDeviceProgress.deviceId);
+
+    return {
+      job,
+      active: this.activeJobId === job.id,
+      devicesDone: devices.filter(d => d.status === 'done').length,
+      devicesFailed: devices.filter(d => d.status === 'failed').length,
+      processedPunches: devices.reduce((sum, d) => sum + d.processedPunches, 0),
+      totalPunches: devices.reduce((sum, d) => sum + (d.totalPunches ?? 0), 0),
+      attendanceRecords: devices.reduce((sum, d) => sum + d.attendanceRecords, 0),
+      devices,
+    };
+  }
+
+  private async run(jobId: number) {
+    console.log(`Starting FULL SYNC job ${jobId} - retrieving complete historical attendance data...`);
+    const devices = await db.select().from(biometricDevices);
+    await db.update(fullSyncJobs).set({ totalDevices: devices.length }).where(eq(fullSyncJobs.id, jobId));
+    if (devices.length > 0) {
+      await db
+        .insert(fullSyncDeviceProgress)
+        .values(devices.map(device => ({ jobId, deviceId: device.deviceId })))
+        .onConflictDoNothing();
+    }
+    const checkpoints = new Map(
+      (await db.select().from(fullSyncDeviceProgress).where(eq(fullSyncDeviceProgress.jobId, jobId)))
+        .map(progress => [progress.deviceId, progress])
+    );
+
+    let failed = 0;
+    for (const device of devices) {
+      const checkpoint = checkpoints.get(device.deviceId);
+      if (checkpoint?.status === 'done') {
+        continue;
+      }
+      try {
+        await this.syncDevice(jobId, device, checkpoint?.lastTimestamp ?? undefined, checkpoint?.processedPunches ?? 0,
+          checkpoint?.attendanceRecords ?? 0);
+      } catch (error) {
+        failed++;
+        console.error(`Full sync error for device ${device.deviceId}:`, error);
+        await this.checkpoint(jobId, device.deviceId, { status: 'failed', error: (error as Error).message });
+      }
+    }
+
+    await db
+      .update(fullSyncJobs)
+      .set({
+        status: failed > 0 ? 'failed' : 'completed',
+        error: failed > 0 ? `${failed} of ${devices.length} devices failed; start the full sync again to resume them` : null,
+        finishedAt: new Date(),
+      })
+      .where(eq(fullSyncJobs.id, jobId));
+    console.log(`FULL SYNC job ${jobId} finished: ${devices.length - failed} of ${devices.length} devices completed`);
+  }
+
+  private async syncDevice(jobId: number, device: BiometricDevice, since: Date | undefined,
+                           processedPunches: number, attendanceRecords: number) {
+    await this.checkpoint(jobId, device.deviceId, { status: 'running', error: null });
+
+    if (!zkDeviceManager.isDeviceConnected(device.deviceId)) {
+      const connected = await zkDeviceManager.connectDevice(device.deviceId, {
+        ip: device.ip,
+        port: device.port,
+        timeout: 5000,
+        inport: 1,
+      });
+      if (!connected) {
+        throw new Error(`Could not connect to device ${device.deviceId}`);
+      }
+    }
+
+    // Punches before the checkpoint were written by an earlier attempt. Those in
+    // the checkpoint's own second come back and are merged again, so they are
+    // taken off the processed count rather than counted twice.
+    const logs = await zkDeviceManager.syncAttendanceData(device.deviceId, true, since);
+    logs.sort((a, b) => a.timestamp.getTime() - b.timestamp.getTime());
+    if (since) {
+      processedPunches = Math.max(0, processedPunches - logs.filter(log => log.timestamp.getTime() === since.getTime()).length);
+    }
+    await this.checkpoint(jobId, device.deviceId, { totalPunches: processedPunches + logs.length });
+    if (since) {
+      console.log(`FULL SYNC: Resuming device ${device.deviceId} after ${since.toISOString()}`);
+    }
+
+    const lookup = await employeeResolver.lookup();
+    let start = 0;
+    while (start < logs.length) {
+      let end = Math.min(start + FULL_SYNC_CHUNK_SIZE, logs.length);
+      // Punches sharing the boundary timestamp stay in one chunk, so a resume re-reads at most one second
+      while (end < logs.length && logs[end].timestamp.getTime() === logs[end - 1].timestamp.getTime()) {
+        end++;
+      }
+      const chunk = logs.slice(start, end);
+      attendanceRecords += await upsertAttendanceRecords(buildDailyRecords(chunk, lookup));
+      processedPunches += chunk.length;
+      await this.checkpoint(jobId, device.deviceId, {
+        processedPunches,
+        attendanceRecords,
+        lastTimestamp: chunk[chunk.length - 1].timestamp,
+      });
+      start = end;
+    }
+
+    await this.checkpoint(jobId, device.deviceId, { status: 'done' });
+    console.log(`FULL SYNC: Device ${device.deviceId} - ${logs.length} raw records, ${attendanceRecords} attendance records`);
+  }
+
+  private async checkpoint(jobId: number, deviceId: string, fields: Partial<typeof fullSyncDeviceProgress.$inferInsert>) {
+    await db
+      .update(fullSyncDeviceProgress)
+      .set({ ...fields, updatedAt: new Date() })
+      .where(and(eq(fullSyncDeviceProgress.jobId, jobId), eq(fullSyncDeviceProgress.deviceId, deviceId)));
+  }
+}
+
+export const fullSyncRunner = new FullSyncRunner();
@@ -16,7 +16,7 @@ let db: any;
 })();
 
 const app = express();
-app.use(express.json());
+app.use(express.json({ limit: '50mb' })); // punch uploads from the sync tool can be large
 app.use(express.urlencoded({ extended: false }));
 
 app.use((req, res, next) => {
@@ -0,0 +1,51 @@
+import { performance } from "perf_hooks";
+
+export interface PhaseTiming {
+  phase: string;
+  startMs: number;
+  durationMs: number;
+}
+
+function roundMs(value: number): number {
+  return Math.round(value * 100) / 100;
+}
+
+// Times the consecutive phases of one sync request (device connect, log pull,
+// UID resolution, database writes). The sync tools place the returned phases
+// inside their own request spans, so a slow cycle can be traced to a phase.
+export class PhaseTimer {
+  private readonly origin = performance.now();
+  private current: { phase: string; start: number } | null = null;
+  private readonly phases: PhaseTiming[] = [];
+
+  // Ends the running phase, if any, and starts the next one
+  phase(name: string): void {
+    this.end();
+    this.current = { phase: name, start: performance.now() };
+  }
+
+  end(): void {
+    if (!this.current) {
+      return;
+    }
+    const now = performance.now();
+    this.phases.push({
+      phase: this.current.phase,
+      startMs: roundMs(this.current.start - this.origin),
+      durationMs: roundMs(now - this.current.start),
+    });
+    this.current = null;
+  }
+
+  // Response body field; also closes the running phase
+  result(): { totalMs: number; phases: PhaseTiming[] } {
+    this.end();
+    return { totalMs: roundMs(performance.now() - this.origin), phases: this.phases };
+  }
+
+  // Server-Timing header value, readable in browser devtools as well
+  serverTiming(): string {
+    this.end();
+    return this.phases.map(({ phase, durationMs }) => `${phase};dur=${durationMs}`).join(", ");
+  }
+}
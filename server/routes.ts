@@ -12,8 +12,15 @@ const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 
 import { db } from "./db";
-import { zkDeviceManager } from "./zkdevice";
+import { zkDeviceManager, type AttendanceRecord } from "./zkdevice";
 import { sessionManager } from "./sessionManager";
+import { deviceListCache } from "./deviceListCache";
+import { employeeResolver } from "./employeeResolver";
+import { attendanceDay, upsertAttendanceRecords } from "./attendanceUpsert";
+import { fullSyncRunner } from "./fullSyncJob";
+import { attendanceAggregates } from "./attendanceAggregates";
+import { deviceLeaseManager } from "./deviceLeases";
+import { PhaseTimer } from "./phaseTimer";
 import {
   biometricDevices,
   departments,
@@ -21,6 +28,8 @@ import {
   insertDepartmentSchema,
   insertEmployeeSchema,
   attendance,
+  attendanceDailySummary,
+  attendanceMonthlySummary,
   insertAttendanceSchema,
   leaveRequests,
   insertLeaveRequestSchema,
@@ -34,7 +43,7 @@ import {
 } from "../shared/schema";
 
 import { getGroupWorkingHours, updateGroupWorkingHours } from './hrSettings';
-import { attendanceCalculator } from './attendanceCalculator';
+import { attendanceCalculator, batchRowLookup, BATCH_FLAG_HOLIDAY, BATCH_FLAG_WEEKEND } from './attendanceCalculator';
 import hrSettingsRouter from './hrSettings';
 import { storage } from './storage';
 
@@ -80,7 +89,7 @@ async function performAutoSync() {
   try {
     console.log('Starting auto-sync for all biometric devices...');
     
-    const devices = await db.select().from(biometricDevices);
+    const { devices } = await deviceListCache.get();
     let totalSynced = 0;
     let totalProcessed = 0;
     
@@ -105,30 +114,11 @@ async function performAutoSync() {
           
           // Process attendance logs into database records (same logic as manual sync)
           const attendanceMap = new Map();
-          const allEmployees = await db.select().from(employees);
-          
-          // Create lookup function for employee IDs with better matching
-          const findEmployeeIdLocal = (uid: string): string | null => {
-            const trimmedUid = String(uid).trim();
-            
-            // Try exact match with employee_id first (most common case)
-            const byEmpId = allEmployees.find(emp => emp.employeeId === trimmedUid);
-            if (byEmpId) return byEmpId.id;
-            
-            // Try exact match with biometric_device_id if it exists
-            const byBiometric = allEmployees.find(emp => emp.biometricDeviceId && emp.biometricDeviceId === trimmedUid);
-            if (byBiometric) return byBiometric.id;
-            
-            // Try exact match with id field as fallback
-            const byId = allEmployees.find(emp => emp.id === trimmedUid);
-            if (byId) return byId.id;
-            
-            return null;
-          };
+          const employeeLookup = await employeeResolver.lookup();
 
           // Add debug logging to understand what's happening
           console.log(`Processing ${logs.length} attendance logs for device ${device.deviceId}`);
-          console.log(`Found ${allEmployees.length} employees in database`);
+          console.log(`Found ${employeeLookup.size} employees in database`);
           
           let foundCount = 0;
           let notFoundCount = 0;
@@ -136,7 +126,7 @@ async function performAutoSync() {
           
           for (const log of logs) {
             const uid = String(log.uid).trim();
-            const employeeDbId = findEmployeeIdLocal(uid);
+            const employeeDbId = employeeLookup.resolve(uid);
             if (!employeeDbId) {
               notFoundCount++;
               notFoundUIDs.add(uid);
@@ -147,14 +137,14 @@ async function performAutoSync() {
             }
             foundCount++;
 
-            const logDate = new Date(log.timestamp);
-            const dateKey = `${employeeDbId}-${logDate.toISOString().split('T')[0]}`;
+            const logDay = attendanceDay(log.timestamp);
+            const dateKey = `${employeeDbId}-${logDay.getTime()}`;
             
             // Initialize or update attendance record
             if (!attendanceMap.has(dateKey)) {
               attendanceMap.set(dateKey, {
                 employeeId: employeeDbId,
-                date: new Date(logDate.getFullYear(), logDate.getMonth(), logDate.getDate()),
+                date: logDay,
                 checkIn: log.timestamp,
                 checkOut: log.timestamp,
                 logs: [log]
@@ -198,45 +188,11 @@ async function performAutoSync() {
             });
           }
 
-          // Insert or update attendance records
-          for (const record of attendanceRecordsToInsert) {
-            try {
-              await db.transaction(async (tx) => {
-                // First try to update existing record
-                const updated = await tx
-                  .update(attendance)
-                  .set({
-                    checkIn: record.checkIn,
-                    checkOut: record.checkOut,
-                    workingHours: record.workingHours,
-                    status: record.status,
-                    notes: record.notes,
-                  })
-                  .where(
-                    and(
-                      eq(attendance.employeeId, record.employeeId),
-                      eq(attendance.date, record.date)
-                    )
-                  );
-
-                // If no rows were updated, insert a new record
-                if (updated.rowCount === 0) {
-                  await tx.insert(attendance).values({
-                    employeeId: record.employeeId,
-                    date: record.date,
-                    checkIn: record.checkIn,
-                    checkOut: record.checkOut,
-                    status: record.status,
-                    workingHours: record.workingHours,
-                    notes: record.notes,
-                    overtimeHours: null,
-                  });
-                }
-              });
-              totalProcessed++;
-            } catch (error) {
-              console.error('Error upserting attendance record during auto-sync:', error);
-            }
+          // One merged upsert per device instead of a transaction per employee-day
+          try {
+            totalProcessed += await upsertAttendanceRecords(attendanceRecordsToInsert);
+          } catch (error) {
+            console.error('Error upserting attendance records during auto-sync:', error);
           }
           
           totalSynced += logs.length;
@@ -499,6 +455,7 @@ router.get("/api/employees", async (req, res) => {
         joinDate: employees.joinDate,
         status: employees.status,
         role: employees.role,
+        biometricDeviceId: employees.biometricDeviceId,
         department: departments.name,
         departmentId: departments.id,
       })
@@ -587,6 +544,7 @@ router.post("/api/employees", upload.single("photo"), async (req, res) => {
     // Insert the new employee record with proper typing
     try {
       const newEmployee = await db.insert(employees).values(employeeData).returning();
+      employeeResolver.invalidate();
       res.status(201).json(newEmployee[0]);
     } catch (error) {
       if (error instanceof Error && error.message.includes('duplicate key value violates unique constraint')) {
@@ -641,6 +599,11 @@ router.put("/api/employees/bulk", async (req, res) => {
       .set(updateFields)
       .where(inArray(employees.id, employeeIds))
       .returning({ id: employees.id, employeeId: employees.employeeId });
+    employeeResolver.invalidate();
+    if (updateFields.employeeGroup !== undefined) {
+      // Daily summaries hold the group's late/half-day/OT thresholds
+      await attendanceAggregates.refreshEmployees(updatedEmployees.map(employee => employee.id));
+    }
 
     console.log("Successfully updated employees:", updatedEmployees);
 
@@ -698,6 +661,10 @@ router.put("/api/employees/:id", upload.single("photo"), async (req, res) => {
     if (updatedEmployee.length === 0) {
       return res.status(404).json({ message: "Employee not found" });
     }
+    employeeResolver.invalidate();
+    if (updateData.employeeGroup !== undefined) {
+      await attendanceAggregates.refreshEmployees([id]);
+    }
 
     res.json(updatedEmployee[0]);
   } catch (error) {
@@ -717,6 +684,7 @@ router.delete("/api/employees/:id", async (req, res) => {
     if (deletedEmployee.length === 0) {
       return res.status(404).json({ message: "Employee not found" });
     }
+    employeeResolver.invalidate();
 
     res.json({ message: "Employee deleted successfully" });
   } catch (error) {
@@ -929,6 +897,7 @@ router.post("/api/attendance", async (req, res) => {
   try {
     const validatedData = insertAttendanceSchema.parse(req.body);
     const newRecord = await db.insert(attendance).values(validatedData).returning();
+    await attendanceAggregates.refresh(newRecord);
     res.status(201).json(newRecord[0]);
   } catch (error) {
     if (error instanceof z.ZodError) {
@@ -1493,16 +1462,17 @@ router.get("/api/reports/monthly-attendance", async (req, res) => {
         lte(overtimeRequests.date, end)
       ));
 
-    console.log('Fetched Overtime Records (with filters):', JSON.stringify(overtimeRecords, null, 2));
-    
-    // Also fetch attendance records to extract overtimeHours if available (similar to Daily OT Report logic)
-    const attendanceRecordsForOT = await db.select().from(attendance)
+    // Daily summaries carry the check-in/out and the weekend-aware OT already computed
+    await attendanceAggregates.ready();
+    const dailySummaries = await db.select().from(attendanceDailySummary)
       .where(and(
-        inArray(attendance.employeeId, allEmployees.map(e => e.id)),
-        gte(attendance.date, start),
-        lte(attendance.date, end)
+        inArray(attendanceDailySummary.employeeId, employeeStringIds),
+        gte(attendanceDailySummary.date, start),
+        lte(attendanceDailySummary.date, end)
       ));
-    console.log('Attendance Records for OT Calculation:', JSON.stringify(attendanceRecordsForOT, null, 2));
+    const summaryByEmployeeDay = new Map(
+      dailySummaries.map(summary => [`${summary.employeeId}|${new Date(summary.date).toDateString()}`, summary])
+    );
 
     const leaveRecords = await db.select().from(leaveRequests)
       .where(and(
@@ -1512,22 +1482,10 @@ router.get("/api/reports/monthly-attendance", async (req, res) => {
         gte(leaveRequests.endDate, start)
       ));
 
-    // --- DEBUGGING: Fetch a sample of all overtime records to inspect data --- 
-    try {
-      const allOvertimesForDebugging = await db.select().from(overtimeRequests).limit(10);
-      console.log('SAMPLE OF ALL OVERTIME RECORDS IN DB:', JSON.stringify(allOvertimesForDebugging, null, 2));
-    } catch (e) {
-      console.error("Error fetching all overtimes for debugging:", e);
-    }
-    // --- END DEBUGGING ---
-
-    console.log('Fetched Overtime Records (with filters):', JSON.stringify(overtimeRecords, null, 2));
-
     const reportData = allEmployees.map(emp => {
       const dailyData: { [key: number]: any } = {};
       const numericEmpId = parseInt(emp.id, 10);
 
-      const empAttendance = attendanceRecordsForOT.filter(a => a.employeeId === emp.id);
       const empLeaves = leaveRecords.filter(l => l.employeeId === numericEmpId);
       const empOvertimes = overtimeRecords.filter(o => o.employeeId === numericEmpId);
 
@@ -1539,7 +1497,7 @@ router.get("/api/reports/monthly-attendance", async (req, res) => {
         // Default to Sunday as a holiday
         const isHoliday = day.getDay() === 0;
         const onLeave = empLeaves.find(l => day >= new Date(l.startDate) && day <= new Date(l.endDate));
-        const attendanceRecord = empAttendance.find(a => new Date(a.date).toDateString() === day.toDateString());
+        const attendanceRecord = summaryByEmployeeDay.get(`${emp.id}|${day.toDateString()}`);
 
         if (isHoliday) {
           dayData.status = 'HL';
@@ -1568,36 +1526,11 @@ router.get("/api/reports/monthly-attendance", async (req, res) => {
           dayData.status = 'A';
         }
 
-        // Calculate overtime like in Daily OT Report with weekend handling
-        if (attendanceRecord && attendanceRecord.checkIn && attendanceRecord.checkOut) {
-          const diffMs = new Date(attendanceRecord.checkOut).getTime() - new Date(attendanceRecord.checkIn).getTime();
-          const actualHours = diffMs / (1000 * 60 * 60);
-          
-          // Check if this is a weekend (Saturday = 6, Sunday = 0)
-          const dayOfWeek = day.getDay();
-          const isWeekend = dayOfWeek === 0 || dayOfWeek === 6;
-          
-          let calculatedOtHours = 0;
-          
-          if (isWeekend) {
-            // Weekend: All working hours count as overtime
-            calculatedOtHours = actualHours;
-          } else {
-            // Regular day: Use group-specific thresholds
-            let requiredHours = 8; // Default
-            if (emp.employeeGroup === 'group_a') {
-              requiredHours = 7.75; // groupA minHoursForOT
-            } else if (emp.employeeGroup === 'group_b') {
-              requiredHours = 8.75; // groupB minHoursForOT
-            }
-            calculatedOtHours = Math.max(0, actualHours - requiredHours);
-          }
-          
-          if (calculatedOtHours > 0) {
-            dayData.overtime = calculatedOtHours.toFixed(2);
-          }
+        // Calculated OT (all hours at weekends, hours past the group's day otherwise)
+        if (attendanceRecord && attendanceRecord.checkIn && attendanceRecord.checkOut && parseFloat(attendanceRecord.overtimeHours) > 0) {
+          dayData.overtime = attendanceRecord.overtimeHours;
         }
-        
+
         // Check for explicit overtime request (override calculated OT if exists)
         const overtimeRecord = empOvertimes.find(o => new Date(o.date).toDateString() === day.toDateString());
         if (overtimeRecord) {
@@ -1946,8 +1879,14 @@ router.get("/api/reports/daily-ot", async (req, res) => {
 // --- Biometric Device Routes ---
 router.get("/api/biometric-devices", async (req, res) => {
   try {
-    const devices = await db.select().from(biometricDevices);
-    res.json(devices);
+    // Sync tools send If-None-Match every cycle; answer 304 while the list is unchanged
+    const { body, etag } = await deviceListCache.get();
+    res.setHeader("ETag", etag);
+    res.setHeader("Cache-Control", "no-cache");
+    if (req.fresh) {
+      return res.status(304).end();
+    }
+    res.type("application/json").send(body);
   } catch (error: any) {
     res.status(500).json({ success: false, message: error.message });
   }
@@ -1970,6 +1909,7 @@ router.post("/api/biometric-devices", async (req, res) => {
     await zk.disconnect();
 
     const newDevice = await db.insert(biometricDevices).values(deviceData).returning();
+    deviceListCache.invalidate();
     res.status(201).json(newDevice[0]);
   } catch (error: any) {
     if (error instanceof z.ZodError) {
@@ -1985,6 +1925,7 @@ router.put("/api/biometric-devices/:id", async (req, res) => {
     const deviceData = insertBiometricDeviceSchema.partial().parse(req.body);
 
     const updatedDevice = await db.update(biometricDevices).set(deviceData).where(eq(biometricDevices.id, id)).returning();
+    deviceListCache.invalidate();
     res.json(updatedDevice[0]);
   } catch (error: any) {
     if (error instanceof z.ZodError) {
@@ -1998,6 +1939,7 @@ router.delete("/api/biometric-devices/:id", async (req, res) => {
   try {
     const id = parseInt(req.params.id);
     await db.delete(biometricDevices).where(eq(biometricDevices.id, id));
+    deviceListCache.invalidate();
     res.json({ success: true, message: "Device deleted successfully" });
   } catch (error) {
     console.error("Failed to delete biometric device:", error);
@@ -2142,6 +2084,7 @@ router.post('/api/employees/import', async (req, res) => {
     await db.transaction(async (tx) => {
       await tx.insert(employees).values(employeesToInsert);
     });
+    employeeResolver.invalidate();
 
     res.status(201).json({
       success: true,
@@ -2272,14 +2215,14 @@ const findEmployeeId = (uid: string | number): string | null => {
         continue;
       }
 
-      const logDate = new Date(log.timestamp);
-      const dateKey = `${employeeDbId}-${logDate.toISOString().split('T')[0]}`;
+      const logDay = attendanceDay(log.timestamp);
+      const dateKey = `${employeeDbId}-${logDay.getTime()}`;
       
       // Initialize or update attendance record
       if (!attendanceMap.has(dateKey)) {
         attendanceMap.set(dateKey, {
           employeeId: employeeDbId, // employeeDbId is already a string from findEmployeeId
-          date: new Date(logDate.getFullYear(), logDate.getMonth(), logDate.getDate()),
+          date: logDay,
           checkIn: log.timestamp,
           checkOut: log.timestamp,
           logs: [log]
@@ -2363,6 +2306,7 @@ const findEmployeeId = (uid: string | number): string | null => {
         throw error;
       }
     }
+    await attendanceAggregates.refresh(attendanceRecordsToInsert);
 
     res.json({ 
       success: true, 
@@ -2444,13 +2388,101 @@ router.post("/api/auto-sync/manual", async (req, res) => {
   }
 });
 
+// Turn raw punches into first-in/last-out attendance rows. `source` is only
+// used for logging (a device ID, or a description of a bulk batch). Shared by
+// the server-side device pull and the punch uploads from the Python sync tool.
+async function saveDeviceAttendanceLogs(source: string, logs: AttendanceRecord[], timer?: PhaseTimer): Promise<number> {
+  let processedRecords = 0;
+  if (logs.length === 0) {
+    return processedRecords;
+  }
+
+  timer?.phase('resolve');
+
+  console.log(`Processing ${logs.length} records from ${source}`);
+
+  const attendanceMap = new Map();
+  const employeeLookup = await employeeResolver.lookup();
+
+  console.log(`Processing ${logs.length} attendance logs for ${source}`);
+  console.log(`Found ${employeeLookup.size} employees in database`);
+
+  let foundCount = 0;
+  let notFoundCount = 0;
+  const notFoundUIDs = new Set();
+
+  for (const log of logs) {
+    const uid = String(log.uid).trim();
+    const employeeDbId = employeeLookup.resolve(uid);
+    if (!employeeDbId) {
+      notFoundCount++;
+      notFoundUIDs.add(uid);
+      if (notFoundUIDs.size <= 10) {
+        console.warn(`No employee found for UID: ${uid}`);
+      }
+      continue;
+    }
+    foundCount++;
+
+    const logDate = new Date(log.timestamp);
+    const logDay = attendanceDay(logDate);
+    const mapKey = `${employeeDbId}-${logDay.getTime()}`;
+
+    if (!attendanceMap.has(mapKey)) {
+      attendanceMap.set(mapKey, {
+        employeeId: employeeDbId,
+        date: logDay,
+        checkIn: logDate,
+        checkOut: logDate,
+        status: 'present'
+      });
+    } else {
+      const existing = attendanceMap.get(mapKey);
+      if (logDate < existing!.checkIn) {
+        existing!.checkIn = logDate;
+      }
+      if (logDate > existing!.checkOut) {
+        existing!.checkOut = logDate;
+      }
+    }
+  }
+
+  console.log(`Sync stats for ${source}: Found ${foundCount} employees, ${notFoundCount} UIDs not found`);
+  if (notFoundUIDs.size > 10) {
+    console.log(`Total unique missing UIDs: ${notFoundUIDs.size} (only first 10 logged)`);
+  }
+
+  // Merge into existing rows so a later check-out on a day already saved is kept
+  const attendanceRecordsToInsert = Array.from(attendanceMap.values());
+  if (attendanceRecordsToInsert.length > 0) {
+    timer?.phase('write');
+    processedRecords = await upsertAttendanceRecords(attendanceRecordsToInsert);
+  }
+  timer?.end();
+
+  console.log(`Sync for ${source}: ${logs.length} raw records received, ${processedRecords} attendance records saved to database`);
+
+  return processedRecords;
+}
+
 // Sync specific device only
 router.post("/api/auto-sync/device/:deviceId", async (req, res) => {
   try {
     const { deviceId } = req.params;
+    const timer = new PhaseTimer();
     console.log(`Starting manual sync for device: ${deviceId}`);
     
+    // Optional incremental watermark from the sync tool: only punches after
+    // `since` are processed, and if the device still holds `count` records
+    // nothing new was punched and the log download is skipped entirely.
+    const since = typeof req.query.since === 'string' ? new Date(req.query.since) : null;
+    if (since && isNaN(since.getTime())) {
+      return res.status(400).json({ success: false, message: "Invalid 'since' timestamp" });
+    }
+    const knownCount = typeof req.query.count === 'string' ? parseInt(req.query.count, 10) : NaN;
+    
     // Get specific device
+    timer.phase('lookup');
     const device = await db.select().from(biometricDevices).where(eq(biometricDevices.deviceId, deviceId)).limit(1);
     if (device.length === 0) {
       return res.status(404).json({ success: false, message: `Device ${deviceId} not found` });
@@ -2459,6 +2491,7 @@ router.post("/api/auto-sync/device/:deviceId", async (req, res) => {
     const targetDevice = device[0];
     
     // Connect to device if not connected
+    timer.phase('connect');
     if (!zkDeviceManager.isDeviceConnected(targetDevice.deviceId)) {
       const connected = await zkDeviceManager.connectDevice(targetDevice.deviceId, {
         ip: targetDevice.ip,
@@ -2471,100 +2504,45 @@ router.post("/api/auto-sync/device/:deviceId", async (req, res) => {
       }
     }
 
-    // Sync only this device
-    const logs = await zkDeviceManager.syncAttendanceData(targetDevice.deviceId);
-    let processedRecords = 0;
+    // Record count reported by the device, returned so the tool can store it with its watermark
+    timer.phase('device_info');
+    const info = await zkDeviceManager.getDeviceInfo(targetDevice.deviceId);
+    const totalRecords: number | null = typeof info?.logCounts === 'number' ? info.logCounts : null;
     
-    if (logs && logs.length > 0) {
-      console.log(`Processing ${logs.length} records from device ${deviceId}`);
-      
-      // Process attendance logs into database records (same logic as auto-sync)
-      const attendanceMap = new Map();
-      const allEmployees = await db.select().from(employees);
-      
-      // Create lookup function for employee IDs
-      const findEmployeeIdLocal = (uid: string): string | null => {
-        const trimmedUid = String(uid).trim();
-        
-        // Try exact match with employee_id first
-        const byEmpId = allEmployees.find(emp => emp.employeeId === trimmedUid);
-        if (byEmpId) return byEmpId.id;
-        
-        // Try exact match with biometric_device_id if it exists
-        const byBiometric = allEmployees.find(emp => emp.biometricDeviceId && emp.biometricDeviceId === trimmedUid);
-        if (byBiometric) return byBiometric.id;
-        
-        // Try exact match with id field as fallback
-        const byId = allEmployees.find(emp => emp.id === trimmedUid);
-        if (byId) return byId.id;
-        
-        return null;
-      };
-
-      console.log(`Processing ${logs.length} attendance logs for device ${deviceId}`);
-      console.log(`Found ${allEmployees.length} employees in database`);
-      
-      let foundCount = 0;
-      let notFoundCount = 0;
-      const notFoundUIDs = new Set();
-      
-      for (const log of logs) {
-        const uid = String(log.uid).trim();
-        const employeeDbId = findEmployeeIdLocal(uid);
-        if (!employeeDbId) {
-          notFoundCount++;
-          notFoundUIDs.add(uid);
-          if (notFoundUIDs.size <= 10) {
-            console.warn(`No employee found for UID: ${uid}`);
-          }
-          continue;
-        }
-        foundCount++;
-
-        const logDate = new Date(log.timestamp);
-        const dateKey = logDate.toISOString().split('T')[0];
-        const mapKey = `${employeeDbId}-${dateKey}`;
-        
-        if (!attendanceMap.has(mapKey)) {
-          attendanceMap.set(mapKey, {
-            employeeId: employeeDbId,
-            date: new Date(dateKey),
-            checkIn: logDate,
-            checkOut: logDate,
-            status: 'present'
-          });
-        } else {
-          const existing = attendanceMap.get(mapKey);
-          if (logDate < existing!.checkIn) {
-            existing!.checkIn = logDate;
-          }
-          if (logDate > existing!.checkOut) {
-            existing!.checkOut = logDate;
-          }
-        }
-      }
-
-      console.log(`Sync stats for ${deviceId}: Found ${foundCount} employees, ${notFoundCount} UIDs not found`);
-      if (notFoundUIDs.size > 10) {
-        console.log(`Total unique missing UIDs: ${notFoundUIDs.size} (only first 10 logged)`);
-      }
-
-      // Insert unique attendance records
-      const attendanceRecordsToInsert = Array.from(attendanceMap.values());
-      if (attendanceRecordsToInsert.length > 0) {
-        await db.insert(attendance).values(attendanceRecordsToInsert).onConflictDoNothing();
-        processedRecords = attendanceRecordsToInsert.length;
-      }
+    if (since && totalRecords !== null && totalRecords === knownCount) {
+      res.setHeader("Server-Timing", timer.serverTiming());
+      return res.json({
+        success: true,
+        message: `Device ${deviceId} has no new punches`,
+        rawRecords: 0,
+        processedRecords: 0,
+        deviceId: deviceId,
+        totalRecords,
+        lastTimestamp: since.toISOString(),
+        timings: timer.result()
+      });
+    }
 
-      console.log(`Manual sync for ${deviceId}: ${logs.length} raw records retrieved, ${processedRecords} attendance records saved to database`);
+    // Sync only this device
+    timer.phase('pull');
+    const logs = await zkDeviceManager.syncAttendanceData(targetDevice.deviceId, false, since ?? undefined);
+    const processedRecords = await saveDeviceAttendanceLogs(deviceId, logs || [], timer);
+    
+    let lastTimestamp = since;
+    for (const log of logs || []) {
+      if (!lastTimestamp || log.timestamp > lastTimestamp) lastTimestamp = log.timestamp;
     }
     
+    res.setHeader("Server-Timing", timer.serverTiming());
     res.json({ 
       success: true, 
       message: `Device ${deviceId} sync completed`, 
       rawRecords: logs?.length || 0,
       processedRecords: processedRecords,
-      deviceId: deviceId
+      deviceId: deviceId,
+      totalRecords,
+      lastTimestamp: lastTimestamp ? lastTimestamp.toISOString() : null,
+      timings: timer.result()
     });
   } catch (error) {
     console.error(`Manual sync failed for device ${req.params.deviceId}:`, error);
@@ -2572,179 +2550,236 @@ router.post("/api/auto-sync/device/:deviceId", async (req, res) => {
   }
 });
 
-router.post("/api/auto-sync/full-sync", async (req, res) => {
+// Validate one uploaded punch with the same rules as ZKDeviceManager.getAttendanceLogs.
+// Duplicates (same UID and timestamp) are dropped so replayed punches count once.
+function toUploadedPunch(
+  rawUid: string | number,
+  rawTimestamp: string,
+  state: number | undefined,
+  type: number | undefined,
+  seen: Set<string>
+): AttendanceRecord | null {
+  const uid = String(rawUid).trim();
+  const timestamp = new Date(rawTimestamp);
+  if (!uid || uid === "0" || isNaN(timestamp.getTime()) || timestamp.getFullYear() < 2020) {
+    return null;
+  }
+  const punchKey = `${uid}|${timestamp.getTime()}`;
+  if (seen.has(punchKey)) {
+    return null;
+  }
+  seen.add(punchKey);
+  return { uid, timestamp, state: state ?? 0, type: type ?? 0 };
+}
+
+// Receive punches that the sync tool pulled from a device itself (direct mode)
+const devicePunchUploadSchema = z.object({
+  punches: z.array(
+    z.object({
+      uid: z.union([z.string(), z.number()]),
+      timestamp: z.string(),
+      state: z.number().optional(),
+      type: z.number().optional(),
+    })
+  ),
+});
+
+router.post("/api/auto-sync/device/:deviceId/punches", async (req, res) => {
   try {
-    console.log('Starting FULL SYNC of all devices - retrieving complete historical attendance data...');
-    
-    const devices = await db.select().from(biometricDevices);
-    let totalSynced = 0;
-    let totalProcessed = 0;
-    const deviceResults: { [deviceId: string]: number } = {};
-    
-    for (const device of devices) {
-      try {
-        if (!zkDeviceManager.isDeviceConnected(device.deviceId)) {
-          const connected = await zkDeviceManager.connectDevice(device.deviceId, {
-            ip: device.ip,
-            port: device.port,
-            timeout: 5000,
-            inport: 1,
-          });
-          if (!connected) {
-            console.warn(`Could not connect to device ${device.deviceId} during full sync`);
-            deviceResults[device.deviceId] = 0;
-            continue;
-          }
-        }
+    const { deviceId } = req.params;
 
-        // Perform full sync to get ALL historical records
-        const logs = await zkDeviceManager.syncAttendanceData(device.deviceId, true);
-        if (logs && logs.length > 0) {
-          console.log(`FULL SYNC: Processing ${logs.length} records from device ${device.deviceId}`);
-          
-          // Process attendance logs into database records (same logic as auto-sync)
-          const attendanceMap = new Map();
-          const allEmployees = await db.select().from(employees);
-          
-          // Create lookup function for employee IDs
-          const findEmployeeIdLocal = (uid: string): string | null => {
-            const trimmedUid = String(uid).trim();
-            
-            // Try exact match with employee_id first
-            const byEmpId = allEmployees.find(emp => emp.employeeId === trimmedUid);
-            if (byEmpId) return byEmpId.id;
-            
-            // Try exact match with biometric_device_id if it exists
-            const byBiometric = allEmployees.find(emp => emp.biometricDeviceId && emp.biometricDeviceId === trimmedUid);
-            if (byBiometric) return byBiometric.id;
-            
-            // Try exact match with id field as fallback
-            const byId = allEmployees.find(emp => emp.id === trimmedUid);
-            if (byId) return byId.id;
-            
-            return null;
-          };
+    const validated = devicePunchUploadSchema.safeParse(req.body);
+    if (!validated.success) {
+      return res.status(400).json({ success: false, message: "Invalid punch data", errors: validated.error.errors });
+    }
 
-          let foundCount = 0;
-          let notFoundCount = 0;
-          
-          for (const log of logs) {
-            const uid = String(log.uid).trim();
-            const employeeDbId = findEmployeeIdLocal(uid);
-            if (!employeeDbId) {
-              notFoundCount++;
-              continue;
-            }
-            foundCount++;
+    const device = await db.select().from(biometricDevices).where(eq(biometricDevices.deviceId, deviceId)).limit(1);
+    if (device.length === 0) {
+      return res.status(404).json({ success: false, message: `Device ${deviceId} not found` });
+    }
 
-            const logDate = new Date(log.timestamp);
-            const dateKey = `${employeeDbId}-${logDate.toISOString().split('T')[0]}`;
-            
-            // Initialize or update attendance record
-            if (!attendanceMap.has(dateKey)) {
-              attendanceMap.set(dateKey, {
-                employeeId: employeeDbId,
-                date: new Date(logDate.getFullYear(), logDate.getMonth(), logDate.getDate()),
-                checkIn: log.timestamp,
-                checkOut: log.timestamp,
-                logs: [log]
-              });
-            } else {
-              const record = attendanceMap.get(dateKey)!;
-              record.logs.push(log);
-              // Update check-in/check-out times
-              if (log.timestamp < record.checkIn) record.checkIn = log.timestamp;
-              if (log.timestamp > record.checkOut) record.checkOut = log.timestamp;
-            }
-          }
+    const logs: AttendanceRecord[] = [];
+    const seen = new Set<string>();
+    for (const punch of validated.data.punches) {
+      const record = toUploadedPunch(punch.uid, punch.timestamp, punch.state, punch.type, seen);
+      if (record) logs.push(record);
+    }
 
-          // Prepare records for database insertion
-          const attendanceRecordsToInsert: (typeof attendance.$inferInsert)[] = [];
-          for (const [_, record] of attendanceMap) {
-            // Calculate working hours
-            const workingHours = ((record.checkOut.getTime() - record.checkIn.getTime()) / (1000 * 60 * 60)).toFixed(2);
-            
-            // Skip if check-in/check-out spans multiple days
-            if (record.checkIn.toDateString() !== record.checkOut.toDateString()) {
-              console.warn(`Skipping record for employee ${record.employeeId} - check-in and check-out are on different days`);
-              continue;
-            }
+    const processedRecords = await saveDeviceAttendanceLogs(deviceId, logs);
 
-            attendanceRecordsToInsert.push({
-              employeeId: record.employeeId,
-              date: record.date,
-              checkIn: record.checkIn,
-              checkOut: record.checkOut,
-              status: 'present',
-              workingHours: workingHours,
-              notes: '',
-              overtimeHours: null,
-            });
-          }
+    res.json({
+      success: true,
+      message: `Device ${deviceId} punches saved`,
+      rawRecords: logs.length,
+      processedRecords: processedRecords,
+      deviceId: deviceId
+    });
+  } catch (error) {
+    console.error(`Punch upload failed for device ${req.params.deviceId}:`, error);
+    res.status(500).json({ success: false, message: `Punch upload failed for device ${req.params.deviceId}` });
+  }
+});
 
-          // Insert or update attendance records
-          for (const record of attendanceRecordsToInsert) {
-            try {
-              await db.transaction(async (tx) => {
-                // First try to update existing record
-                const updated = await tx
-                  .update(attendance)
-                  .set({
-                    checkIn: record.checkIn,
-                    checkOut: record.checkOut,
-                    workingHours: record.workingHours,
-                    status: record.status,
-                    notes: record.notes,
-                  })
-                  .where(
-                    and(
-                      eq(attendance.employeeId, record.employeeId),
-                      eq(attendance.date, record.date)
-                    )
-                  );
-
-                // If no rows were updated, insert a new record
-                if (updated.rowCount === 0) {
-                  await tx.insert(attendance).values({
-                    employeeId: record.employeeId,
-                    date: record.date,
-                    checkIn: record.checkIn,
-                    checkOut: record.checkOut,
-                    status: record.status,
-                    workingHours: record.workingHours,
-                    notes: record.notes,
-                    overtimeHours: null,
-                  });
-                }
-              });
-              totalProcessed++;
-            } catch (error) {
-              console.error('Error upserting attendance record during full sync:', error);
-            }
-          }
-          
-          totalSynced += logs.length;
-          deviceResults[device.deviceId] = attendanceRecordsToInsert.length;
-          console.log(`FULL SYNC: Device ${device.deviceId} - ${logs.length} raw records, processed ${attendanceRecordsToInsert.length} attendance records`);
-        } else {
-          deviceResults[device.deviceId] = 0;
+// Bulk punch upload: many devices' punches in one request, one column per field.
+// Clients send it gzip-compressed (Content-Encoding: gzip), which express.json inflates.
+const bulkPunchUploadSchema = z.object({
+  format: z.literal("columnar-v1"),
+  devices: z.array(
+    z.object({
+      deviceId: z.string().min(1),
+      uid: z.array(z.union([z.string(), z.number()])),
+      timestamp: z.array(z.string()),
+      state: z.array(z.number()).optional(),
+      type: z.array(z.number()).optional(),
+    })
+  ),
+});
+
+router.post("/api/auto-sync/punches/bulk", async (req, res) => {
+  try {
+    const timer = new PhaseTimer();
+    timer.phase('validate');
+    const validated = bulkPunchUploadSchema.safeParse(req.body);
+    if (!validated.success) {
+      return res.status(400).json({ success: false, message: "Invalid bulk punch data", errors: validated.error.errors });
+    }
+
+    const batch = validated.data.devices;
+    const deviceIds = Array.from(new Set(batch.map(device => device.deviceId)));
+    const knownDevices = deviceIds.length > 0
+      ? await db.select({ deviceId: biometricDevices.deviceId }).from(biometricDevices).where(inArray(biometricDevices.deviceId, deviceIds))
+      : [];
+    const knownDeviceIds = new Set(knownDevices.map(device => device.deviceId));
+
+    // Punches from every device go through one pass, so an employee who checks
+    // in at one gate and out at another gets a single correct attendance row
+    const logs: AttendanceRecord[] = [];
+    const seen = new Set<string>();
+    const deviceResults: { [deviceId: string]: number } = {};
+    const unknownDevices: string[] = [];
+
+    for (const device of batch) {
+      if (!knownDeviceIds.has(device.deviceId)) {
+        unknownDevices.push(device.deviceId);
+        continue;
+      }
+      if (device.timestamp.length !== device.uid.length) {
+        return res.status(400).json({ success: false, message: `Column length mismatch for device ${device.deviceId}` });
+      }
+
+      let accepted = 0;
+      for (let i = 0; i < device.uid.length; i++) {
+        const record = toUploadedPunch(device.uid[i], device.timestamp[i], device.state?.[i], device.type?.[i], seen);
+        if (record) {
+          logs.push(record);
+          accepted++;
         }
-      } catch (error) {
-        console.error(`Full sync error for device ${device.deviceId}:`, error);
-        deviceResults[device.deviceId] = 0;
       }
+      deviceResults[device.deviceId] = (deviceResults[device.deviceId] || 0) + accepted;
     }
-    
-    autoSyncSettings.lastSync = new Date();
-    console.log(`FULL SYNC completed: ${totalSynced} raw records retrieved, ${totalProcessed} attendance records saved to database`);
-    
-    res.json({ 
-      success: true, 
-      message: "Full sync completed - all historical attendance data retrieved", 
-      totalRecordsRetrieved: totalSynced,
-      totalRecordsProcessed: totalProcessed,
+
+    if (unknownDevices.length > 0) {
+      console.warn(`Bulk punch upload skipped unknown devices: ${unknownDevices.join(', ')}`);
+    }
+
+    const processedRecords = await saveDeviceAttendanceLogs(`bulk batch (${Object.keys(deviceResults).length} devices)`, logs, timer);
+
+    res.setHeader("Server-Timing", timer.serverTiming());
+    res.json({
+      success: true,
+      message: `Bulk upload saved ${logs.length} punches`,
+      rawRecords: logs.length,
+      processedRecords,
       deviceResults,
-      lastSync: autoSyncSettings.lastSync 
+      unknownDevices,
+      timings: timer.result()
+    });
+  } catch (error) {
+    console.error("Bulk punch upload failed:", error);
+    res.status(500).json({ success: false, message: "Bulk punch upload failed" });
+  }
+});
+
+// Daily first-in/last-out rows recomputed by the sync tool from its raw punch
+// archive ("reprocess"), one column per field, gzip-compressed like the bulk
+// punch upload. Dates are the device's local calendar days.
+const bulkDailyRecordsSchema = z.object({
+  format: z.literal("daily-v1"),
+  uid: z.array(z.union([z.string(), z.number()])),
+  date: z.array(z.string().regex(/^\d{4}-\d{2}-\d{2}$/)),
+  checkIn: z.array(z.string()),
+  checkOut: z.array(z.string()),
+});
+
+router.post("/api/auto-sync/daily-records/bulk", async (req, res) => {
+  try {
+    const validated = bulkDailyRecordsSchema.safeParse(req.body);
+    if (!validated.success) {
+      return res.status(400).json({ success: false, message: "Invalid daily record data", errors: validated.error.errors });
+    }
+    const { uid, date, checkIn, checkOut } = validated.data;
+    if (date.length !== uid.length || checkIn.length !== uid.length || checkOut.length !== uid.length) {
+      return res.status(400).json({ success: false, message: "Column length mismatch" });
+    }
+
+    const employeeLookup = await employeeResolver.lookup();
+    const records: (typeof attendance.$inferInsert)[] = [];
+    const unmappedUids = new Set<string>();
+    for (let i = 0; i < uid.length; i++) {
+      const employeeDbId = employeeLookup.resolve(uid[i]);
+      if (!employeeDbId) {
+        unmappedUids.add(String(uid[i]).trim());
+        continue;
+      }
+      const recordCheckIn = new Date(checkIn[i]);
+      const recordCheckOut = new Date(checkOut[i]);
+      if (isNaN(recordCheckIn.getTime()) || isNaN(recordCheckOut.getTime())) {
+        return res.status(400).json({ success: false, message: `Invalid timestamps for UID ${uid[i]} on ${date[i]}` });
+      }
+      records.push({
+        employeeId: employeeDbId,
+        date: attendanceDay(date[i]),
+        checkIn: recordCheckIn,
+        checkOut: recordCheckOut,
+        status: 'present',
+        notes: '',
+        overtimeHours: null,
+      });
+    }
+
+    const processedRecords = await upsertAttendanceRecords(records);
+    res.json({
+      success: true,
+      message: `Saved ${processedRecords} daily records`,
+      processedRecords,
+      unmappedUids: Array.from(unmappedUids),
+    });
+  } catch (error) {
+    console.error("Bulk daily record upload failed:", error);
+    res.status(500).json({ success: false, message: "Bulk daily record upload failed" });
+  }
+});
+
+// Full historical sync runs as a background job so large devices cannot time
+// the request out. Starting again after an interruption resumes from the last
+// per-device checkpoint; pass { "restart": true } to start over.
+router.post("/api/auto-sync/full-sync", async (req, res) => {
+  try {
+    const restart = req.body?.restart === true;
+    const { job, resumed, alreadyRunning } = await fullSyncRunner.start(restart, () => {
+      autoSyncSettings.lastSync = new Date();
+    });
+
+    res.status(202).json({
+      success: true,
+      message: alreadyRunning
+        ? `Full sync job ${job.id} is already running`
+        : resumed
+          ? `Full sync job ${job.id} resumed from its last checkpoint`
+          : `Full sync job ${job.id} started`,
+      jobId: job.id,
+      resumed,
+      alreadyRunning,
     });
   } catch (error) {
     console.error("Full sync failed:", error);
@@ -2752,6 +2787,23 @@ router.post("/api/auto-sync/full-sync", async (req, res) => {
   }
 });
 
+router.get("/api/auto-sync/full-sync/status", async (req, res) => {
+  try {
+    const jobId = typeof req.query.jobId === 'string' ? parseInt(req.query.jobId, 10) : undefined;
+    if (jobId !== undefined && isNaN(jobId)) {
+      return res.status(400).json({ success: false, message: "Invalid jobId" });
+    }
+    const status = await fullSyncRunner.status(jobId);
+    if (!status) {
+      return res.status(404).json({ success: false, message: "No full sync job found" });
+    }
+    res.json({ success: true, ...status });
+  } catch (error) {
+    console.error("Failed to read full sync status:", error);
+    res.status(500).json({ success: false, message: "Failed to read full sync status" });
+  }
+});
+
 router.get("/api/auto-sync/status", (req, res) => {
   res.json({
     enabled: autoSyncSettings.enabled,
@@ -2761,6 +2813,55 @@ router.get("/api/auto-sync/status", (req, res) => {
   });
 });
 
+// UID resolution counters; unmappedUids lists the device users with no employee record
+router.get("/api/auto-sync/resolver-stats", (req, res) => {
+  res.json(employeeResolver.stats());
+});
+
+// --- Sharded sync workers ---
+// Several sync tool instances split the devices between them. Each worker
+// heartbeats here and syncs only the devices it was leased; a worker that stops
+// heartbeating loses its leases when they expire.
+const syncWorkerHeartbeatSchema = z.object({
+  workerId: z.string().min(1).max(100),
+  hostname: z.string().max(255).optional(),
+  leaseSeconds: z.number().int().min(15).max(3600).default(90),
+});
+
+router.post("/api/sync-workers/heartbeat", async (req, res) => {
+  try {
+    const validated = syncWorkerHeartbeatSchema.safeParse(req.body);
+    if (!validated.success) {
+      return res.status(400).json({ success: false, message: "Invalid heartbeat", errors: validated.error.errors });
+    }
+    const { workerId, hostname, leaseSeconds } = validated.data;
+    const leases = await deviceLeaseManager.heartbeat(workerId, hostname ?? null, leaseSeconds);
+    res.json({ success: true, ...leases });
+  } catch (error) {
+    console.error("Sync worker heartbeat failed:", error);
+    res.status(500).json({ success: false, message: "Sync worker heartbeat failed" });
+  }
+});
+
+router.delete("/api/sync-workers/:workerId", async (req, res) => {
+  try {
+    const released = await deviceLeaseManager.release(req.params.workerId);
+    res.json({ success: true, message: `Released ${released} device leases`, released });
+  } catch (error) {
+    console.error("Failed to release sync worker leases:", error);
+    res.status(500).json({ success: false, message: "Failed to release sync worker leases" });
+  }
+});
+
+router.get("/api/sync-workers", async (req, res) => {
+  try {
+    res.json({ success: true, ...(await deviceLeaseManager.status()) });
+  } catch (error) {
+    console.error("Failed to read sync workers:", error);
+    res.status(500).json({ success: false, message: "Failed to read sync workers" });
+  }
+});
+
 router.post("/api/employees/:id/photo", upload.single("file"), async (req, res) => {
   try {
     const id = req.params.id; // Already a string, no need to parse
@@ -3303,6 +3404,11 @@ router.post('/api/group-working-hours', (req, res) => {
     
     const updatedSettings = updateGroupWorkingHours(newSettings);
     console.log('Successfully saved group working hours:', JSON.stringify(updatedSettings, null, 2));
+
+    // Late, half-day and OT flags in the report summaries depend on these settings
+    attendanceAggregates.rebuild().catch(error => {
+      console.error('Error rebuilding attendance summaries:', error);
+    });
     
     res.json({ 
       message: 'Group working hours saved successfully',
@@ -3426,16 +3532,17 @@ router.get('/api/reports/employees', async (req, res) => {
 router.get('/api/reports/late-arrival', async (req, res) => {
   try {
     const { startDate, endDate, employeeId, group } = req.query;
-    const { getGroupWorkingHours } = await import('./hrSettings.js');
-    const groupSettings = getGroupWorkingHours();
+    await attendanceAggregates.ready();
 
+    // Late and half-day flags are precomputed per day in the daily summary
     const conditions: any[] = [
-      gte(attendance.date, new Date(startDate as string)),
-      lte(attendance.date, new Date(endDate as string))
+      gte(attendanceDailySummary.date, new Date(startDate as string)),
+      lte(attendanceDailySummary.date, new Date(endDate as string)),
+      eq(attendanceDailySummary.isLate, true)
     ];
 
     if (employeeId && employeeId !== 'all') {
-      conditions.push(eq(attendance.employeeId, employeeId as string));
+      conditions.push(eq(attendanceDailySummary.employeeId, employeeId as string));
     }
 
     if (group && group !== 'all') {
@@ -3447,66 +3554,34 @@ router.get('/api/reports/late-arrival', async (req, res) => {
         employeeId: employees.employeeId,
         fullName: employees.fullName,
         employeeGroup: employees.employeeGroup,
-        date: attendance.date,
-        checkIn: attendance.checkIn,
-        status: attendance.status
+        date: attendanceDailySummary.date,
+        checkIn: attendanceDailySummary.checkIn,
+        isHalfDay: attendanceDailySummary.isHalfDay,
+        minutesLate: attendanceDailySummary.minutesLate
       })
-      .from(attendance)
-      .innerJoin(employees, eq(attendance.employeeId, employees.id))
+      .from(attendanceDailySummary)
+      .innerJoin(employees, eq(attendanceDailySummary.employeeId, employees.id))
       .where(and(...conditions))
-      .orderBy(desc(attendance.date));
-
-    const reportData = lateArrivals.map(record => {
-      const group = record.employeeGroup;
-      const groupPolicy = group === 'group_a' ? groupSettings.groupA : groupSettings.groupB;
-      const gracePeriod = groupPolicy.lateArrivalPolicy.gracePeriodUntil;
-      const halfDayAfter = groupPolicy.lateArrivalPolicy.halfDayAfter;
-
-      let minutesLate = 0;
-      let status = 'present';
-
-      if (record.checkIn) {
-        const checkInTime = new Date(record.checkIn);
-        const graceTime = new Date(record.checkIn);
-        const [graceHour, graceMinute] = gracePeriod.split(':');
-        graceTime.setHours(parseInt(graceHour), parseInt(graceMinute), 0);
-
-        const halfDayTime = new Date(record.checkIn);
-        const [halfHour, halfMinute] = halfDayAfter.split(':');
-        halfDayTime.setHours(parseInt(halfHour), parseInt(halfMinute), 0);
-
-        if (checkInTime > graceTime) {
-          minutesLate = Math.floor((checkInTime.getTime() - graceTime.getTime()) / (1000 * 60));
-          
-          if (checkInTime > halfDayTime) {
-            status = 'half_day';
-          } else {
-            status = 'late';
-          }
-        }
+      .orderBy(desc(attendanceDailySummary.date));
+
+    const reportData = lateArrivals.map(({ isHalfDay, minutesLate, ...record }) => {
+      // Format minutes late to show hours and minutes if above 59 minutes
+      let formattedLateTime = '';
+      if (minutesLate > 59) {
+        const hours = Math.floor(minutesLate / 60);
+        const minutes = minutesLate % 60;
+        formattedLateTime = `${hours} hr ${minutes} min`;
+      } else {
+        formattedLateTime = `${minutesLate} min`;
       }
 
-      // Only include records that are actually late or half day
-      if (status === 'late' || status === 'half_day') {
-        // Format minutes late to show hours and minutes if above 59 minutes
-        let formattedLateTime = '';
-        if (minutesLate > 59) {
-          const hours = Math.floor(minutesLate / 60);
-          const minutes = minutesLate % 60;
-          formattedLateTime = `${hours} hr ${minutes} min`;
-        } else {
-          formattedLateTime = `${minutesLate} min`;
-        }
-
-        return {
-          ...record,
-          checkInTime: record.checkIn ? new Date(record.checkIn).toLocaleTimeString() : null,
-          status,
-          minutesLate: formattedLateTime // Now returns formatted string instead of raw number
-        };
-      }
-      return null;
-    }).filter(Boolean);
+      return {
+        ...record,
+        checkInTime: record.checkIn ? new Date(record.checkIn).toLocaleTimeString() : null,
+        status: isHalfDay ? 'half_day' : 'late',
+        minutesLate: formattedLateTime // Now returns formatted string instead of raw number
+      };
+    });
 
     res.json(reportData);
   } catch (error) {
@@ -3894,8 +3969,6 @@ router.get('/api/reports/individual-offer-attendance', async (req, res) => {
 router.get('/api/reports/offer-attendance', async (req, res) => {
   try {
     const { startDate, endDate, employeeId, group } = req.query;
-    const { getGroupWorkingHours } = await import('./hrSettings.js');
-    const groupSettings = getGroupWorkingHours();
 
     const conditions: any[] = [
       gte(attendance.date, new Date(startDate as string)),
@@ -3912,6 +3985,7 @@ router.get('/api/reports/offer-attendance', async (req, res) => {
 
     const attendanceRecords = await db
       .select({
+        employeeDbId: attendance.employeeId,
         employeeId: employees.employeeId,
         fullName: employees.fullName,
         employeeGroup: employees.employeeGroup,
@@ -3928,6 +4002,13 @@ router.get('/api/reports/offer-attendance', async (req, res) => {
       .where(and(...conditions))
       .orderBy(employees.employeeId, attendance.date);
 
+    // Offer hours and the weekend/holiday calendar come from the batch calculator,
+    // so this report follows the HR settings and the holidays table
+    const employeeDbIds = Array.from(new Set(attendanceRecords.map(record => record.employeeDbId)));
+    const batch = await attendanceCalculator.calculateRange(
+      new Date(startDate as string), new Date(endDate as string), employeeDbIds);
+    const rowOf = batchRowLookup(batch);
+
     // Group data by employee
     const employeeData = new Map();
 
@@ -3960,48 +4041,18 @@ router.get('/api/reports/offer-attendance', async (req, res) => {
       const dayOfWeek = date.getDay(); // 0 = Sunday, 1 = Monday, etc.
       const dayNames = ['sunday', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday'];
       
-      // Group-specific overtime calculation start times
-      const group = record.employeeGroup;
-      const overtimeStartTime = group === 'group_a' ? '16:15' : '16:45';
-      
       let offerHours = 0;
+      const row = rowOf(record.employeeDbId, record.date);
       
-      if (record.checkOut && record.checkIn) {
-        const checkOutTime = new Date(record.checkOut);
-        const checkInTime = new Date(record.checkIn);
-        
-        // Calculate overtime hours starting from the specified time
-        const [overtimeHour, overtimeMinute] = overtimeStartTime.split(':');
-        const overtimeStart = new Date(date);
-        overtimeStart.setHours(parseInt(overtimeHour), parseInt(overtimeMinute), 0);
-        
-        // If checkout is after the overtime start time, calculate offer hours
-        if (checkOutTime > overtimeStart) {
-          const overtimeMs = checkOutTime.getTime() - overtimeStart.getTime();
-          const rawOfferHours = Math.max(0, overtimeMs / (1000 * 60 * 60)); // Convert to hours
-          
-          // Round down to the nearest 15-minute block (1 hr, 1 hr 15 mins, 1 hr 30 mins, 1 hr 45 mins, etc.)
-          const totalMinutes = Math.floor(rawOfferHours * 60);
-          const roundedMinutes = Math.floor(totalMinutes / 15) * 15;
-          offerHours = roundedMinutes / 60;
-        }
-        
-        // Include government holidays and Saturdays (assuming Saturday is day 6)
-        const isWeekend = dayOfWeek === 6 || dayOfWeek === 0; // Saturday or Sunday
-        const isHoliday = isGovernmentHoliday(date); // You would implement this function
+      if (record.checkOut && record.checkIn && row >= 0) {
+        // Round down to the nearest 15-minute block (1 hr, 1 hr 15 mins, 1 hr 30 mins, 1 hr 45 mins, etc.)
+        const totalMinutes = Math.floor(Math.max(0, batch.offerHours[row]) * 60);
+        offerHours = Math.floor(totalMinutes / 15) * 15 / 60;
         
+        // On weekends and holidays all working hours are offer hours
+        const isWeekend = (batch.flags[row] & BATCH_FLAG_WEEKEND) !== 0;
+        const isHoliday = (batch.flags[row] & BATCH_FLAG_HOLIDAY) !== 0;
         if (isWeekend || isHoliday) {
-          // On weekends and holidays, count all working hours as offer hours
-          const workingMs = checkOutTime.getTime() - checkInTime.getTime();
-          const rawWorkingHours = workingMs / (1000 * 60 * 60);
-          
-          // Round down to the nearest 15-minute block for weekend/holiday hours
-          const totalMinutes = Math.floor(rawWorkingHours * 60);
-          const roundedMinutes = Math.floor(totalMinutes / 15) * 15;
-          const roundedWorkingHours = roundedMinutes / 60;
-          
-          offerHours = Math.max(offerHours, roundedWorkingHours);
-          
           if (dayOfWeek === 6) { // Saturday
             employee.saturdayHours += offerHours;
           } else if (isHoliday) {
@@ -4176,15 +4227,17 @@ router.get("/api/reports/individual-monthly", async (req, res) => {
 
     const emp = employee[0];
 
-    // Get attendance records for the employee
+    // Get the employee's daily attendance summaries (late/half-day already evaluated)
+    await attendanceAggregates.ready();
     const attendanceRecords = await db.select()
-      .from(attendance)
+      .from(attendanceDailySummary)
       .where(and(
-        eq(attendance.employeeId, emp.id),
-        gte(attendance.date, startOfPeriod),
-        lte(attendance.date, endOfPeriod)
+        eq(attendanceDailySummary.employeeId, emp.id),
+        gte(attendanceDailySummary.date, startOfPeriod),
+        lte(attendanceDailySummary.date, endOfPeriod)
       ))
-      .orderBy(attendance.date);
+      .orderBy(attendanceDailySummary.date);
+    const attendanceByDay = new Map(attendanceRecords.map(record => [new Date(record.date).toDateString(), record]));
 
     // Get leave requests for the period
     const leaveRecords = await db.select()
@@ -4205,10 +4258,7 @@ router.get("/api/reports/individual-monthly", async (req, res) => {
       const formattedDate = currentDate.toLocaleDateString('en-GB');
       
       // Check if employee has attendance record
-      const attendanceRecord = attendanceRecords.find(record => {
-        const recordDate = new Date(record.date);
-        return recordDate.toDateString() === currentDate.toDateString();
-      });
+      const attendanceRecord = attendanceByDay.get(currentDate.toDateString());
 
       // Check if employee is on leave
       const onLeave = leaveRecords.some(leave => {
@@ -4234,19 +4284,10 @@ router.get("/api/reports/individual-monthly", async (req, res) => {
         
         if (attendanceRecord.checkIn) {
           inTime = attendanceRecord.checkIn.toTimeString().slice(0, 5); // HH:MM format
-          
-          // Check if late based on group policy
-          const inTimeHour = attendanceRecord.checkIn.getHours();
-          const inTimeMinute = attendanceRecord.checkIn.getMinutes();
-          const isGroupA = emp.employeeGroup === 'group_a';
-          const lateThreshold = isGroupA ? 9 * 60 : 8 * 60 + 15; // 9:00 AM for Group A, 8:15 AM for Group B
-          const halfDayThreshold = isGroupA ? 10 * 60 : 9 * 60 + 30; // 10:00 AM for Group A, 9:30 AM for Group B
-          
-          const inTimeTotalMinutes = inTimeHour * 60 + inTimeMinute;
-          if (inTimeTotalMinutes > lateThreshold) {
-            isLate = true;
-          }
-          if (inTimeTotalMinutes > halfDayThreshold) {
+
+          // Late and half day against the group's grace period and half-day cut-off
+          isLate = attendanceRecord.isLate;
+          if (attendanceRecord.isHalfDay) {
             isHalfDay = true;
             status = 'Half Day';
           }
@@ -4257,9 +4298,8 @@ router.get("/api/reports/individual-monthly", async (req, res) => {
           
           // Calculate total hours
           if (attendanceRecord.checkIn) {
-            const diffMs = attendanceRecord.checkOut.getTime() - attendanceRecord.checkIn.getTime();
-            const diffHrs = diffMs / (1000 * 60 * 60);
-            totalHours = diffHrs.toFixed(2);
+            const diffHrs = parseFloat(attendanceRecord.workingHours);
+            totalHours = attendanceRecord.workingHours;
             
             // Check for short leave
             const expectedHours = emp.employeeGroup === 'group_a' ? 7.75 : 8.75;
@@ -4330,16 +4370,8 @@ router.get("/api/reports/monthly-absence", async (req, res) => {
     // Get departments for display
     const departmentList = await db.select().from(departments);
 
-    // Get all attendance records for the period
-    const attendanceRecords = await db.select({
-      employeeId: attendance.employeeId,
-      date: attendance.date,
-    })
-      .from(attendance)
-      .where(and(
-        gte(attendance.date, startOfPeriod),
-        lte(attendance.date, endOfPeriod)
-      ));
+    // Days present per employee for the period, from the attendance summaries
+    const presentDaysByEmployee = await attendanceAggregates.presentDays(startOfPeriod, endOfPeriod);
 
     // Get approved leave records for the period
     const leaveRecords = await db.select({
@@ -4371,7 +4403,7 @@ router.get("/api/reports/monthly-absence", async (req, res) => {
       const department = departmentList.find(dept => dept.id === emp.departmentId);
       
       // Count present days
-      const presentDays = attendanceRecords.filter(record => record.employeeId === emp.id).length;
+      const presentDays = presentDaysByEmployee.get(emp.id) ?? 0;
       
       // Count leave days that fall within the period and on working days
       let leaveDays = 0;
@@ -4418,21 +4450,61 @@ router.get("/api/reports/monthly-absence", async (req, res) => {
   }
 });
 
-// Helper function to check if a date is a government holiday
-function isGovernmentHoliday(date: Date): boolean {
-  // This would typically check against a database of government holidays
-  // For now, we'll use some common Sri Lankan holidays as examples
-  const holidays = [
-    '2025-01-01', // New Year's Day
-    '2025-02-04', // Independence Day
-    '2025-05-01', // May Day
-    '2025-12-25', // Christmas Day
-    // Add more holidays as needed
-  ];
-  
-  const dateString = date.toISOString().split('T')[0];
-  return holidays.includes(dateString);
-}
+// --- Monthly Summary Route ---
+// Per-employee month totals straight from the maintained monthly summary
+router.get("/api/reports/monthly-summary", async (req, res) => {
+  try {
+    const { month, group } = z.object({
+      month: z.string().regex(/^\d{4}-\d{2}$/, "month must be YYYY-MM"),
+      group: z.string().optional(),
+    }).parse(req.query);
+
+    const [year, monthIndex] = month.split('-').map(Number);
+    const conditions: any[] = [eq(attendanceMonthlySummary.month, new Date(year, monthIndex - 1, 1))];
+    if (group && group !== "all") {
+      conditions.push(eq(employees.employeeGroup, group as any));
+    }
+
+    await attendanceAggregates.ready();
+    const summaries = await db.select({
+      employeeId: employees.employeeId,
+      fullName: employees.fullName,
+      employeeGroup: employees.employeeGroup,
+      presentDays: attendanceMonthlySummary.presentDays,
+      weekdayPresentDays: attendanceMonthlySummary.weekdayPresentDays,
+      lateDays: attendanceMonthlySummary.lateDays,
+      halfDays: attendanceMonthlySummary.halfDays,
+      workingHours: attendanceMonthlySummary.workingHours,
+      overtimeHours: attendanceMonthlySummary.overtimeHours,
+    })
+      .from(attendanceMonthlySummary)
+      .innerJoin(employees, eq(attendanceMonthlySummary.employeeId, employees.id))
+      .where(and(...conditions))
+      .orderBy(employees.employeeId);
+
+    res.json(summaries);
+  } catch (error) {
+    if (error instanceof z.ZodError) {
+      return res.status(400).json({ message: "Invalid query", details: error.errors });
+    }
+    console.error("Failed to fetch monthly summary:", error);
+    res.status(500).json({ message: "Failed to fetch monthly summary" });
+  }
+});
+
+// Recompute the daily and monthly summaries from attendance
+router.post("/api/reports/summaries/rebuild", async (req, res) => {
+  try {
+    await attendanceAggregates.rebuild();
+    res.json({ success: true, message: "Attendance summaries rebuilt" });
+  } catch (error) {
+    console.error("Failed to rebuild attendance summaries:", error);
+    res.status(500).json({
+      success: false,
+      message: error instanceof Error ? error.message : "Failed to rebuild attendance summaries"
+    });
+  }
+});
 
 // Initialize auto-sync on server startup
 setTimeout(() => {
@@ -4443,6 +4515,11 @@ setTimeout(() => {
   startAutoSync();
 }, 3000); // Start after 3 seconds to allow server to fully initialize
 
+// Build the report summaries if this database has attendance they don't cover yet
+attendanceAggregates.rebuildIfStale().catch(error => {
+  console.error('Error checking attendance summaries:', error);
+});
+
 export default router;
 
 export function registerRoutes(app: any) {
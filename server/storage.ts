@@ -22,6 +22,7 @@ import {
   type InsertLeaveType
 } from "@shared/schema";
 import { db } from "./db";
+import { attendanceAggregates } from "./attendanceAggregates";
 import { eq, desc, and, gte, lte, sql, count, sum } from "drizzle-orm";
 
 export interface IStorage {
@@ -160,6 +161,7 @@ export class DatabaseStorage implements IStorage {
       .insert(attendance)
       .values(attendanceData)
       .returning();
+    await attendanceAggregates.refresh([newAttendance]);
     return newAttendance;
   }
 
@@ -169,6 +171,9 @@ export class DatabaseStorage implements IStorage {
       .set(attendanceData)
       .where(eq(attendance.id, id))
       .returning();
+    if (updatedAttendance) {
+      await attendanceAggregates.refresh([updatedAttendance]);
+    }
     return updatedAttendance;
   }
 
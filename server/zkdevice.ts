@@ -77,7 +77,7 @@ export class ZKDeviceManager {
     }
   }
 
-  async getAttendanceLogs(deviceId: string, fullSync: boolean = false): Promise<AttendanceRecord[]> {
+  async getAttendanceLogs(deviceId: string, fullSync: boolean = false, since?: Date): Promise<AttendanceRecord[]> {
     const device = this.devices.get(deviceId);
     if (!device) {
       throw new Error(`Device ${deviceId} not connected`);
@@ -120,10 +120,17 @@ export class ZKDeviceManager {
       }
 
       const validRecords: AttendanceRecord[] = [];
+      let alreadySynced = 0;
       for (const log of logs) {
         if (log) {
           // Skip entries with invalid year 2000 timestamps - these are usually empty/corrupted logs
           const timestamp = new Date(log.recordTime);
+          if (since && !isNaN(timestamp.getTime()) && timestamp < since) {
+            // Already ingested by a previous incremental sync. The watermark's own second is
+            // read again: timestamps have 1s resolution, so a punch there may be new.
+            alreadySynced++;
+            continue;
+          }
           if (!isNaN(timestamp.getTime()) && timestamp.getFullYear() >= 2020) {
             // Try multiple possible UID field names
             const uid = log.uid || log.deviceUserId || log.userId || log.id || log.userSn || log.user_id || log.employeeId;
@@ -162,6 +169,9 @@ export class ZKDeviceManager {
         }
       }
       
+      if (since) {
+        console.log(`Skipped ${alreadySynced} logs before ${since.toISOString()} for device ${deviceId}.`);
+      }
       console.log(`Successfully processed ${validRecords.length} valid records out of ${logs.length} total logs.`);
       return validRecords;
     } catch (error) {
@@ -202,9 +212,9 @@ export class ZKDeviceManager {
     }
   }
 
-  async syncAttendanceData(deviceId: string, fullSync: boolean = false): Promise<AttendanceRecord[]> {
+  async syncAttendanceData(deviceId: string, fullSync: boolean = false, since?: Date): Promise<AttendanceRecord[]> {
     try {
-      const logs = await this.getAttendanceLogs(deviceId, fullSync);
+      const logs = await this.getAttendanceLogs(deviceId, fullSync, since);
       console.log(`Retrieved ${logs.length} attendance records from device ${deviceId}${fullSync ? ' (FULL SYNC)' : ''}`);
       return logs;
     } catch (error) {
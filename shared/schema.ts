@@ -52,6 +52,46 @@ export const attendance = pgTable("attendance", {
   }
 });
 
+// Report-ready summaries of `attendance`, maintained by server/attendanceAggregates.ts
+// whenever attendance is written, so month-end reports don't rescan raw rows.
+export const attendanceDailySummary = pgTable("attendance_daily_summary", {
+  id: serial("id").primaryKey(),
+  employeeId: varchar("employee_id", { length: 50 }).references(() => employees.id).notNull(),
+  date: timestamp("date").notNull(),
+  employeeGroup: employeeGroupEnum("employee_group").notNull(),
+  status: attendanceStatusEnum("status").notNull(),
+  checkIn: timestamp("check_in"),
+  checkOut: timestamp("check_out"),
+  workingHours: decimal("working_hours", { precision: 5, scale: 2 }).default("0").notNull(),
+  overtimeHours: decimal("overtime_hours", { precision: 5, scale: 2 }).default("0").notNull(),
+  isWeekend: boolean("is_weekend").default(false).notNull(),
+  isLate: boolean("is_late").default(false).notNull(),
+  isHalfDay: boolean("is_half_day").default(false).notNull(),
+  minutesLate: integer("minutes_late").default(0).notNull(),
+  updatedAt: timestamp("updated_at").defaultNow().notNull(),
+}, (table) => {
+  return {
+    employeeDateIdx: uniqueIndex("attendance_daily_summary_employee_date_idx").on(table.employeeId, table.date),
+  }
+});
+
+export const attendanceMonthlySummary = pgTable("attendance_monthly_summary", {
+  id: serial("id").primaryKey(),
+  employeeId: varchar("employee_id", { length: 50 }).references(() => employees.id).notNull(),
+  month: timestamp("month").notNull(), // first day of the month
+  presentDays: integer("present_days").default(0).notNull(),
+  weekdayPresentDays: integer("weekday_present_days").default(0).notNull(),
+  lateDays: integer("late_days").default(0).notNull(),
+  halfDays: integer("half_days").default(0).notNull(),
+  workingHours: decimal("working_hours", { precision: 7, scale: 2 }).default("0").notNull(),
+  overtimeHours: decimal("overtime_hours", { precision: 7, scale: 2 }).default("0").notNull(),
+  updatedAt: timestamp("updated_at").defaultNow().notNull(),
+}, (table) => {
+  return {
+    employeeMonthIdx: uniqueIndex("attendance_monthly_summary_employee_month_idx").on(table.employeeId, table.month),
+  }
+});
+
 export const leaveRequests = pgTable("leave_requests", {
   id: serial("id").primaryKey(),
   employeeId: varchar("employee_id", { length: 50 }).references(() => employees.id).notNull(),
@@ -128,6 +168,52 @@ export const shortLeaveRequests = pgTable("short_leave_requests", {
   createdAt: timestamp("created_at").defaultNow().notNull(),
 });
 
+// Full historical sync runs as a background job; the per-device rows are its
+// checkpoints, so a run interrupted by a restart resumes where it stopped.
+export const fullSyncJobs = pgTable("full_sync_jobs", {
+  id: serial("id").primaryKey(),
+  status: varchar("status", { length: 20 }).default("running").notNull(), // 'running', 'completed', 'failed'
+  totalDevices: integer("total_devices").default(0).notNull(),
+  error: text("error"),
+  startedAt: timestamp("started_at").defaultNow().notNull(),
+  finishedAt: timestamp("finished_at"),
+});
+
+export const fullSyncDeviceProgress = pgTable("full_sync_device_progress", {
+  id: serial("id").primaryKey(),
+  jobId: integer("job_id").references(() => fullSyncJobs.id).notNull(),
+  deviceId: varchar("device_id", { length: 50 }).notNull(),
+  status: varchar("status", { length: 20 }).default("pending").notNull(), // 'pending', 'running', 'done', 'failed'
+  totalPunches: integer("total_punches"),
+  processedPunches: integer("processed_punches").default(0).notNull(),
+  attendanceRecords: integer("attendance_records").default(0).notNull(),
+  lastTimestamp: timestamp("last_timestamp"),
+  error: text("error"),
+  updatedAt: timestamp("updated_at").defaultNow().notNull(),
+}, (table) => {
+  return {
+    jobDeviceIdx: uniqueIndex("full_sync_job_device_idx").on(table.jobId, table.deviceId),
+  }
+});
+
+// Sync tool instances that split the devices between them. Each device is
+// leased to one worker at a time; a lease that is not renewed expires, so the
+// devices of a worker that dies move to the others.
+export const syncWorkers = pgTable("sync_workers", {
+  workerId: varchar("worker_id", { length: 100 }).primaryKey(),
+  hostname: varchar("hostname", { length: 255 }),
+  leaseSeconds: integer("lease_seconds").notNull(),
+  startedAt: timestamp("started_at").defaultNow().notNull(),
+  lastSeen: timestamp("last_seen").defaultNow().notNull(),
+});
+
+export const syncDeviceLeases = pgTable("sync_device_leases", {
+  deviceId: varchar("device_id", { length: 50 }).primaryKey(),
+  workerId: varchar("worker_id", { length: 100 }).notNull(),
+  expiresAt: timestamp("expires_at").notNull(),
+  acquiredAt: timestamp("acquired_at").defaultNow().notNull(),
+});
+
 // Adding Group Working Hours settings
 export interface GroupWorkingHours {
   groupA: {
@@ -322,3 +408,9 @@ export type ShortLeaveRequest = typeof shortLeaveRequests.$inferSelect;
 export type InsertShortLeaveRequest = z.infer<typeof insertShortLeaveRequestSchema>;
 export type LeaveType = typeof leaveTypes.$inferSelect;
 export type InsertLeaveType = z.infer<typeof insertLeaveTypeSchema>;
+export type AttendanceDailySummary = typeof attendanceDailySummary.$inferSelect;
+export type AttendanceMonthlySummary = typeof attendanceMonthlySummary.$inferSelect;
+export type FullSyncJob = typeof fullSyncJobs.$inferSelect;
+export type FullSyncDeviceProgress = typeof fullSyncDeviceProgress.$inferSelect;
+export type SyncWorker = typeof syncWorkers.$inferSelect;
+export type SyncDeviceLease = typeof syncDeviceLeases.$inferSelect;